@@ -6,7 +6,10 @@ from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 
 from .. import crud, schemas
+from .. import metrics
+from ..cache import batch_invalidation, bump_generation, get_cache_stats
 from ..database import get_db
+from ..warming import warm_plan_caches
 from .comprehensive_plans import COMPREHENSIVE_PLANS
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -22,9 +25,9 @@ def delete_all_plans(db: Session = Depends(get_db)):
     Use with caution - this will wipe all plan data!
     """
     try:
-        from ..models import Plan
-        deleted_count = db.query(Plan).delete()
+        deleted_count = crud.delete_plans(db)
         db.commit()
+        bump_generation("plans")
 
         return {
             "status": "success",
@@ -46,12 +49,14 @@ def delete_fake_commercial_plans(db: Session = Depends(get_db)):
         from ..models import Plan
 
         # Delete fake commercial plans (those with "verify" or "Typical" markers)
-        deleted_count = db.query(Plan).filter(
+        deleted_count = crud.delete_plans(
+            db,
             Plan.service_type == "Commercial",
             (Plan.special_features.like("%verify%") | Plan.special_features.like("%Typical%"))
-        ).delete(synchronize_session=False)
+        )
 
         db.commit()
+        bump_generation("plans")
 
         # Count remaining commercial plans
         remaining = db.query(Plan).filter(Plan.service_type == "Commercial").count()
@@ -68,28 +73,23 @@ def delete_fake_commercial_plans(db: Session = Depends(get_db)):
 
 
 @router.post("/load-real-data")
+@batch_invalidation()
 def load_real_data(plans_data: List[Dict[str, Any]] = Body(...), db: Session = Depends(get_db)):
     """
     Load REAL scraped plan data into the database.
     Accepts a JSON array of plan objects.
     """
     try:
-        added = 0
-        updated = 0
-
+        provider_ids = crud.ProviderResolver(db).resolve(
+            (plan_data["provider_name"] for plan_data in plans_data),
+            websites={plan_data["provider_name"]: plan_data["provider_website"]
+                      for plan_data in plans_data if plan_data.get("provider_website")},
+        )
+        plan_creates = []
         for plan_data in plans_data:
-            # Get or create provider
-            provider = crud.get_provider_by_name(db, plan_data["provider_name"])
-            if not provider:
-                provider_create = schemas.ProviderCreate(
-                    name=plan_data["provider_name"],
-                    website=plan_data.get("provider_website")
-                )
-                provider = crud.create_provider(db, provider_create)
-
             # Create plan
             plan_create = schemas.PlanCreate(
-                provider_id=provider.id,
+                provider_id=provider_ids[plan_data["provider_name"]],
                 plan_name=plan_data["plan_name"],
                 plan_type=plan_data.get("plan_type", "Fixed"),
                 service_type=plan_data.get("service_type", "Residential"),  # Default to Residential if missing
@@ -105,33 +105,51 @@ def load_real_data(plans_data: List[Dict[str, Any]] = Body(...), db: Session = D
                 renewable_percent=plan_data.get("renewable_percent", 0.0),
                 special_features=plan_data.get("special_features", "")
             )
+            plan_creates.append(plan_create)
 
-            # Check if exists
-            from ..models import Plan
-            existing = db.query(Plan).filter(
-                Plan.provider_id == provider.id,
-                Plan.plan_name == plan_create.plan_name
-            ).first()
-
-            if existing:
-                updated += 1
-            else:
-                added += 1
+        counts = crud.bulk_upsert_plans(db, plan_creates)
 
-            crud.create_or_update_plan(db, provider.id, plan_create)
+        warm_plan_caches(db)
 
         return {
             "status": "success",
             "message": "REAL data loaded successfully",
-            "added": added,
-            "updated": updated,
-            "total": added + updated
+            "added": counts["inserted"],
+            "updated": counts["updated"],
+            "unchanged": counts["unchanged"],
+            "total": sum(counts.values())
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache/stats")
+def cache_stats():
+    """
+    Cache metrics per key prefix.
+    Hits, misses, stale serves, errors, bytes, compression and get/set latency.
+    """
+    return {
+        "status": "success",
+        "stats": get_cache_stats()
+    }
+
+
+@router.get("/metrics")
+def read_metrics():
+    """
+    All application metrics for this worker process.
+    Counters and latency histograms grouped by subsystem.
+    """
+    snapshot = metrics.snapshot()
+    snapshot["cache"] = get_cache_stats()
+    return {
+        "status": "success",
+        "metrics": snapshot
+    }
+
+
 @router.post("/run-migrations")
 def run_migrations_manually(db: Session = Depends(get_db)):
     """
@@ -152,6 +170,7 @@ def run_migrations_manually(db: Session = Depends(get_db)):
 
 
 @router.post("/load-tdus")
+@batch_invalidation()
 def load_tdu_data(db: Session = Depends(get_db)):
     """
     Load TDU data into the database.
@@ -179,28 +198,23 @@ def load_tdu_data(db: Session = Depends(get_db)):
 
 
 @router.post("/load-initial-data")
+@batch_invalidation()
 def load_initial_data(db: Session = Depends(get_db)):
     """
     Load initial sample data into the database.
     This endpoint is for initial setup and testing.
     """
     try:
-        added = 0
-        updated = 0
-
+        provider_ids = crud.ProviderResolver(db).resolve(
+            (plan_data["provider_name"] for plan_data in SAMPLE_PLANS),
+            websites={plan_data["provider_name"]: plan_data["provider_website"]
+                      for plan_data in SAMPLE_PLANS if plan_data.get("provider_website")},
+        )
+        plan_creates = []
         for plan_data in SAMPLE_PLANS:
-            # Get or create provider
-            provider = crud.get_provider_by_name(db, plan_data["provider_name"])
-            if not provider:
-                provider_create = schemas.ProviderCreate(
-                    name=plan_data["provider_name"],
-                    website=plan_data.get("provider_website")
-                )
-                provider = crud.create_provider(db, provider_create)
-
             # Create plan
             plan_create = schemas.PlanCreate(
-                provider_id=provider.id,
+                provider_id=provider_ids[plan_data["provider_name"]],
                 plan_name=plan_data["plan_name"],
                 plan_type=plan_data.get("plan_type", "Fixed"),
                 service_type=plan_data.get("service_type", "Residential"),  # Default to Residential if missing
@@ -216,26 +230,16 @@ def load_initial_data(db: Session = Depends(get_db)):
                 renewable_percent=plan_data.get("renewable_percent", 0.0),
                 special_features=plan_data.get("special_features", "")
             )
+            plan_creates.append(plan_create)
 
-            # Check if exists
-            from ..models import Plan
-            existing = db.query(Plan).filter(
-                Plan.provider_id == provider.id,
-                Plan.plan_name == plan_create.plan_name
-            ).first()
-
-            if existing:
-                updated += 1
-            else:
-                added += 1
-
-            crud.create_or_update_plan(db, provider.id, plan_create)
+        counts = crud.bulk_upsert_plans(db, plan_creates)
 
         return {
             "status": "success",
-            "added": added,
-            "updated": updated,
-            "total": added + updated
+            "added": counts["inserted"],
+            "updated": counts["updated"],
+            "unchanged": counts["unchanged"],
+            "total": sum(counts.values())
         }
 
     except Exception as e:
@@ -3,30 +3,79 @@ FastAPI router for plan and provider endpoints.
 
 This router exposes endpoints to list providers, list plans with optional
 filters, retrieve details of a single plan, and trigger a data scrape.
+
+The read endpoints are ``async def`` on an ``AsyncSession`` (see
+``crud_async``), so concurrent reads wait on the connection pool rather than
+the threadpool.  Writes stay sync.
 """
 from __future__ import annotations
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date, datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .. import crud, models, schemas
-from ..database import get_db
+from .. import crud, crud_async, models, schemas
+from ..database import get_async_db, get_db
 from ..scraping import scraper
 from ..auth import verify_api_key
-from ..cache import cache_result
+from ..cache import batch_invalidation
+from ..http_cache import cached_page, cached_page_async, check_conditional, dump_json_list, json_response
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from ..warming import plan_query_tracker, warm_plan_caches
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/plans", tags=["plans"])
 
 
+def _parse_cursor(cursor: str | None, size: int) -> tuple | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/providers", response_model=list[schemas.Provider])
-def read_providers(db: Session = Depends(get_db), skip: int = 0, limit: int = 100):
-    return crud.get_providers(db, skip=skip, limit=limit)
+async def read_providers(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = Query(None, description=f"Cursor from the {NEXT_CURSOR_HEADER} header; replaces skip"),
+    include_plans: bool = Query(True, description="Embed each provider's plans; false returns only a plan_count"),
+):
+    """
+    List providers by id.
+
+    With include_plans=false each provider carries a plan_count instead of
+    its plans (see schemas.ProviderSummary), which is much smaller.
+    """
+    after = _parse_cursor(cursor, 1)
+    not_modified = check_conditional(request, response, await crud_async.get_plans_version(db))
+    if not_modified is not None:
+        return not_modified
+    after_id = after[0] if after else None
+    if not include_plans:
+        summaries = await crud_async.get_provider_summaries(db, skip=skip, limit=limit, after_id=after_id)
+        if summaries and len(summaries) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(summaries[-1]["id"])
+        return json_response(response, dump_json_list(schemas.ProviderSummary, summaries))
+
+    providers = await crud_async.get_providers(db, skip=skip, limit=limit, after_id=after_id)
+    if providers and len(providers) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(providers[-1].id)
+    return json_response(response, dump_json_list(schemas.Provider, providers))
 
 
 @router.get("/", response_model=list[schemas.Plan])
-def read_plans(
+async def read_plans(
+    request: Request,
+    response: Response,
     provider: str | None = Query(None, description="Filter by provider name"),
     plan_type: str | None = Query(None, description="Filter by plan type"),
     service_type: str | None = Query(None, description="Filter by service type (Residential/Commercial)"),
@@ -34,20 +83,147 @@ def read_plans(
     contract_months: int | None = Query(None, description="Filter by contract term in months"),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: str | None = Query(None, description=f"Cursor from the {NEXT_CURSOR_HEADER} header; replaces skip"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return crud.get_plans(db, provider=provider, plan_type=plan_type, service_type=service_type, zip_code=zip_code, contract_months=contract_months, skip=skip, limit=limit)
+    """
+    List plans, cheapest first (rate at 1000 kWh, then id).
+
+    For paging, follow the cursor in the X-Next-Cursor response header
+    (absent on the last page). Cursor pages stay stable while new data is
+    being written; skip/limit still works as a fallback.
+    """
+    after = _parse_cursor(cursor, 2)
+    version = await crud_async.get_plans_version(db)
+    not_modified = check_conditional(request, response, version)
+    if not_modified is not None:
+        return not_modified
+
+    if provider is None and skip == 0 and limit == 100 and after is None:
+        plan_query_tracker.record(
+            service_type=service_type, zip_code=zip_code, contract_months=contract_months, plan_type=plan_type
+        )
+    body, next_cursor = await render_plans_page_async(
+        db, version, provider=provider, plan_type=plan_type, service_type=service_type,
+        zip_code=zip_code, contract_months=contract_months, skip=skip, limit=limit, after=after,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return json_response(response, body)
+
+
+def render_plans(
+    db: Session,
+    version: dict,
+    provider: str | None = None,
+    plan_type: str | None = None,
+    service_type: str | None = None,
+    zip_code: str | None = None,
+    contract_months: int | None = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> bytes:
+    """Encoded JSON body of a /plans/ listing, cached per dataset version."""
+    return render_plans_page(
+        db, version, provider=provider, plan_type=plan_type, service_type=service_type,
+        zip_code=zip_code, contract_months=contract_months, skip=skip, limit=limit,
+    )[0]
+
+
+def render_plans_page(db: Session, version: dict, after: tuple | None = None, **filters) -> tuple[bytes, str | None]:
+    """
+    Encoded JSON body of a /plans/ listing and the cursor of the next page.
+
+    ``filters`` are the ``crud.get_plans`` filters plus skip and limit.
+    """
+    params = {"skip": 0, "limit": 100, **filters, "after": after}
+
+    def build() -> tuple[bytes, str | None]:
+        plans = crud.get_plans(db, **params)
+        return dump_json_list(schemas.Plan, plans), _next_plans_cursor(plans, params["limit"])
+
+    return cached_page("plans", version, params, build)
+
+
+async def render_plans_page_async(
+    db: AsyncSession, version: dict, after: tuple | None = None, **filters
+) -> tuple[bytes, str | None]:
+    """``render_plans_page`` for async endpoints; the cached bodies are shared."""
+    params = {"skip": 0, "limit": 100, **filters, "after": after}
+
+    async def build() -> tuple[bytes, str | None]:
+        plans = await crud_async.get_plans(db, **params)
+        return dump_json_list(schemas.Plan, plans), _next_plans_cursor(plans, params["limit"])
+
+    return await cached_page_async("plans", version, params, build)
+
+
+def _next_plans_cursor(plans: list, limit: int) -> str | None:
+    if plans and len(plans) == limit:
+        return encode_cursor(plans[-1].rate_1000_cents, plans[-1].id)
+    return None
+
+
+@router.get("/history", response_model=list[schemas.MarketHistoryDay])
+async def read_market_history(
+    request: Request,
+    response: Response,
+    start: date = Query(..., description="First day (YYYY-MM-DD)"),
+    end: date = Query(..., description="Last day, inclusive (YYYY-MM-DD)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Market-wide price history: for each day in [start, end], the number of
+    plan price changes observed and their min/avg/max rate at 1000 kWh.
+
+    At most crud.MARKET_HISTORY_MAX_DAYS days per request.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= crud.MARKET_HISTORY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {crud.MARKET_HISTORY_MAX_DAYS} days per request")
+    not_modified = check_conditional(request, response, await crud_async.get_plans_version(db))
+    if not_modified is not None:
+        return not_modified
+    return await crud_async.get_market_history(db, start=start, end=end)
+
+
+@router.get("/{plan_id}/history", response_model=list[schemas.PlanRateSnapshot])
+async def read_plan_history(
+    plan_id: int,
+    request: Request,
+    response: Response,
+    start: datetime | None = Query(None, description="Only snapshots observed at or after this time"),
+    end: datetime | None = Query(None, description="Only snapshots observed before this time"),
+    limit: int = Query(1000, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    A plan's price history, oldest first: one snapshot when the plan was
+    first seen and one for every change to its rates or fees.
+    """
+    if await crud_async.get_plan(db, plan_id=plan_id) is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    not_modified = check_conditional(request, response, await crud_async.get_plans_version(db))
+    if not_modified is not None:
+        return not_modified
+    return await crud_async.get_plan_history(db, plan_id, start=start, end=end, limit=limit)
 
 
 @router.get("/{plan_id}", response_model=schemas.Plan)
-def read_plan(plan_id: int, db: Session = Depends(get_db)):
-    db_plan = crud.get_plan(db, plan_id=plan_id)
+async def read_plan(plan_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    # Look the plan up first: "If-None-Match: *" must not match a plan that does not exist
+    db_plan = await crud_async.get_plan(db, plan_id=plan_id)
     if db_plan is None:
         raise HTTPException(status_code=404, detail="Plan not found")
+    not_modified = check_conditional(request, response, await crud_async.get_plans_version(db))
+    if not_modified is not None:
+        return not_modified
     return db_plan
 
 
 @router.post("/scrape")
+@batch_invalidation()
 def scrape_data(
     source: str = Query("legacy", description="Scrape source: 'legacy', 'powertochoose', 'energybot', or 'commercial'"),
     service_type: str = Query("Residential", description="Service type: 'Residential' or 'Commercial'"),
@@ -69,7 +245,9 @@ def scrape_data(
     - Commercial: Commercial/business electricity plans
 
     ALL DATA IS REAL - NO SAMPLE DATA, NO FALLBACKS.
-    Returns the number of plans processed. Rate limited to prevent abuse.
+    Returns the number of plans processed, split into changed (inserted +
+    updated) and unchanged. Plans whose content hash matches the stored one
+    are not written. Rate limited to prevent abuse.
     """
     from ..scraping import powertochoose_scraper, energybot_scraper_v2
 
@@ -91,21 +269,23 @@ def scrape_data(
         logger.info("Using legacy scrapers for residential plans")
         plans = scraper.scrape_all()
 
-    created_or_updated = 0
-    # Insert provider and plan entries
+    # Resolve all providers at once, then write all plans in one bulk upsert
+    provider_ids = crud.ProviderResolver(db).resolve(plan["provider_name"] for plan in plans)
+    plan_creates = []
     for plan in plans:
         provider_name = plan.pop("provider_name")
-        provider = crud.get_provider_by_name(db, provider_name)
-        if not provider:
-            logger.debug(f"Creating new provider: {provider_name}")
-            provider = crud.create_provider(db, schemas.ProviderCreate(name=provider_name))
-        plan_create = schemas.PlanCreate(provider_id=provider.id, **plan)
-        crud.create_or_update_plan(db, provider.id, plan_create)
-        created_or_updated += 1
+        plan_creates.append(schemas.PlanCreate(provider_id=provider_ids[provider_name], **plan))
 
-    logger.info(f"Scrape completed - {created_or_updated} plans processed from {source}")
+    counts = crud.bulk_upsert_plans(db, plan_creates)
+    logger.info(
+        f"Scrape completed - {len(plan_creates)} plans processed from {source}: "
+        f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+    warm_plan_caches(db)
 
     return {
-        "plans_processed": created_or_updated,
+        "plans_processed": len(plan_creates),
+        "changed": counts["inserted"] + counts["updated"],
+        **counts,
         "source": source
     }
\ No newline at end of file
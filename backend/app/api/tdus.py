@@ -2,24 +2,35 @@
 TDU (Transmission and Distribution Utility) API endpoints.
 
 This module provides endpoints for retrieving information about Texas TDUs,
-including service areas, delivery charges, and cost calculations.
+including service areas, delivery charges, and cost calculations.  The
+database reads are ``async def`` on an ``AsyncSession`` (see ``crud_async``).
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud, schemas
-from ..database import get_db
+from .. import crud_async, schemas
+from ..cache import CACHE_NEGATIVE_TTL, cache_result
+from ..database import get_async_db
+from ..http_cache import cached_json_response_async, check_conditional, dump_json_list
 from ..tdu_data import TDU_SUMMARY, calculate_tdu_cost, get_tdu_by_city
 
 router = APIRouter(prefix="/tdus", tags=["tdus"])
 
 
+@cache_result(ttl=86400, key_prefix="tdu_by_city", namespaces=("tdus",), negative_ttl=CACHE_NEGATIVE_TTL)
+def _lookup_tdu_by_city(city: str) -> Optional[dict]:
+    """Cached ``get_tdu_by_city``; ``city`` must already be lowercased."""
+    return get_tdu_by_city(city)
+
+
 @router.get("/", response_model=List[schemas.TDU])
-def list_tdus(
+async def list_tdus(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=500, description="Maximum number of records to return"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get all Texas TDUs.
@@ -30,9 +41,19 @@ def list_tdus(
     - Number of customers served
     - Monthly delivery charges
     - Per-kWh delivery rates
+
+    Supports conditional requests: send the ETag back in If-None-Match to
+    get a 304 when the TDU data has not changed.
     """
-    tdus = crud.get_tdus(db, skip=skip, limit=limit)
-    return tdus
+    version = await crud_async.get_tdus_version(db)
+    not_modified = check_conditional(request, response, version)
+    if not_modified is not None:
+        return not_modified
+
+    async def build() -> bytes:
+        return dump_json_list(schemas.TDU, await crud_async.get_tdus(db, skip=skip, limit=limit))
+
+    return await cached_json_response_async(response, "tdus", version, {"skip": skip, "limit": limit}, build)
 
 
 @router.get("/summary")
@@ -47,21 +68,21 @@ def get_tdu_summary():
 
 
 @router.get("/{tdu_id}", response_model=schemas.TDU)
-def get_tdu(tdu_id: int, db: Session = Depends(get_db)):
+async def get_tdu(tdu_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific TDU by ID.
 
     Returns detailed information about a single TDU, including
     service area, delivery charges, and contact information.
     """
-    tdu = crud.get_tdu(db, tdu_id)
+    tdu = await crud_async.get_tdu(db, tdu_id)
     if not tdu:
         raise HTTPException(status_code=404, detail="TDU not found")
     return tdu
 
 
 @router.get("/by-name/{name}", response_model=schemas.TDU)
-def get_tdu_by_name(name: str, db: Session = Depends(get_db)):
+async def get_tdu_by_name(name: str, db: AsyncSession = Depends(get_async_db)):
     """
     Get a TDU by name.
 
@@ -70,7 +91,7 @@ def get_tdu_by_name(name: str, db: Session = Depends(get_db)):
     - /tdus/by-name/CenterPoint
     - /tdus/by-name/AEP%20Texas%20Central
     """
-    tdu = crud.get_tdu_by_name(db, name)
+    tdu = await crud_async.get_tdu_by_name(db, name)
     if not tdu:
         raise HTTPException(status_code=404, detail=f"TDU '{name}' not found")
     return tdu
@@ -89,7 +110,7 @@ def find_tdu_by_city(city: str):
     Note: This uses static data. For real-time lookups, use the official
     Power to Choose website or contact your local TDU.
     """
-    tdu = get_tdu_by_city(city)
+    tdu = _lookup_tdu_by_city(city.strip().lower())
     if not tdu:
         return {
             "error": f"Could not find TDU for city '{city}'",
@@ -2,13 +2,37 @@
 Redis caching layer for improved performance.
 
 Caches expensive operations like scraping and complex queries.
+
+Values are stored as compact binary records.  ORM rows (plans, providers,
+TDUs) are flattened to column lists on write and rebuilt as the matching
+pydantic schema objects on a hit, without touching the database or running
+validation.  orjson is used when installed, with the standard json module
+as a fallback.
 """
 from __future__ import annotations
 
+import hashlib
+import inspect
 import json
+import logging
 import os
-from typing import Optional, Any
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, Any, Iterable
 from functools import wraps
+from urllib.parse import quote
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 try:
     import redis
@@ -16,132 +40,1131 @@ try:
 except ImportError:
     REDIS_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 # Redis configuration
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_URL = os.getenv("REDIS_URL")  # e.g. redis://:password@host:6379/0, overrides host/port/db
+REDIS_ENABLED = os.getenv("REDIS_ENABLED", "true").lower() == "true"
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))  # Per worker process
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 1.0))  # Wait for a free pooled connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_RETRY_INTERVAL = float(os.getenv("REDIS_RETRY_INTERVAL", 30))  # Back-off after a connection failure
 CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))  # 1 hour default
+CACHE_KEY_MAX_LENGTH = int(os.getenv("CACHE_KEY_MAX_LENGTH", 200))  # Longer keys are hashed
 
-# Initialize Redis client if available
-if REDIS_AVAILABLE:
-    try:
-        redis_client = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            db=REDIS_DB,
-            decode_responses=True,
-            socket_connect_timeout=2
-        )
-        redis_client.ping()
-        print("[Cache] Redis connected successfully")
-    except (redis.ConnectionError, redis.TimeoutError):
-        redis_client = None
-        print("[Cache] Redis not available, using in-memory fallback")
-else:
-    redis_client = None
-    print("[Cache] Redis module not installed, caching disabled")
-
-# Fallback in-memory cache
-_memory_cache: dict[str, tuple[Any, float]] = {}
+# In-process L1 cache budget.  When Redis is available, L1 entries live at
+# most CACHE_L1_TTL seconds so workers pick up changes written by others.
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", 1024))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 64 * 1024 * 1024))  # 64 MB
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", 30))
 
+# How long a worker reuses a namespace generation read from Redis before
+# checking again.  Bumps made by this worker are visible immediately.
+CACHE_GENERATION_TTL = float(os.getenv("CACHE_GENERATION_TTL", 1.0))
 
-def get_cache(key: str) -> Optional[Any]:
-    """Get value from cache."""
-    if redis_client:
+# Single-flight: how long concurrent callers wait for the one caller that is
+# recomputing a missing key, and how often other workers poll for its result.
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 10.0))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv("CACHE_LOCK_POLL_INTERVAL", 0.05))
+
+# Negative caching: how long a "not found" result is remembered
+CACHE_NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", 60))
+
+# Stale-while-revalidate: background refreshes run on this many threads
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", 2))
+
+# Values at least this large are compressed before going to Redis.
+# CACHE_COMPRESSION is "zstd" (if installed), "zlib" or "none".
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zstd" if ZSTD_AVAILABLE else "zlib").lower()
+if CACHE_COMPRESSION == "zstd" and not ZSTD_AVAILABLE:
+    CACHE_COMPRESSION = "zlib"
+
+# Parameters that carry per-request state (database sessions) and must never
+# become part of a cache key.
+SESSION_PARAM_NAMES = frozenset({"db", "session"})
+
+# ---------------------------------------------------------------------------
+# Redis connection
+# ---------------------------------------------------------------------------
+# The client is created on first use from a bounded, health-checked
+# connection pool.  If Redis cannot be reached, the cache runs on the local
+# tier alone and tries to reconnect after REDIS_RETRY_INTERVAL seconds.
+redis_client = None
+_redis_pool = None
+_redis_retry_at = 0.0
+_redis_lock = threading.Lock()
+
+if not REDIS_AVAILABLE:
+    logger.info("[Cache] Redis module not installed, using in-memory cache only")
+
+
+def _create_redis_pool():
+    options = dict(
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    if REDIS_URL:
+        return redis.BlockingConnectionPool.from_url(REDIS_URL, **options)
+    return redis.BlockingConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, **options)
+
+
+def get_redis():
+    """Return the shared Redis client, connecting lazily; None while unavailable."""
+    global redis_client, _redis_pool, _redis_retry_at
+    client = redis_client
+    if client is not None:
+        return client
+    if not (REDIS_AVAILABLE and REDIS_ENABLED) or time.time() < _redis_retry_at:
+        return None
+
+    with _redis_lock:
+        if redis_client is not None:
+            return redis_client
+        if time.time() < _redis_retry_at:
+            return None
+        pool = _create_redis_pool()
+        client = redis.Redis(connection_pool=pool)
         try:
-            value = redis_client.get(key)
-            return json.loads(value) if value else None
-        except Exception as e:
-            print(f"[Cache] Redis get error: {e}")
+            client.ping()
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            pool.disconnect()
+            _redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+            logger.info(f"[Cache] Redis not available ({e}), using in-memory cache")
+            return None
+        _redis_pool, redis_client = pool, client
+        logger.info("[Cache] Redis connected")
+        return client
+
+
+def _redis_error(e: Exception, action: str) -> None:
+    """Log a Redis failure; on connection loss fall back to the local tier."""
+    global redis_client, _redis_pool, _redis_retry_at
+    logger.warning(f"[Cache] Redis {action} error: {e}")
+    if REDIS_AVAILABLE and isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+        with _redis_lock:
+            pool, redis_client, _redis_pool = _redis_pool, None, None
+            _redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+        if pool is not None:
+            pool.disconnect()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache of encoded values.
+
+    Bounded by entry count and total bytes.  When over budget, expired
+    entries are dropped first, then the least recently used ones.
+    """
+
+    def __init__(self, max_entries: int = CACHE_L1_MAX_ENTRIES, max_bytes: int = CACHE_L1_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes, ttl: float) -> bool:
+        if len(data) > self.max_bytes or ttl <= 0:
+            return False
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (data, time.time() + ttl)
+            self._bytes += len(data)
+            if len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [key for key, (_, expires_at) in self._data.items() if expires_at <= now]:
+            self._remove(key)
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            key, (data, _) = self._data.popitem(last=False)
+            self._bytes -= len(data)
+
+
+# L1: in-process cache in front of Redis (and the only tier without Redis)
+local_cache = LRUCache()
+
+
+# Counters and latency histograms per key prefix ("plans", "tdus", "http:plans", ...)
+cache_metrics = metrics.group("cache")
+
+
+def key_prefix_of(key: str) -> str:
+    """Return the prefix of a cache key, without generations or arguments."""
+    parts = key.split(":")
+    prefix = parts[0].split("@")[0]
+    if prefix == "http" and len(parts) > 1:
+        prefix = f"http:{parts[1]}"
+    return prefix
+
+
+def _count(prefix: str, event: str, amount: float = 1) -> None:
+    cache_metrics.inc(prefix, event, amount)
+
+
+def get_cache_stats() -> dict[str, dict]:
+    """
+    Return cache metrics per key prefix.
+
+    Counters: hits (l1_hits, redis_hits), misses, stale_serves, refreshes,
+    refresh_errors, errors, bytes_read, bytes_written and compression
+    (compressed_values, uncompressed/compressed bytes, CPU seconds).
+    Histograms: get_seconds and set_seconds.  Hit ratio and compression
+    ratio are derived.
+    """
+    stats = cache_metrics.snapshot()
+    for entry in stats.values():
+        lookups = entry.get("hits", 0) + entry.get("misses", 0)
+        if lookups:
+            entry["hit_ratio"] = round(entry.get("hits", 0) / lookups, 4)
+        if entry.get("compressed_bytes"):
+            entry["compression_ratio"] = round(entry["uncompressed_bytes"] / entry["compressed_bytes"], 2)
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Codecs
+# ---------------------------------------------------------------------------
+# Every stored value starts with a one-byte format marker:
+#   J  plain JSON document (dicts, lists, numbers, strings)
+#   R  ORM rows flattened to records: {"t": type, "c": columns, "r": rows, "one": bool}
+#   B  raw bytes, stored as-is
+#   S  stale-while-revalidate envelope: 8-byte fresh-until timestamp + inner value
+#   N  negative entry: the cached call returned None
+# Values stored in Redis may additionally be wrapped by compression:
+#   z  zlib-compressed value
+#   Z  zstd-compressed value
+FORMAT_JSON = b"J"
+FORMAT_ROWS = b"R"
+FORMAT_BYTES = b"B"
+FORMAT_SWR = b"S"
+FORMAT_MISSING = b"N"
+FORMAT_ZLIB = b"z"
+FORMAT_ZSTD = b"Z"
+_SWR_HEADER = struct.Struct(">d")
+
+
+def _dumps(obj: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class RowCodec:
+    """
+    Flattens ORM rows of one model into column lists and rebuilds them as
+    schema objects with ``model_construct`` (no validation).
+
+    ``nested`` maps a relationship field to the codec name used for its rows.
+    """
+
+    def __init__(self, name: str, model, schema, nested: Optional[dict[str, str]] = None):
+        self.name = name
+        self.model = model
+        self.schema = schema
+        self.nested = nested or {}
+        self.fields = list(schema.model_fields)
+        self.datetime_fields = {
+            field for field, info in schema.model_fields.items() if info.annotation is datetime
+        }
+
+    def encode_row(self, row: Any) -> list:
+        record = []
+        for field in self.fields:
+            value = getattr(row, field)
+            if field in self.nested:
+                codec = _row_codecs()[self.nested[field]]
+                value = [codec.encode_row(item) for item in value or []]
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            record.append(value)
+        return record
+
+    def decode_row(self, record: list) -> Any:
+        values = dict(zip(self.fields, record))
+        for field in self.datetime_fields:
+            if values.get(field) is not None:
+                values[field] = datetime.fromisoformat(values[field])
+        for field, codec_name in self.nested.items():
+            codec = _row_codecs()[codec_name]
+            values[field] = [codec.decode_row(item) for item in values[field] or []]
+        return self.schema.model_construct(**values)
+
+
+_ROW_CODECS: dict[str, RowCodec] = {}
+
+
+def _row_codecs() -> dict[str, RowCodec]:
+    """Build the row codec registry on first use (avoids import cycles)."""
+    if not _ROW_CODECS:
+        from . import models, schemas
+
+        _ROW_CODECS.update({
+            "Plan": RowCodec("Plan", models.Plan, schemas.Plan),
+            "Provider": RowCodec("Provider", models.Provider, schemas.Provider, nested={"plans": "Plan"}),
+            "PlanRateSnapshot": RowCodec("PlanRateSnapshot", models.PlanRateSnapshot, schemas.PlanRateSnapshot),
+            "TDU": RowCodec("TDU", models.TDU, schemas.TDU),
+        })
+    return _ROW_CODECS
+
+
+def _codec_for(value: Any) -> Optional[RowCodec]:
+    for codec in _row_codecs().values():
+        if isinstance(value, (codec.model, codec.schema)):
+            return codec
+    return None
+
+
+def encode_value(value: Any) -> bytes:
+    """Encode a cacheable value to bytes (see the format markers above)."""
+    if isinstance(value, (bytes, bytearray)):
+        return FORMAT_BYTES + bytes(value)
+
+    rows = value if isinstance(value, (list, tuple)) else [value]
+    codec = _codec_for(rows[0]) if rows else None
+    if codec is not None:
+        document = {
+            "t": codec.name,
+            "c": codec.fields,
+            "r": [codec.encode_row(row) for row in rows],
+            "one": not isinstance(value, (list, tuple)),
+        }
+        return FORMAT_ROWS + _dumps(document)
+
+    return FORMAT_JSON + _dumps(value)
+
+
+def wrap_fresh_until(data: bytes, fresh_until: float) -> bytes:
+    """Wrap an encoded value in a stale-while-revalidate envelope."""
+    return FORMAT_SWR + _SWR_HEADER.pack(fresh_until) + data
+
+
+def fresh_until(data: bytes) -> Optional[float]:
+    """Return the soft expiry of an enveloped value, or None if it has none."""
+    if data[:1] != FORMAT_SWR:
+        return None
+    return _SWR_HEADER.unpack_from(data, 1)[0]
+
+
+def decode_value(data: bytes) -> Any:
+    """Decode bytes produced by ``encode_value``."""
+    if data[:1] == FORMAT_SWR:
+        data = data[1 + _SWR_HEADER.size:]
+    marker, payload = data[:1], data[1:]
+    if marker == FORMAT_BYTES:
+        return payload
+    if marker == FORMAT_ROWS:
+        document = _loads(payload)
+        codec = _row_codecs()[document["t"]]
+        if document["c"] != codec.fields:
+            # Written by a different schema version; treat as a miss
             return None
+        rows = [codec.decode_row(record) for record in document["r"]]
+        return rows[0] if document["one"] else rows
+    if marker == FORMAT_JSON:
+        return _loads(payload)
+    # Unknown or legacy format
+    return None
+
+
+def compress_value(key: str, data: bytes) -> bytes:
+    """Compress an encoded value if it is large enough to be worth it."""
+    if CACHE_COMPRESSION == "none" or len(data) < CACHE_COMPRESS_MIN_BYTES:
+        return data
+    start = time.perf_counter()
+    if CACHE_COMPRESSION == "zstd":
+        compressed = FORMAT_ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
     else:
-        # Use in-memory fallback
-        import time
-        if key in _memory_cache:
-            value, expires_at = _memory_cache[key]
-            if time.time() < expires_at:
-                return value
-            else:
-                del _memory_cache[key]
+        compressed = FORMAT_ZLIB + zlib.compress(data, 6)
+    prefix = key_prefix_of(key)
+    _count(prefix, "compress_seconds", time.perf_counter() - start)
+    if len(compressed) >= len(data):
+        return data
+    _count(prefix, "compressed_values")
+    _count(prefix, "uncompressed_bytes", len(data))
+    _count(prefix, "compressed_bytes", len(compressed))
+    return compressed
+
+
+def decompress_value(key: str, data: bytes) -> bytes:
+    """Undo ``compress_value``; uncompressed values pass through unchanged."""
+    marker = data[:1]
+    if marker not in (FORMAT_ZLIB, FORMAT_ZSTD):
+        return data
+    start = time.perf_counter()
+    if marker == FORMAT_ZSTD:
+        data = zstandard.ZstdDecompressor().decompress(data[1:])
+    else:
+        data = zlib.decompress(data[1:])
+    _count(key_prefix_of(key), "decompress_seconds", time.perf_counter() - start)
+    return data
+
+
+def _l1_ttl(ttl: float) -> float:
+    """L1 lifetime for an entry: capped while Redis is the shared tier."""
+    return min(ttl, CACHE_L1_TTL) if redis_client is not None else ttl
+
+
+def get_cache(key: str) -> Optional[Any]:
+    """Get value from cache (L1 first, then Redis with promotion to L1)."""
+    data = _fetch(key)
+    return decode_value(data) if data is not None else None
+
+
+def _fetch(key: str) -> Optional[bytes]:
+    """Return the encoded bytes stored under a key, if any."""
+    prefix = key_prefix_of(key)
+    start = time.perf_counter()
+    data = _fetch_local(key, prefix)
+    client = get_redis() if data is None else None
+    if client:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            data, pttl = pipe.execute()
+            if data:
+                data = decompress_value(key, data)
+        except Exception as e:
+            _count(prefix, "errors")
+            _redis_error(e, "get")
+            data = None
+        else:
+            _promote(key, prefix, data, pttl)
+    return _record_fetch(prefix, data, start)
+
+
+# The I/O-free steps of a fetch, shared with app.cache_async
+def _fetch_local(key: str, prefix: str) -> Optional[bytes]:
+    data = local_cache.get(key)
+    if data is not None:
+        _count(prefix, "l1_hits")
+    return data
+
+
+def _promote(key: str, prefix: str, data: Optional[bytes], pttl: Optional[int]) -> None:
+    """Count a Redis hit and copy it to L1 for the rest of its lifetime (capped)."""
+    if data:
+        _count(prefix, "redis_hits")
+        if pttl and pttl > 0:
+            local_cache.set(key, data, min(pttl / 1000, CACHE_L1_TTL))
+
+
+def _record_fetch(prefix: str, data: Optional[bytes], start: float) -> Optional[bytes]:
+    cache_metrics.observe(prefix, "get_seconds", time.perf_counter() - start)
+    if data is None:
+        _count(prefix, "misses")
+        return None
+    _count(prefix, "hits")
+    _count(prefix, "bytes_read", len(data))
+    return data
+
+
+def _encode_or_none(key: str, value: Any) -> Optional[bytes]:
+    try:
+        return encode_value(value)
+    except (TypeError, ValueError) as e:
+        _count(key_prefix_of(key), "errors")
+        logger.warning(f"[Cache] Cannot encode value for {key}: {e}")
         return None
 
 
 def set_cache(key: str, value: Any, ttl: int = CACHE_TTL) -> bool:
     """Set value in cache with TTL."""
-    if redis_client:
+    data = _encode_or_none(key, value)
+    if data is None:
+        return False
+    return _store(key, data, ttl)
+
+
+def _store(key: str, data: bytes, ttl: int) -> bool:
+    """Write already encoded bytes to both tiers."""
+    prefix = key_prefix_of(key)
+    start = time.perf_counter()
+    stored = True
+    client = get_redis()
+    local_cache.set(key, data, _l1_ttl(ttl))
+    if client:
         try:
-            redis_client.setex(key, ttl, json.dumps(value))
-            return True
+            client.setex(key, ttl, compress_value(key, data))
         except Exception as e:
-            print(f"[Cache] Redis set error: {e}")
-            return False
-    else:
-        # Use in-memory fallback
-        import time
-        _memory_cache[key] = (value, time.time() + ttl)
-        return True
+            _count(prefix, "errors")
+            _redis_error(e, "set")
+            stored = False
+    _record_store(prefix, data, start)
+    return stored
+
+
+def _record_store(prefix: str, data: bytes, start: float) -> None:
+    cache_metrics.observe(prefix, "set_seconds", time.perf_counter() - start)
+    _count(prefix, "bytes_written", len(data))
 
 
 def delete_cache(key: str) -> bool:
     """Delete value from cache."""
-    if redis_client:
+    local_cache.delete(key)
+    client = get_redis()
+    if client:
         try:
-            redis_client.delete(key)
-            return True
+            client.delete(key)
         except Exception as e:
-            print(f"[Cache] Redis delete error: {e}")
+            _redis_error(e, "delete")
             return False
-    else:
-        if key in _memory_cache:
-            del _memory_cache[key]
-        return True
+    return True
 
 
 def clear_cache() -> bool:
     """Clear all cache."""
-    if redis_client:
+    local_cache.clear()
+    client = get_redis()
+    if client:
         try:
-            redis_client.flushdb()
-            return True
+            client.flushdb()
         except Exception as e:
-            print(f"[Cache] Redis flush error: {e}")
+            _redis_error(e, "flush")
             return False
-    else:
-        _memory_cache.clear()
+    return True
+
+
+def get_many(keys: Iterable[str]) -> dict[str, Any]:
+    """
+    Get several values at once; missing keys are left out of the result.
+
+    L1 is checked first, the rest is fetched from Redis in one pipelined
+    round trip and promoted to L1.
+    """
+    keys = list(dict.fromkeys(keys))
+    found: dict[str, bytes] = {}
+    missing = []
+    for key in keys:
+        data = local_cache.get(key)
+        if data is not None:
+            found[key] = data
+        else:
+            missing.append(key)
+
+    client = get_redis() if missing else None
+    if client:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in missing:
+                pipe.get(key)
+                pipe.pttl(key)
+            replies = pipe.execute()
+        except Exception as e:
+            _redis_error(e, "get_many")
+            replies = []
+        for key, data, pttl in zip(missing, replies[::2], replies[1::2]):
+            if data:
+                data = decompress_value(key, data)
+                found[key] = data
+                if pttl and pttl > 0:
+                    local_cache.set(key, data, _l1_ttl(pttl / 1000))
+
+    for key in keys:
+        _count(key_prefix_of(key), "hits" if key in found else "misses")
+    result = {}
+    for key, data in found.items():
+        value = decode_value(data)
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def set_many(mapping: dict[str, Any], ttl: int = CACHE_TTL) -> bool:
+    """Set several values with one TTL in a single pipelined round trip."""
+    encoded = {}
+    for key, value in mapping.items():
+        data = _encode_or_none(key, value)
+        if data is not None:
+            encoded[key] = data
+            local_cache.set(key, data, _l1_ttl(ttl))
+            _count(key_prefix_of(key), "bytes_written", len(data))
+
+    client = get_redis()
+    if client and encoded:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, data in encoded.items():
+                pipe.setex(key, ttl, compress_value(key, data))
+            pipe.execute()
+        except Exception as e:
+            _redis_error(e, "set_many")
+            return False
+    return len(encoded) == len(mapping)
+
+
+# ---------------------------------------------------------------------------
+# Generation-based invalidation
+# ---------------------------------------------------------------------------
+# Each namespace ("plans", "providers", "tdus") has a counter that is part of
+# every key cached under it.  Bumping the counter makes all old entries
+# unreachable without scanning or flushing; they simply expire.
+_generation_lock = threading.Lock()
+_generations: dict[str, tuple[int, float]] = {}  # namespace -> (generation, read_at)
+_deferred_bumps: ContextVar[Optional[set]] = ContextVar("_deferred_bumps", default=None)
+_generation_overrides: ContextVar[Optional[dict]] = ContextVar("_generation_overrides", default=None)
+
+
+def _generation_key(namespace: str) -> str:
+    return f"gen:{namespace}"
+
+
+def get_generation(namespace: str) -> int:
+    """Return the current generation of a cache namespace."""
+    return get_generations((namespace,))[0]
+
+
+def get_generations(namespaces: Iterable[str]) -> list[int]:
+    """
+    Return the current generations of several namespaces.
+
+    Values read from Redis are reused for CACHE_GENERATION_TTL seconds;
+    stale ones are refreshed together with a single MGET.
+    """
+    namespaces = list(namespaces)
+    now = time.time()
+    client = get_redis()
+    generations, stale = _known_generations(namespaces, now, client is not None)
+    values = None
+    if stale and client:
+        try:
+            values = client.mget([_generation_key(namespace) for namespace in stale])
+        except Exception as e:
+            _redis_error(e, "generation read")
+    _record_generations(generations, stale, values, now)
+    return [generations[namespace] for namespace in namespaces]
+
+
+def _known_generations(namespaces: list[str], now: float, connected: bool) -> tuple[dict[str, int], list[str]]:
+    """
+    Resolve generations from the overrides and the per-process table.
+
+    Returns the generations known so far and the namespaces that must be
+    re-read from Redis (expired ones, or only the unseen ones while Redis
+    is unavailable).
+    """
+    overrides = _generation_overrides.get() or {}
+    generations: dict[str, int] = {}
+    stale = []
+    with _generation_lock:
+        for namespace in namespaces:
+            if namespace in overrides:
+                generations[namespace] = overrides[namespace]
+                continue
+            cached = _generations.get(namespace)
+            if cached is not None and (not connected or now - cached[1] < CACHE_GENERATION_TTL):
+                generations[namespace] = cached[0]
+            else:
+                generations[namespace] = cached[0] if cached else 0
+                stale.append(namespace)
+    return generations, stale
+
+
+def _record_generations(generations: dict[str, int], stale: list[str], values: Optional[list], now: float) -> None:
+    """Apply the MGET results (None if there was no read) and remember them."""
+    if values is not None:
+        for namespace, value in zip(stale, values):
+            generations[namespace] = int(value) if value else 0
+    if stale:
+        with _generation_lock:
+            for namespace in stale:
+                _generations[namespace] = (generations[namespace], now)
+
+
+def bump_generation(*namespaces: str) -> None:
+    """
+    Invalidate every entry cached under the given namespaces.
+
+    Inside ``batch_invalidation()`` the bumps are collected and applied once
+    when the block exits.
+    """
+    pending = _deferred_bumps.get()
+    if pending is not None:
+        pending.update(namespaces)
+        return
+
+    client = get_redis()
+    for namespace in namespaces:
+        generation = None
+        if client:
+            try:
+                generation = int(client.incr(_generation_key(namespace)))
+            except Exception as e:
+                _redis_error(e, "generation bump")
+                client = None
+        with _generation_lock:
+            if generation is None:
+                generation = _generations.get(namespace, (0, 0.0))[0] + 1
+            _generations[namespace] = (generation, time.time())
+
+
+@contextmanager
+def batch_invalidation():
+    """
+    Defer generation bumps until the end of a bulk write.
+
+    Usage:
+        with batch_invalidation():
+            for plan in plans:
+                crud.create_or_update_plan(db, provider_id, plan)  # bumps "plans" once, on exit
+    """
+    pending: set = set()
+    token = _deferred_bumps.set(pending)
+    try:
+        yield
+    finally:
+        _deferred_bumps.reset(token)
+        if pending:
+            bump_generation(*sorted(pending))
+
+
+@contextmanager
+def prepare_next_generation():
+    """
+    Compute cache entries for the generation a pending bump will publish.
+
+    Must be used inside ``batch_invalidation()`` after the writes are
+    committed.  Cached calls made in the block use the generation that the
+    deferred bump will produce, so their results are in place when the bump
+    makes them live.  Other requests keep using the current generation until
+    then.
+    """
+    pending = _deferred_bumps.get()
+    if not pending:
+        yield
+        return
+    token = _generation_overrides.set({ns: get_generation(ns) + 1 for ns in pending})
+    try:
+        yield
+    finally:
+        _generation_overrides.reset(token)
+
+
+# ---------------------------------------------------------------------------
+# Single-flight (dogpile protection)
+# ---------------------------------------------------------------------------
+# Within a process, concurrent misses on one key share a Future owned by the
+# first caller.  Across workers, that caller also holds a short Redis lock;
+# other workers poll the cache for its result instead of recomputing.
+_inflight_lock = threading.Lock()
+_inflight: dict[str, Future] = {}
+
+# Delete the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _lock_key(key: str) -> str:
+    return f"lock:{key}"
+
+
+def _acquire_lock(key: str) -> Optional[str]:
+    """Try to take the cross-worker recompute lock; return its token."""
+    client = get_redis()
+    if not client:
+        return "local"
+    token = uuid.uuid4().hex
+    try:
+        if client.set(_lock_key(key), token, nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000)):
+            return token
+        return None
+    except Exception as e:
+        _redis_error(e, "lock")
+        return "local"
+
+
+def _release_lock(key: str, token: str) -> None:
+    client = get_redis()
+    if not client or token == "local":
+        return
+    try:
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(key), token)
+    except Exception as e:
+        _redis_error(e, "unlock")
+
+
+def _wait_for_other_worker(key: str) -> Optional[bytes]:
+    """Poll the cache while another worker holds the recompute lock."""
+    deadline = time.time() + CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(CACHE_LOCK_POLL_INTERVAL)
+        client = get_redis()
+        if not client:
+            return None
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.exists(_lock_key(key))
+            data, locked = pipe.execute()
+        except Exception as e:
+            _redis_error(e, "poll")
+            return None
+        if data:
+            return decompress_value(key, data)
+        if not locked:
+            return None
+    return None
+
+
+def _encode_entry(key: str, value: Any, ttl: int, stale_ttl: int) -> Optional[bytes]:
+    data = _encode_or_none(key, value)
+    if data is not None and stale_ttl:
+        data = wrap_fresh_until(data, time.time() + ttl)
+    return data
+
+
+def _entry_for(key: str, result: Any, ttl: int, stale_ttl: int, negative_ttl: int) -> tuple[Optional[bytes], int]:
+    """Return the bytes to store for a computed result and their lifetime."""
+    if result is None and negative_ttl:
+        return FORMAT_MISSING, negative_ttl
+    return _encode_entry(key, result, ttl, stale_ttl), ttl + stale_ttl
+
+
+def single_flight(key: str, compute, ttl: int, stale_ttl: int = 0, negative_ttl: int = 0) -> Any:
+    """
+    Return ``compute()`` for a missing key, letting only one caller run it.
+
+    The leader stores the encoded result; followers in this process wait on
+    the leader's Future and decode the same bytes, followers in other workers
+    pick it up from Redis.  If the leader fails or times out, followers fall
+    back to computing on their own.
+
+    With ``negative_ttl``, a None result is stored as a negative entry for
+    that many seconds.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        try:
+            data = future.result(timeout=CACHE_LOCK_TIMEOUT)
+        except Exception:
+            data = None
+        return decode_value(data) if data is not None else compute()
+
+    try:
+        token = _acquire_lock(key)
+        if token is None:
+            data = _wait_for_other_worker(key)
+            if data is not None:
+                local_cache.set(key, data, _l1_ttl(ttl))
+                future.set_result(data)
+                return decode_value(data)
+        try:
+            result = compute()
+            data, lifetime = _entry_for(key, result, ttl, stale_ttl, negative_ttl)
+            if data is not None:
+                _store(key, data, lifetime)
+            future.set_result(data)
+            return result
+        finally:
+            if token is not None:
+                _release_lock(key, token)
+    except BaseException as e:
+        if not future.done():
+            future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+# ---------------------------------------------------------------------------
+# Stale-while-revalidate
+# ---------------------------------------------------------------------------
+# Entries cached with a stale_ttl keep their value for ttl + stale_ttl
+# seconds.  After ttl they are served as-is while a background thread
+# recomputes them with its own database session.
+_refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_refreshing: set[str] = set()
+
+
+def _call_with_own_session(func, args: tuple, kwargs: dict) -> Any:
+    """Call ``func`` with its session arguments replaced by a new session."""
+    from .database import SessionLocal
+
+    signature = inspect.signature(func)
+    bound = signature.bind(*args, **kwargs)
+    sessions = []
+    for name, param in signature.parameters.items():
+        if name in bound.arguments and _is_session_param(param):
+            session = SessionLocal()
+            sessions.append(session)
+            bound.arguments[name] = session
+    try:
+        return func(*bound.args, **bound.kwargs)
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def _refresh(key: str, prefix: str, func, args: tuple, kwargs: dict, ttl: int, stale_ttl: int) -> None:
+    try:
+        token = _acquire_lock(key)
+        if token is None:
+            return  # Another worker is refreshing this key
+        try:
+            data = _encode_entry(key, _call_with_own_session(func, args, kwargs), ttl, stale_ttl)
+            if data is not None:
+                _store(key, data, ttl + stale_ttl)
+            _count(prefix, "refreshes")
+        finally:
+            _release_lock(key, token)
+    except Exception as e:
+        _count(prefix, "refresh_errors")
+        logger.warning(f"[Cache] Background refresh failed for {key}: {e}")
+    finally:
+        _end_refresh(key)
+
+
+def _schedule_refresh(key: str, prefix: str, func, args: tuple, kwargs: dict, ttl: int, stale_ttl: int) -> None:
+    if _begin_refresh(key):
+        _refresh_executor.submit(_refresh, key, prefix, func, args, kwargs, ttl, stale_ttl)
+
+
+# Keys being refreshed, shared with app.cache_async so that a key is never
+# refreshed twice in one process
+def _begin_refresh(key: str) -> bool:
+    with _inflight_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
         return True
 
 
-def cache_result(ttl: int = CACHE_TTL, key_prefix: str = ""):
+def _end_refresh(key: str) -> None:
+    with _inflight_lock:
+        _refreshing.discard(key)
+
+
+def _is_session_param(param: inspect.Parameter) -> bool:
+    """Return True if the parameter holds a database session."""
+    if param.name in SESSION_PARAM_NAMES:
+        return True
+    annotation = param.annotation
+    if isinstance(annotation, str):
+        return annotation.split(".")[-1] in ("Session", "AsyncSession")
+    return getattr(annotation, "__name__", None) in ("Session", "AsyncSession")
+
+
+def _canonical(value: Any) -> str:
+    """
+    Render an argument value as a stable cache key fragment.
+
+    Scalars are percent-encoded, so a value containing ":", "=" or "," can't
+    pose as a separator and collide with a different set of arguments.
+    """
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        return "[" + ",".join(_canonical(item) for item in items) + "]"
+    return quote(str(value), safe="")
+
+
+def build_cache_key(
+    prefix: str,
+    func,
+    args: tuple = (),
+    kwargs: Optional[dict] = None,
+    key_params: Optional[Iterable[str]] = None,
+) -> str:
+    """
+    Build a canonical cache key for a call to ``func``.
+
+    Arguments are bound to the function signature so positional and keyword
+    calls produce the same key.  Session parameters are dropped, and
+    arguments that are None or equal to their default are omitted, so
+    ``get_plans(db)`` and ``get_plans(other_db, skip=0, provider=None)`` share
+    one entry.  If ``key_params`` is given, only those parameters count.
+    Keys longer than ``CACHE_KEY_MAX_LENGTH`` are replaced by a SHA-1 digest.
+    """
+    signature = inspect.signature(func)
+    bound = signature.bind(*args, **(kwargs or {}))
+    allowed = set(key_params) if key_params is not None else None
+
+    parts = []
+    for name, param in signature.parameters.items():
+        if allowed is not None and name not in allowed:
+            continue
+        if allowed is None and _is_session_param(param):
+            continue
+        if name not in bound.arguments:
+            continue
+        value = bound.arguments[name]
+        if param.kind is inspect.Parameter.VAR_KEYWORD:
+            parts.extend(f"{k}={_canonical(v)}" for k, v in sorted(value.items()) if v is not None)
+            continue
+        if param.kind is inspect.Parameter.VAR_POSITIONAL:
+            if value:
+                parts.append(f"{name}={_canonical(value)}")
+            continue
+        if value is None or (param.default is not inspect.Parameter.empty and value == param.default):
+            continue
+        parts.append(f"{name}={_canonical(value)}")
+
+    cache_key = ":".join([prefix or func.__name__] + parts)
+    if len(cache_key) > CACHE_KEY_MAX_LENGTH:
+        digest = hashlib.sha1(cache_key.encode("utf-8")).hexdigest()
+        cache_key = f"{prefix or func.__name__}:h:{digest}"
+    return cache_key
+
+
+def _generation_prefix(prefix: str, generations: Iterable[int]) -> str:
+    """Key prefix embedding the generations of the namespaces a result depends on."""
+    generations = ".".join(str(generation) for generation in generations)
+    return f"{prefix}@{generations}" if generations else prefix
+
+
+def _read_entry(prefix: str, data: Optional[bytes]) -> tuple[bool, Any, bool]:
+    """
+    Interpret fetched bytes for a cached call.
+
+    Returns ``(found, value, stale)``: whether the call can be answered from
+    the cache (negative entries answer None), the value, and whether the
+    entry is past its fresh period and should be refreshed.
+    """
+    if data == FORMAT_MISSING:
+        _count(prefix, "negative_hits")
+        return True, None, False
+    cached = decode_value(data) if data is not None else None
+    if cached is None:
+        return False, None, False
+    soft_expiry = fresh_until(data)
+    stale = soft_expiry is not None and time.time() >= soft_expiry
+    if stale:
+        _count(prefix, "stale_serves")
+    return True, cached, stale
+
+
+def cache_result(
+    ttl: int = CACHE_TTL,
+    key_prefix: str = "",
+    key_params: Optional[Iterable[str]] = None,
+    namespaces: Iterable[str] = (),
+    stale_ttl: int = 0,
+    negative_ttl: int = 0,
+):
     """
     Decorator to cache function results.
 
+    The cache key is built by ``build_cache_key``: database sessions are
+    ignored and the remaining arguments are canonicalized, so calls made
+    from different requests share one entry.  Pass ``key_params`` to limit
+    the key to specific parameters.
+
+    ``namespaces`` lists the data the result depends on; the key embeds their
+    generations, so ``bump_generation(namespace)`` invalidates the entry.
+
+    On a miss, concurrent callers are coalesced by ``single_flight`` so only
+    one of them runs the function.
+
+    With ``stale_ttl`` the entry is kept for ``ttl + stale_ttl`` seconds.
+    Once older than ``ttl`` it is still returned immediately, and a
+    background thread refreshes it with its own database session.
+
+    With ``negative_ttl`` a None result ("not found") is cached too, for that
+    many seconds, so repeated lookups of missing rows skip the database.
+    Like positive entries, it is dropped when a namespace is bumped.
+
     Usage:
-        @cache_result(ttl=3600, key_prefix="plans")
-        def get_plans(...):
+        @cache_result(ttl=3600, key_prefix="plans", namespaces=("plans",))
+        def get_plans(db, ...):
             ...
     """
+    key_params = tuple(key_params) if key_params is not None else None
+    namespaces = tuple(namespaces)
+
     def decorator(func):
+        prefix = key_prefix or func.__name__
+
+        def make_key(*args, **kwargs) -> str:
+            generations = get_generations(namespaces) if namespaces else ()
+            return build_cache_key(_generation_prefix(prefix, generations), func, args, kwargs, key_params)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key from function name and arguments
-            key_parts = [key_prefix or func.__name__]
-            if args:
-                key_parts.extend(str(arg) for arg in args)
-            if kwargs:
-                key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
-            cache_key = ":".join(key_parts)
+            cache_key = make_key(*args, **kwargs)
 
             # Try to get from cache
-            cached = get_cache(cache_key)
-            if cached is not None:
-                print(f"[Cache] HIT: {cache_key}")
+            found, cached, stale = _read_entry(prefix, _fetch(cache_key))
+            if stale:
+                _schedule_refresh(cache_key, prefix, func, args, kwargs, ttl, stale_ttl)
+            if found:
                 return cached
 
-            # Execute function and cache result
-            print(f"[Cache] MISS: {cache_key}")
-            result = func(*args, **kwargs)
-            set_cache(cache_key, result, ttl)
-            return result
+            # Execute function (once across concurrent callers) and cache result
+            return single_flight(cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl, negative_ttl)
 
+        wrapper.cache_key = make_key
         return wrapper
     return decorator
@@ -0,0 +1,427 @@
+"""
+Asyncio variant of the caching layer for ``async def`` endpoints.
+
+Uses ``redis.asyncio`` so cache I/O never blocks the event loop or needs a
+threadpool hop.  Key building, value codecs, compression, the L1 tier,
+generations and metrics are shared with ``app.cache``: an entry written by
+a sync endpoint is a hit for an async one and vice versa.
+
+Usage:
+    @cache_result_async(ttl=300, key_prefix="tdu_summary", namespaces=("tdus",))
+    async def get_summary(db: AsyncSession):
+        ...
+
+    value = await get_cache_async("stats")
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+import uuid
+from functools import wraps
+from typing import Any, Iterable, Optional
+
+from . import cache
+from .cache import (
+    CACHE_L1_TTL,
+    CACHE_LOCK_POLL_INTERVAL,
+    CACHE_LOCK_TIMEOUT,
+    CACHE_TTL,
+    _RELEASE_LOCK_SCRIPT,
+    _begin_refresh,
+    _count,
+    _encode_entry,
+    _encode_or_none,
+    _end_refresh,
+    _entry_for,
+    _fetch_local,
+    _generation_key,
+    _generation_prefix,
+    _is_session_param,
+    _known_generations,
+    _lock_key,
+    _promote,
+    _read_entry,
+    _record_fetch,
+    _record_generations,
+    _record_store,
+    build_cache_key,
+    compress_value,
+    decode_value,
+    decompress_value,
+    key_prefix_of,
+    local_cache,
+    logger,
+)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+# ---------------------------------------------------------------------------
+# Redis connection
+# ---------------------------------------------------------------------------
+# asyncio connections belong to the event loop that opened them, so the
+# client is created lazily per loop.  Pool settings and the reconnect
+# back-off follow the sync client in app.cache.
+_client = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_retry_at = 0.0
+_connect_lock: Optional[asyncio.Lock] = None
+
+
+def _create_pool():
+    options = dict(
+        max_connections=cache.REDIS_MAX_CONNECTIONS,
+        timeout=cache.REDIS_POOL_TIMEOUT,
+        socket_timeout=cache.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=cache.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=cache.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    if cache.REDIS_URL:
+        return aioredis.BlockingConnectionPool.from_url(cache.REDIS_URL, **options)
+    return aioredis.BlockingConnectionPool(
+        host=cache.REDIS_HOST, port=cache.REDIS_PORT, db=cache.REDIS_DB, **options
+    )
+
+
+async def get_async_redis():
+    """Return the asyncio Redis client for the running loop; None while unavailable."""
+    global _client, _client_loop, _retry_at, _connect_lock
+    loop = asyncio.get_running_loop()
+    if _client is not None and _client_loop is loop:
+        return _client
+    if aioredis is None or not cache.REDIS_ENABLED or time.time() < _retry_at:
+        return None
+
+    if _connect_lock is None or _client_loop is not loop:
+        _connect_lock = asyncio.Lock()
+        _client, _client_loop = None, loop
+    async with _connect_lock:
+        if _client is not None:
+            return _client
+        if time.time() < _retry_at:
+            return None
+        client = aioredis.Redis(connection_pool=_create_pool())
+        try:
+            await client.ping()
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            await client.aclose(close_connection_pool=True)
+            _retry_at = time.time() + cache.REDIS_RETRY_INTERVAL
+            logger.info(f"[Cache] Async Redis not available ({e}), using in-memory cache")
+            return None
+        _client = client
+        logger.info("[Cache] Async Redis connected")
+        return client
+
+
+async def _redis_error(e: Exception, action: str) -> None:
+    """Log a Redis failure; on connection loss fall back to the local tier."""
+    global _client, _retry_at
+    logger.warning(f"[Cache] Async Redis {action} error: {e}")
+    if aioredis is not None and isinstance(e, (aioredis.ConnectionError, aioredis.TimeoutError)):
+        client, _client = _client, None
+        _retry_at = time.time() + cache.REDIS_RETRY_INTERVAL
+        if client is not None:
+            await client.aclose(close_connection_pool=True)
+
+
+async def close_async_redis() -> None:
+    """Close the asyncio client's pool (called on application shutdown)."""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose(close_connection_pool=True)
+
+
+def _l1_ttl(ttl: float) -> float:
+    return min(ttl, CACHE_L1_TTL) if _client is not None else ttl
+
+
+# ---------------------------------------------------------------------------
+# Get / set
+# ---------------------------------------------------------------------------
+async def get_cache_async(key: str) -> Optional[Any]:
+    """Get value from cache (L1 first, then Redis with promotion to L1)."""
+    data = await _fetch(key)
+    return decode_value(data) if data is not None else None
+
+
+async def _fetch(key: str) -> Optional[bytes]:
+    """Return the encoded bytes stored under a key, if any."""
+    prefix = key_prefix_of(key)
+    start = time.perf_counter()
+    data = _fetch_local(key, prefix)
+    client = await get_async_redis() if data is None else None
+    if client:
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.pttl(key)
+                data, pttl = await pipe.execute()
+            if data:
+                data = decompress_value(key, data)
+        except Exception as e:
+            _count(prefix, "errors")
+            await _redis_error(e, "get")
+            data = None
+        else:
+            _promote(key, prefix, data, pttl)
+    return _record_fetch(prefix, data, start)
+
+
+async def set_cache_async(key: str, value: Any, ttl: int = CACHE_TTL) -> bool:
+    """Set value in cache with TTL."""
+    data = _encode_or_none(key, value)
+    if data is None:
+        return False
+    return await _store(key, data, ttl)
+
+
+async def _store(key: str, data: bytes, ttl: int) -> bool:
+    """Write already encoded bytes to both tiers."""
+    prefix = key_prefix_of(key)
+    start = time.perf_counter()
+    stored = True
+    client = await get_async_redis()
+    local_cache.set(key, data, _l1_ttl(ttl))
+    if client:
+        try:
+            await client.setex(key, ttl, compress_value(key, data))
+        except Exception as e:
+            _count(prefix, "errors")
+            await _redis_error(e, "set")
+            stored = False
+    _record_store(prefix, data, start)
+    return stored
+
+
+async def delete_cache_async(key: str) -> bool:
+    """Delete value from cache."""
+    local_cache.delete(key)
+    client = await get_async_redis()
+    if client:
+        try:
+            await client.delete(key)
+        except Exception as e:
+            await _redis_error(e, "delete")
+            return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Generations
+# ---------------------------------------------------------------------------
+async def get_generations_async(namespaces: Iterable[str]) -> list[int]:
+    """Async ``cache.get_generations``, sharing its per-process generation table."""
+    namespaces = list(namespaces)
+    now = time.time()
+    client = await get_async_redis()
+    generations, stale = _known_generations(namespaces, now, client is not None)
+    values = None
+    if stale and client:
+        try:
+            values = await client.mget([_generation_key(namespace) for namespace in stale])
+        except Exception as e:
+            await _redis_error(e, "generation read")
+    _record_generations(generations, stale, values, now)
+    return [generations[namespace] for namespace in namespaces]
+
+
+# ---------------------------------------------------------------------------
+# Single-flight (dogpile protection)
+# ---------------------------------------------------------------------------
+# Same protocol as the sync layer: one asyncio Future per key within the
+# loop, plus the shared Redis lock across workers.
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def _acquire_lock(key: str) -> Optional[str]:
+    client = await get_async_redis()
+    if not client:
+        return "local"
+    token = uuid.uuid4().hex
+    try:
+        if await client.set(_lock_key(key), token, nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000)):
+            return token
+        return None
+    except Exception as e:
+        await _redis_error(e, "lock")
+        return "local"
+
+
+async def _release_lock(key: str, token: str) -> None:
+    client = await get_async_redis()
+    if not client or token == "local":
+        return
+    try:
+        await client.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(key), token)
+    except Exception as e:
+        await _redis_error(e, "unlock")
+
+
+async def _wait_for_other_worker(key: str) -> Optional[bytes]:
+    deadline = time.time() + CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+        client = await get_async_redis()
+        if not client:
+            return None
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.exists(_lock_key(key))
+                data, locked = await pipe.execute()
+        except Exception as e:
+            await _redis_error(e, "poll")
+            return None
+        if data:
+            return decompress_value(key, data)
+        if not locked:
+            return None
+    return None
+
+
+async def single_flight_async(key: str, compute, ttl: int, stale_ttl: int = 0, negative_ttl: int = 0) -> Any:
+    """Await ``compute()`` for a missing key, letting only one caller run it."""
+    future = _inflight.get(key)
+    if future is not None and future.get_loop() is asyncio.get_running_loop():
+        try:
+            data = await asyncio.wait_for(asyncio.shield(future), CACHE_LOCK_TIMEOUT)
+        except Exception:
+            data = None
+        return decode_value(data) if data is not None else await compute()
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        token = await _acquire_lock(key)
+        if token is None:
+            data = await _wait_for_other_worker(key)
+            if data is not None:
+                local_cache.set(key, data, _l1_ttl(ttl))
+                future.set_result(data)
+                return decode_value(data)
+        try:
+            result = await compute()
+            data, lifetime = _entry_for(key, result, ttl, stale_ttl, negative_ttl)
+            if data is not None:
+                await _store(key, data, lifetime)
+            future.set_result(data)
+            return result
+        finally:
+            if token is not None:
+                await _release_lock(key, token)
+    except BaseException as e:
+        if not future.done():
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody is waiting
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+# ---------------------------------------------------------------------------
+# Stale-while-revalidate
+# ---------------------------------------------------------------------------
+# Stale entries are refreshed by a task on the running loop, with its own
+# AsyncSession.  Keys being refreshed are shared with the sync layer, so a
+# key is never refreshed twice in one process.
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+async def _call_with_own_session(func, args: tuple, kwargs: dict) -> Any:
+    """Await ``func`` with its session arguments replaced by a new AsyncSession."""
+    from .database import AsyncSessionLocal, get_async_engine
+
+    get_async_engine()
+    signature = inspect.signature(func)
+    bound = signature.bind(*args, **kwargs)
+    sessions = []
+    for name, param in signature.parameters.items():
+        if name in bound.arguments and _is_session_param(param):
+            session = AsyncSessionLocal()
+            sessions.append(session)
+            bound.arguments[name] = session
+    try:
+        return await func(*bound.args, **bound.kwargs)
+    finally:
+        for session in sessions:
+            await session.close()
+
+
+async def _refresh(key: str, prefix: str, func, args: tuple, kwargs: dict, ttl: int, stale_ttl: int) -> None:
+    try:
+        token = await _acquire_lock(key)
+        if token is None:
+            return  # Another worker is refreshing this key
+        try:
+            data = _encode_entry(key, await _call_with_own_session(func, args, kwargs), ttl, stale_ttl)
+            if data is not None:
+                await _store(key, data, ttl + stale_ttl)
+            _count(prefix, "refreshes")
+        finally:
+            await _release_lock(key, token)
+    except Exception as e:
+        _count(prefix, "refresh_errors")
+        logger.warning(f"[Cache] Background refresh failed for {key}: {e}")
+    finally:
+        _end_refresh(key)
+
+
+def _schedule_refresh(key: str, prefix: str, func, args: tuple, kwargs: dict, ttl: int, stale_ttl: int) -> None:
+    if not _begin_refresh(key):
+        return
+    task = asyncio.get_running_loop().create_task(_refresh(key, prefix, func, args, kwargs, ttl, stale_ttl))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+# ---------------------------------------------------------------------------
+# Decorator
+# ---------------------------------------------------------------------------
+def cache_result_async(
+    ttl: int = CACHE_TTL,
+    key_prefix: str = "",
+    key_params: Optional[Iterable[str]] = None,
+    namespaces: Iterable[str] = (),
+    stale_ttl: int = 0,
+    negative_ttl: int = 0,
+):
+    """
+    Decorator to cache results of coroutine functions.
+
+    Keys match ``cache.cache_result`` for the same prefix, namespaces and
+    arguments (``AsyncSession`` parameters are ignored like ``Session``).
+    ``stale_ttl`` and ``negative_ttl`` work as in ``cache.cache_result``;
+    stale entries are refreshed by a task on the running loop.
+    """
+    key_params = tuple(key_params) if key_params is not None else None
+    namespaces = tuple(namespaces)
+
+    def decorator(func):
+        prefix = key_prefix or func.__name__
+
+        async def make_key(*args, **kwargs) -> str:
+            generations = await get_generations_async(namespaces) if namespaces else ()
+            return build_cache_key(_generation_prefix(prefix, generations), func, args, kwargs, key_params)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = await make_key(*args, **kwargs)
+
+            found, cached, stale = _read_entry(prefix, await _fetch(cache_key))
+            if stale:
+                _schedule_refresh(cache_key, prefix, func, args, kwargs, ttl, stale_ttl)
+            if found:
+                return cached
+
+            return await single_flight_async(cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl, negative_ttl)
+
+        wrapper.cache_key = make_key
+        return wrapper
+    return decorator
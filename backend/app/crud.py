@@ -7,13 +7,38 @@ endpoints call these helpers to perform database actions.
 """
 from __future__ import annotations
 
-from typing import List, Optional
+import hashlib
+import json
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional
 
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import Select, case, delete, func, inspect, insert, or_, select, tuple_, update
 
 from . import models, schemas
-from .cache import cache_result
+from .cache import CACHE_NEGATIVE_TTL, bump_generation, cache_result
+from .scraping.provider_urls import canonical_provider_name, get_provider_website
+
+
+# Cache settings of each cached read.  crud_async decorates its async
+# versions with the same settings, so both share one set of cache entries.
+CACHE_SETTINGS = {
+    "get_providers": dict(ttl=1800, key_prefix="providers", namespaces=("providers", "plans"), stale_ttl=86400),
+    "get_provider_summaries": dict(
+        ttl=1800, key_prefix="provider_summaries", namespaces=("providers", "plans"), stale_ttl=86400
+    ),
+    "get_plans": dict(ttl=3600, key_prefix="plans", namespaces=("plans", "providers"), stale_ttl=86400),
+    "get_plans_version": dict(ttl=300, key_prefix="plans_version", namespaces=("plans", "providers")),
+    "get_tdus_version": dict(ttl=300, key_prefix="tdus_version", namespaces=("tdus",)),
+    "get_plan": dict(ttl=3600, key_prefix="plan", namespaces=("plans",), negative_ttl=CACHE_NEGATIVE_TTL),
+    "get_plan_history": dict(ttl=3600, key_prefix="plan_history", namespaces=("plans",)),
+    "get_market_history": dict(ttl=3600, key_prefix="market_history", namespaces=("plans",)),
+    "get_tdus": dict(ttl=86400, key_prefix="tdus", namespaces=("tdus",), stale_ttl=86400),
+    "get_tdu": dict(ttl=86400, key_prefix="tdu", namespaces=("tdus",), negative_ttl=CACHE_NEGATIVE_TTL),
+    "get_tdu_by_name": dict(ttl=86400, key_prefix="tdu_by_name", namespaces=("tdus",), negative_ttl=CACHE_NEGATIVE_TTL),
+}
 
 
 def get_provider_by_name(db: Session, name: str) -> Optional[models.Provider]:
@@ -25,15 +50,130 @@ def create_provider(db: Session, provider: schemas.ProviderCreate) -> models.Pro
     db.add(db_provider)
     db.commit()
     db.refresh(db_provider)
+    bump_generation("providers")
     return db_provider
 
 
-@cache_result(ttl=1800, key_prefix="providers")
-def get_providers(db: Session, skip: int = 0, limit: int = 100) -> List[models.Provider]:
-    return db.execute(select(models.Provider).offset(skip).limit(limit)).scalars().all()
+class ProviderResolver:
+    """
+    Resolve provider names to ids for one ingest run.
+
+    The providers table is loaded once; names are canonicalized with the
+    alias data in ``scraping.provider_urls`` so "TXU" and "TXU Energy" map
+    to the same row.  A name that matches a row exactly keeps that row,
+    though, so databases with both an alias and a canonical row keep writing
+    plans under the provider they already belong to until
+    ``migrations.merge_alias_providers`` has run.  Missing providers are
+    created together, with one commit.
+
+    Usage:
+        resolver = ProviderResolver(db)
+        provider_ids = resolver.resolve(plan["provider_name"] for plan in plans)
+        provider_ids["TXU"]  # -> id of "TXU Energy"
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._ids: dict[str, int] = {}
+        self._exact: dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        self._ids.clear()
+        rows = self.db.execute(select(models.Provider.id, models.Provider.name).order_by(models.Provider.id)).all()
+        self._exact = {name: provider_id for provider_id, name in rows}
+        for provider_id, name in rows:
+            # An existing row named exactly as the canonical name wins over aliases
+            canonical = canonical_provider_name(name)
+            if canonical not in self._ids or name == canonical:
+                self._ids[canonical] = provider_id
 
+    def resolve(self, names: Iterable[str], websites: Optional[dict[str, str]] = None) -> dict[str, int]:
+        """
+        Return {name: provider_id} for the given names, creating missing providers.
 
-@cache_result(ttl=3600, key_prefix="plans")
+        ``websites`` optionally maps names to the website stored for new
+        providers; otherwise the known homepage is used.
+        """
+        websites = websites or {}
+        names = {name for name in names if name}
+        missing: dict[str, Optional[str]] = {}
+        for name in names:
+            canonical = canonical_provider_name(name)
+            if name in self._exact or canonical in self._ids:
+                continue
+            if canonical not in missing or websites.get(name):
+                missing[canonical] = websites.get(name) or get_provider_website(canonical) or None
+
+        if missing:
+            rows = [{"name": name, "website": website} for name, website in missing.items()]
+            try:
+                self.db.execute(insert(models.Provider.__table__), rows)
+                self.db.commit()
+            except IntegrityError:
+                # Another worker created some of them first; pick up its rows
+                self.db.rollback()
+                self._load()
+                rows = [row for row in rows if row["name"] not in self._ids]
+                if rows:
+                    self.db.execute(insert(models.Provider.__table__), rows)
+                    self.db.commit()
+            self._load()
+            bump_generation("providers")
+
+        return {name: self._exact.get(name) or self._ids[canonical_provider_name(name)] for name in names}
+
+
+@cache_result(**CACHE_SETTINGS["get_providers"])
+def get_providers(
+    db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[models.Provider]:
+    """
+    Providers ordered by id, with their plans; ``after_id`` (keyset) replaces ``skip``.
+
+    Plans are loaded for the whole page with one extra SELECT ... IN query
+    instead of one lazy load per provider.
+    """
+    return db.execute(_providers_query(skip, limit, after_id)).scalars().all()
+
+
+def _providers_query(skip: int, limit: int, after_id: Optional[int]) -> Select:
+    query = select(models.Provider).options(selectinload(models.Provider.plans)).order_by(models.Provider.id)
+    if after_id is not None:
+        return query.where(models.Provider.id > after_id).limit(limit)
+    return query.offset(skip).limit(limit)
+
+
+@cache_result(**CACHE_SETTINGS["get_provider_summaries"])
+def get_provider_summaries(
+    db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[dict]:
+    """Like ``get_providers`` but with a plan count instead of the plans, in one query."""
+    return [dict(row) for row in db.execute(_provider_summaries_query(skip, limit, after_id)).mappings()]
+
+
+def _provider_summaries_query(skip: int, limit: int, after_id: Optional[int]) -> Select:
+    plan_counts = (
+        select(models.Plan.provider_id, func.count(models.Plan.id).label("plan_count"))
+        .group_by(models.Plan.provider_id)
+        .subquery()
+    )
+    query = (
+        select(
+            models.Provider.id,
+            models.Provider.name,
+            models.Provider.website,
+            func.coalesce(plan_counts.c.plan_count, 0).label("plan_count"),
+        )
+        .outerjoin(plan_counts, plan_counts.c.provider_id == models.Provider.id)
+        .order_by(models.Provider.id)
+    )
+    if after_id is not None:
+        return query.where(models.Provider.id > after_id).limit(limit)
+    return query.offset(skip).limit(limit)
+
+
+@cache_result(**CACHE_SETTINGS["get_plans"])
 def get_plans(
     db: Session,
     provider: Optional[str] = None,
@@ -43,7 +183,28 @@ def get_plans(
     contract_months: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[tuple] = None,
 ) -> List[models.Plan]:
+    """
+    Plans ordered by rate_1000_cents (nulls last), then id.
+
+    ``after`` is the (rate_1000_cents, id) of the last plan on the previous
+    page; when given, the page starts right after it and ``skip`` is ignored.
+    """
+    filters = (provider, plan_type, service_type, zip_code, contract_months)
+    plans = db.execute(_plans_query(*filters, skip, limit, after)).scalars().all()
+    if _needs_unrated_tail(plans, limit, after):
+        plans += db.execute(_unrated_plans_query(*filters, limit - len(plans))).scalars().all()
+    return plans
+
+
+def _filtered_plans(
+    provider: Optional[str],
+    plan_type: Optional[str],
+    service_type: Optional[str],
+    zip_code: Optional[str],
+    contract_months: Optional[int],
+) -> Select:
     query = select(models.Plan)
     if provider:
         query = query.join(models.Provider).where(models.Provider.name == provider)
@@ -55,14 +216,191 @@ def get_plans(
         query = query.where(models.Plan.zip_code == zip_code)
     if contract_months:
         query = query.where(models.Plan.contract_months == contract_months)
-    query = query.order_by(models.Plan.rate_1000_cents.asc().nulls_last()).offset(skip).limit(limit)
-    return db.execute(query).scalars().all()
+    return query
 
 
+def _plans_query(
+    provider: Optional[str],
+    plan_type: Optional[str],
+    service_type: Optional[str],
+    zip_code: Optional[str],
+    contract_months: Optional[int],
+    skip: int,
+    limit: int,
+    after: Optional[tuple],
+) -> Select:
+    """
+    One page of plans.  Cursor pages are written as index range bounds, so
+    a deep page seeks to its cursor instead of walking the index from the
+    start.  A cursor with a rate only covers rated plans; the unrated tail is
+    read with ``_unrated_plans_query`` once those run out.
+    """
+    query = _filtered_plans(provider, plan_type, service_type, zip_code, contract_months)
+    if after is not None:
+        rate, plan_id = after
+        if rate is None:
+            query = query.where(models.Plan.rate_1000_cents.is_(None), models.Plan.id > plan_id)
+        else:
+            query = query.where(
+                models.Plan.rate_1000_cents >= rate,
+                or_(models.Plan.rate_1000_cents > rate, models.Plan.id > plan_id),
+            )
+    else:
+        query = query.offset(skip)
+    return query.order_by(models.Plan.rate_1000_cents.asc().nulls_last(), models.Plan.id).limit(limit)
+
+
+def _unrated_plans_query(
+    provider: Optional[str],
+    plan_type: Optional[str],
+    service_type: Optional[str],
+    zip_code: Optional[str],
+    contract_months: Optional[int],
+    limit: int,
+) -> Select:
+    query = _filtered_plans(provider, plan_type, service_type, zip_code, contract_months)
+    return query.where(models.Plan.rate_1000_cents.is_(None)).order_by(models.Plan.id).limit(limit)
+
+
+def _needs_unrated_tail(plans: list, limit: int, after: Optional[tuple]) -> bool:
+    """True when a page after a rated cursor ran out of rated plans before filling up."""
+    return after is not None and after[0] is not None and len(plans) < limit
+
+
+def _table_version(db: Session, model) -> dict:
+    """Summarize a table as (row count, max id, newest last_updated)."""
+    return _version_from_row(*db.execute(_table_version_query(model)).one())
+
+
+def _table_version_query(model) -> Select:
+    return select(func.count(model.id), func.max(model.id), func.max(model.last_updated))
+
+
+def _version_from_row(count: int, max_id: Optional[int], last_updated: Optional[datetime]) -> dict:
+    return {
+        "version": f"{count}:{max_id}:{last_updated.isoformat() if last_updated else ''}",
+        "last_modified": last_updated.isoformat() if last_updated else None,
+    }
+
+
+@cache_result(**CACHE_SETTINGS["get_plans_version"])
+def get_plans_version(db: Session) -> dict:
+    """
+    Version of the plan and provider data, used for HTTP ETags.
+
+    Changes whenever a plan is added, updated or deleted, or a provider is added.
+    """
+    version = _table_version(db, models.Plan)
+    provider_count, provider_max_id = db.execute(_provider_version_query()).one()
+    version["version"] += f":{provider_count}:{provider_max_id}"
+    return version
+
+
+def _provider_version_query() -> Select:
+    return select(func.count(models.Provider.id), func.max(models.Provider.id))
+
+
+@cache_result(**CACHE_SETTINGS["get_tdus_version"])
+def get_tdus_version(db: Session) -> dict:
+    """Version of the TDU data, used for HTTP ETags."""
+    return _table_version(db, models.TDU)
+
+
+@cache_result(**CACHE_SETTINGS["get_plan"])
 def get_plan(db: Session, plan_id: int) -> Optional[models.Plan]:
     return db.execute(select(models.Plan).where(models.Plan.id == plan_id)).scalar_one_or_none()
 
 
+# Longest date range /plans/history aggregates in one request
+MARKET_HISTORY_MAX_DAYS = 366
+
+
+@cache_result(**CACHE_SETTINGS["get_plan_history"])
+def get_plan_history(
+    db: Session,
+    plan_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 1000,
+) -> List[models.PlanRateSnapshot]:
+    """A plan's price snapshots in time order, optionally within [start, end)."""
+    return db.execute(_plan_history_query(plan_id, start, end, limit)).scalars().all()
+
+
+def _plan_history_query(plan_id: int, start: Optional[datetime], end: Optional[datetime], limit: int) -> Select:
+    snapshot = models.PlanRateSnapshot
+    query = select(snapshot).where(snapshot.plan_id == plan_id)
+    if start is not None:
+        query = query.where(snapshot.observed_at >= start)
+    if end is not None:
+        query = query.where(snapshot.observed_at < end)
+    return query.order_by(snapshot.observed_at, snapshot.id).limit(limit)
+
+
+@cache_result(**CACHE_SETTINGS["get_market_history"])
+def get_market_history(db: Session, start: date, end: date) -> List[dict]:
+    """
+    Price changes observed across all plans per day, for days in [start, end].
+
+    Reads the ``market_rate_days`` rollup that ingest keeps up to date, one
+    row per day, so the cost depends on the number of days and not on the
+    number of snapshots.  The rates summarize the prices plans changed to
+    on each day.
+    """
+    return _market_history_rows(db.execute(_market_history_query(start, end)).scalars())
+
+
+def _market_history_query(start: date, end: date) -> Select:
+    rollup = models.MarketRateDay
+    return select(rollup).where(rollup.day >= start, rollup.day <= end).order_by(rollup.day)
+
+
+def _market_history_rows(days) -> List[dict]:
+    return [
+        {
+            "day": str(day.day),
+            "snapshots": day.snapshots,
+            "avg_rate_1000_cents": (
+                round(day.rate_1000_cents_sum / day.rated_snapshots, 4) if day.rated_snapshots else None
+            ),
+            "min_rate_1000_cents": day.min_rate_1000_cents,
+            "max_rate_1000_cents": day.max_rate_1000_cents,
+        }
+        for day in days
+    ]
+
+
+def rebuild_market_days(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> None:
+    """
+    Recompute the ``market_rate_days`` rows for days in [start, end] (open
+    ends extend to all days) from plan_rate_snapshots.  Used to backfill the
+    rollup and after snapshots are deleted; it scans every snapshot in the
+    range.  The caller commits.
+    """
+    rollup, snapshot = models.MarketRateDay, models.PlanRateSnapshot
+    stale = delete(rollup)
+    day = func.date(snapshot.observed_at)
+    aggregate = select(
+        day,
+        func.count(snapshot.id),
+        func.count(snapshot.rate_1000_cents),
+        func.coalesce(func.sum(snapshot.rate_1000_cents), 0.0),
+        func.min(snapshot.rate_1000_cents),
+        func.max(snapshot.rate_1000_cents),
+    ).group_by(day)
+    if start is not None:
+        stale = stale.where(rollup.day >= start)
+        aggregate = aggregate.where(snapshot.observed_at >= datetime.combine(start, time.min))
+    if end is not None:
+        stale = stale.where(rollup.day <= end)
+        aggregate = aggregate.where(snapshot.observed_at < datetime.combine(end + timedelta(days=1), time.min))
+    db.execute(stale, execution_options={"synchronize_session": False})
+    db.execute(insert(rollup).from_select(
+        ["day", "snapshots", "rated_snapshots", "rate_1000_cents_sum", "min_rate_1000_cents", "max_rate_1000_cents"],
+        aggregate,
+    ))
+
+
 def create_or_update_plan(db: Session, provider_id: int, plan_data: schemas.PlanCreate) -> models.Plan:
     """
     Create a new plan or update an existing one if the provider and plan_name match.
@@ -74,50 +412,268 @@ def create_or_update_plan(db: Session, provider_id: int, plan_data: schemas.Plan
             models.Plan.plan_name == plan_data.plan_name,
         )
     ).scalar_one_or_none()
+    content_hash = plan_content_hash(plan_data.model_dump())
+    if existing and existing.content_hash == content_hash:
+        return existing  # Nothing changed; skip the UPDATE and keep caches
     if existing:
         # Update fields on existing plan
+        price_changed = _price_changed(existing, plan_data.model_dump())
         for field, value in plan_data.model_dump(exclude={"provider_id"}).items():
             setattr(existing, field, value)
+        existing.content_hash = content_hash
         db.add(existing)
+        if price_changed:
+            _add_snapshots(db, [_snapshot_row(existing.id, plan_data.model_dump(), datetime.utcnow())])
         db.commit()
         db.refresh(existing)
+        bump_generation("plans")
         return existing
     else:
         new_plan = models.Plan(
             provider_id=provider_id,
-            plan_name=plan_data.plan_name,
-            plan_type=plan_data.plan_type,
-            service_type=plan_data.service_type,
-            zip_code=plan_data.zip_code,
-            contract_months=plan_data.contract_months,
-            rate_500_cents=plan_data.rate_500_cents,
-            rate_1000_cents=plan_data.rate_1000_cents,
-            rate_2000_cents=plan_data.rate_2000_cents,
-            monthly_bill_1000=plan_data.monthly_bill_1000,
-            monthly_bill_2000=plan_data.monthly_bill_2000,
-            early_termination_fee=plan_data.early_termination_fee,
-            base_monthly_fee=plan_data.base_monthly_fee,
-            renewable_percent=plan_data.renewable_percent,
-            special_features=plan_data.special_features,
+            **plan_data.model_dump(exclude={"provider_id"}),
+            content_hash=content_hash,
         )
         db.add(new_plan)
+        db.flush()
+        _add_snapshots(db, [_snapshot_row(new_plan.id, plan_data.model_dump(), datetime.utcnow())])
         db.commit()
         db.refresh(new_plan)
+        bump_generation("plans")
         return new_plan
 
 
+def delete_plans(db: Session, *criteria) -> int:
+    """
+    Delete the plans matching ``criteria`` (every plan if none are given)
+    together with their rate snapshots, and return the number of plans
+    deleted.  The caller commits.
+
+    Snapshots are deleted explicitly: SQLite ignores ON DELETE CASCADE unless
+    foreign keys are enabled, and reuses the ids of deleted plans.  The
+    market_rate_days they were counted in are then rebuilt.
+    """
+    snapshot = models.PlanRateSnapshot
+    plan_ids = select(models.Plan.id).where(*criteria)
+    first, last = db.execute(
+        select(func.min(snapshot.observed_at), func.max(snapshot.observed_at)).where(snapshot.plan_id.in_(plan_ids))
+    ).one()
+    db.execute(delete(snapshot).where(snapshot.plan_id.in_(plan_ids)), execution_options={"synchronize_session": False})
+    deleted = db.execute(delete(models.Plan).where(*criteria), execution_options={"synchronize_session": False}).rowcount
+    if first is not None:
+        rebuild_market_days(db, first.date(), last.date())
+    return deleted
+
+
+# Plan columns written by an upsert, besides the (provider_id, plan_name) key
+PLAN_UPSERT_FIELDS = tuple(name for name in schemas.PlanBase.model_fields if name != "plan_name")
+PLAN_UPSERT_CHUNK_SIZE = 500
+
+
+def plan_content_hash(row: dict) -> str:
+    """
+    SHA-1 over a plan's normalized PLAN_UPSERT_FIELDS, stored as Plan.content_hash.
+
+    Floats are rounded to 4 decimals and strings stripped, with "" treated as
+    None, so float noise and whitespace from scrapers do not count as
+    changes.  Adding a plan field changes every hash, so the next ingest
+    rewrites each plan once.
+    """
+    normalized = []
+    for field in PLAN_UPSERT_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        elif isinstance(value, float):
+            value = round(value, 4)
+        normalized.append(value)
+    return hashlib.sha1(json.dumps(normalized, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# Plan columns copied into plan_rate_snapshots; a change to any of them adds a snapshot
+PLAN_PRICE_FIELDS = (
+    "rate_500_cents",
+    "rate_1000_cents",
+    "rate_2000_cents",
+    "monthly_bill_1000",
+    "monthly_bill_2000",
+    "early_termination_fee",
+    "base_monthly_fee",
+)
+
+
+def _price_changed(current, row: dict) -> bool:
+    return any(getattr(current, field) != row[field] for field in PLAN_PRICE_FIELDS)
+
+
+def _snapshot_row(plan_id: int, row: dict, observed_at: datetime) -> dict:
+    return {"plan_id": plan_id, "observed_at": observed_at, **{field: row[field] for field in PLAN_PRICE_FIELDS}}
+
+
+def _add_snapshots(db: Session, snapshots: List[dict]) -> None:
+    """Insert plan_rate_snapshots rows and fold them into their market_rate_days."""
+    db.execute(insert(models.PlanRateSnapshot), snapshots)
+
+    days: dict[date, dict] = {}
+    for row in snapshots:
+        rate = row["rate_1000_cents"]
+        day = days.setdefault(row["observed_at"].date(), {
+            "snapshots": 0, "rated_snapshots": 0, "rate_1000_cents_sum": 0.0,
+            "min_rate_1000_cents": None, "max_rate_1000_cents": None,
+        })
+        day["snapshots"] += 1
+        if rate is not None:
+            day["rated_snapshots"] += 1
+            day["rate_1000_cents_sum"] += rate
+            low, high = day["min_rate_1000_cents"], day["max_rate_1000_cents"]
+            day["min_rate_1000_cents"] = rate if low is None else min(low, rate)
+            day["max_rate_1000_cents"] = rate if high is None else max(high, rate)
+
+    rollup = models.MarketRateDay
+    dialect = db.get_bind().dialect.name
+    stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(rollup).values(
+        [{"day": day, **totals} for day, totals in days.items()]
+    )
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(index_elements=["day"], set_={
+        "snapshots": rollup.snapshots + new.snapshots,
+        "rated_snapshots": rollup.rated_snapshots + new.rated_snapshots,
+        "rate_1000_cents_sum": rollup.rate_1000_cents_sum + new.rate_1000_cents_sum,
+        "min_rate_1000_cents": case(
+            (or_(rollup.min_rate_1000_cents.is_(None), new.min_rate_1000_cents < rollup.min_rate_1000_cents),
+             new.min_rate_1000_cents),
+            else_=rollup.min_rate_1000_cents,
+        ),
+        "max_rate_1000_cents": case(
+            (or_(rollup.max_rate_1000_cents.is_(None), new.max_rate_1000_cents > rollup.max_rate_1000_cents),
+             new.max_rate_1000_cents),
+            else_=rollup.max_rate_1000_cents,
+        ),
+    })
+    db.execute(stmt)
+
+
+_natural_key_checked: dict[str, bool] = {}
+
+
+def _has_plan_natural_key(db: Session) -> bool:
+    """True once the unique (provider_id, plan_name) index exists (see migrations)."""
+    bind = db.get_bind()
+    url = str(bind.url)
+    if not _natural_key_checked.get(url):
+        _natural_key_checked[url] = any(
+            index["unique"] and index["column_names"] == ["provider_id", "plan_name"]
+            for index in inspect(bind).get_indexes("plans")
+        )
+    return _natural_key_checked[url]
+
+
+def bulk_upsert_plans(
+    db: Session,
+    plans: Iterable[schemas.PlanCreate],
+    chunk_size: int = PLAN_UPSERT_CHUNK_SIZE,
+) -> dict:
+    """
+    Insert or update many plans, keyed by (provider_id, plan_name).
+
+    Each chunk costs one SELECT of the existing rows' content hashes and one
+    ``INSERT ... ON CONFLICT DO UPDATE`` (Postgres and SQLite) carrying only
+    the new and changed plans; plans whose ``plan_content_hash`` matches the
+    stored one are not written at all.  If a
+    plan appears twice, the last one wins.  New plans and plans whose price
+    fields changed also get a ``plan_rate_snapshots`` row.  Commits once at
+    the end.
+
+    Returns {"inserted": n, "updated": n, "unchanged": n}.
+    """
+    rows: dict[tuple, dict] = {}
+    for plan in plans:
+        row = plan.model_dump()
+        row["content_hash"] = plan_content_hash(row)
+        rows[(row["provider_id"], row["plan_name"])] = row
+
+    dialect = db.get_bind().dialect.name
+    use_on_conflict = dialect in ("postgresql", "sqlite") and _has_plan_natural_key(db)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    keys = list(rows)
+    # Prices are read too, to tell price changes (which get a snapshot) from other changes
+    price_columns = [getattr(models.Plan, field) for field in PLAN_PRICE_FIELDS]
+
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        existing = {
+            (row.provider_id, row.plan_name): row
+            for row in db.execute(
+                select(
+                    models.Plan.id, models.Plan.provider_id, models.Plan.plan_name, models.Plan.content_hash,
+                    *price_columns,
+                )
+                .where(tuple_(models.Plan.provider_id, models.Plan.plan_name).in_(chunk))
+            )
+        }
+
+        now = datetime.utcnow()
+        new_rows, changed_rows, snapshots = [], [], []
+        for key in chunk:
+            row = rows[key]
+            current = existing.get(key)
+            if current is None:
+                new_rows.append({**row, "last_updated": now})
+                counts["inserted"] += 1
+            elif current.content_hash != row["content_hash"]:
+                changed_rows.append({**row, "id": current.id, "last_updated": now})
+                counts["updated"] += 1
+                if _price_changed(current, row):
+                    snapshots.append(_snapshot_row(current.id, row, now))
+            else:
+                counts["unchanged"] += 1
+
+        if use_on_conflict:
+            values = new_rows + [{k: v for k, v in row.items() if k != "id"} for row in changed_rows]
+            if values:
+                stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(models.Plan).values(values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["provider_id", "plan_name"],
+                    set_={field: stmt.excluded[field] for field in (*PLAN_UPSERT_FIELDS, "content_hash", "last_updated")},
+                )
+                db.execute(stmt)
+        else:
+            # Databases without the natural key index (migration not yet run)
+            if new_rows:
+                db.execute(insert(models.Plan), new_rows)
+            if changed_rows:
+                db.execute(update(models.Plan), changed_rows)
+
+        if new_rows:
+            new_keys = [(row["provider_id"], row["plan_name"]) for row in new_rows]
+            for plan_id, provider_id, plan_name in db.execute(
+                select(models.Plan.id, models.Plan.provider_id, models.Plan.plan_name)
+                .where(tuple_(models.Plan.provider_id, models.Plan.plan_name).in_(new_keys))
+            ):
+                snapshots.append(_snapshot_row(plan_id, rows[(provider_id, plan_name)], now))
+        if snapshots:
+            _add_snapshots(db, snapshots)
+
+    db.commit()
+    if counts["inserted"] or counts["updated"]:
+        bump_generation("plans")
+    return counts
+
+
 # TDU CRUD Operations
-@cache_result(ttl=86400, key_prefix="tdus")  # Cache for 24 hours
+@cache_result(**CACHE_SETTINGS["get_tdus"])  # Fresh for 24 hours
 def get_tdus(db: Session, skip: int = 0, limit: int = 100) -> List[models.TDU]:
     """Get all TDUs from the database."""
     return db.execute(select(models.TDU).offset(skip).limit(limit)).scalars().all()
 
 
+@cache_result(**CACHE_SETTINGS["get_tdu"])
 def get_tdu(db: Session, tdu_id: int) -> Optional[models.TDU]:
     """Get a specific TDU by ID."""
     return db.execute(select(models.TDU).where(models.TDU.id == tdu_id)).scalar_one_or_none()
 
 
+@cache_result(**CACHE_SETTINGS["get_tdu_by_name"])
 def get_tdu_by_name(db: Session, name: str) -> Optional[models.TDU]:
     """Get a TDU by name."""
     return db.execute(select(models.TDU).where(models.TDU.name == name)).scalar_one_or_none()
@@ -139,6 +695,7 @@ def create_or_update_tdu(db: Session, tdu_data: schemas.TDUCreate) -> models.TDU
         db.add(existing)
         db.commit()
         db.refresh(existing)
+        bump_generation("tdus")
         return existing
     else:
         # Create new TDU
@@ -146,4 +703,5 @@ def create_or_update_tdu(db: Session, tdu_data: schemas.TDUCreate) -> models.TDU
         db.add(new_tdu)
         db.commit()
         db.refresh(new_tdu)
+        bump_generation("tdus")
         return new_tdu
\ No newline at end of file
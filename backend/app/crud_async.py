@@ -0,0 +1,124 @@
+"""
+Async versions of the read helpers in ``app.crud``, for ``async def`` endpoints.
+
+Each function takes an ``AsyncSession`` and mirrors its sync counterpart:
+same signature, same query (the builders are shared with ``crud``) and the
+same ``crud.CACHE_SETTINGS``, so the sync and async paths read and write
+the same cache entries.  Writes stay in ``crud``.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cache_async import cache_result_async
+from .crud import (
+    CACHE_SETTINGS,
+    _market_history_query,
+    _market_history_rows,
+    _needs_unrated_tail,
+    _plan_history_query,
+    _plans_query,
+    _provider_summaries_query,
+    _provider_version_query,
+    _providers_query,
+    _table_version_query,
+    _unrated_plans_query,
+    _version_from_row,
+)
+
+
+@cache_result_async(**CACHE_SETTINGS["get_providers"])
+async def get_providers(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[models.Provider]:
+    """Async ``crud.get_providers``; plans are eager-loaded with one SELECT ... IN."""
+    return (await db.execute(_providers_query(skip, limit, after_id))).scalars().all()
+
+
+@cache_result_async(**CACHE_SETTINGS["get_provider_summaries"])
+async def get_provider_summaries(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[dict]:
+    """Async ``crud.get_provider_summaries``."""
+    return [dict(row) for row in (await db.execute(_provider_summaries_query(skip, limit, after_id))).mappings()]
+
+
+@cache_result_async(**CACHE_SETTINGS["get_plans"])
+async def get_plans(
+    db: AsyncSession,
+    provider: Optional[str] = None,
+    plan_type: Optional[str] = None,
+    service_type: Optional[str] = None,
+    zip_code: Optional[str] = None,
+    contract_months: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[tuple] = None,
+) -> List[models.Plan]:
+    """Async ``crud.get_plans``: by rate_1000_cents (nulls last), then id."""
+    filters = (provider, plan_type, service_type, zip_code, contract_months)
+    plans = (await db.execute(_plans_query(*filters, skip, limit, after))).scalars().all()
+    if _needs_unrated_tail(plans, limit, after):
+        plans += (await db.execute(_unrated_plans_query(*filters, limit - len(plans)))).scalars().all()
+    return plans
+
+
+@cache_result_async(**CACHE_SETTINGS["get_plans_version"])
+async def get_plans_version(db: AsyncSession) -> dict:
+    """Async ``crud.get_plans_version``."""
+    version = _version_from_row(*(await db.execute(_table_version_query(models.Plan))).one())
+    provider_count, provider_max_id = (await db.execute(_provider_version_query())).one()
+    version["version"] += f":{provider_count}:{provider_max_id}"
+    return version
+
+
+@cache_result_async(**CACHE_SETTINGS["get_plan"])
+async def get_plan(db: AsyncSession, plan_id: int) -> Optional[models.Plan]:
+    return (await db.execute(select(models.Plan).where(models.Plan.id == plan_id))).scalar_one_or_none()
+
+
+@cache_result_async(**CACHE_SETTINGS["get_plan_history"])
+async def get_plan_history(
+    db: AsyncSession,
+    plan_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 1000,
+) -> List[models.PlanRateSnapshot]:
+    """Async ``crud.get_plan_history``."""
+    return (await db.execute(_plan_history_query(plan_id, start, end, limit))).scalars().all()
+
+
+@cache_result_async(**CACHE_SETTINGS["get_market_history"])
+async def get_market_history(db: AsyncSession, start: date, end: date) -> List[dict]:
+    """Async ``crud.get_market_history``."""
+    return _market_history_rows((await db.execute(_market_history_query(start, end))).scalars())
+
+
+@cache_result_async(**CACHE_SETTINGS["get_tdus_version"])
+async def get_tdus_version(db: AsyncSession) -> dict:
+    """Async ``crud.get_tdus_version``."""
+    return _version_from_row(*(await db.execute(_table_version_query(models.TDU))).one())
+
+
+@cache_result_async(**CACHE_SETTINGS["get_tdus"])
+async def get_tdus(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[models.TDU]:
+    """Get all TDUs from the database."""
+    return (await db.execute(select(models.TDU).offset(skip).limit(limit))).scalars().all()
+
+
+@cache_result_async(**CACHE_SETTINGS["get_tdu"])
+async def get_tdu(db: AsyncSession, tdu_id: int) -> Optional[models.TDU]:
+    """Get a specific TDU by ID."""
+    return (await db.execute(select(models.TDU).where(models.TDU.id == tdu_id))).scalar_one_or_none()
+
+
+@cache_result_async(**CACHE_SETTINGS["get_tdu_by_name"])
+async def get_tdu_by_name(db: AsyncSession, name: str) -> Optional[models.TDU]:
+    """Get a TDU by name."""
+    return (await db.execute(select(models.TDU).where(models.TDU.name == name))).scalar_one_or_none()
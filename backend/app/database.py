@@ -5,34 +5,328 @@ This module initializes a SQLAlchemy engine and session factory.  The engine
 configuration is controlled via an environment variable `DATABASE_URL`.  If
 `DATABASE_URL` is not defined, an in‑memory SQLite database is used by
 default.  A helper function `get_db()` yields a session for use in FastAPI
-dependencies.
+dependencies, and `get_async_db()` an ``AsyncSession`` for ``async def``
+read endpoints.  The async engine uses asyncpg for Postgres and aiosqlite
+for SQLite; its URL is derived from `DATABASE_URL` unless
+`ASYNC_DATABASE_URL` is set.
+
+With `DATABASE_READ_URL` set, async sessions send plain SELECTs to that
+read replica and everything else to the primary (see ``RoutingSession``).
+For ``DB_REPLICA_LAG_GRACE`` seconds after any write, in any worker, reads
+stay on the primary so a lagging replica never serves pre-ingest data.
+
+Connection pool settings come from the environment as well (see below) and
+the pool reports checkouts, wait time and overflow to the "db" metric group
+(``/admin/metrics``).  Size the pool so that workers x (DB_POOL_SIZE +
+DB_MAX_OVERFLOW) stays below the server's max_connections.  SQLite files
+get a tuning profile on connect (WAL journal etc., see below).
 """
 from __future__ import annotations
 
+import logging
 import os
-from sqlalchemy import create_engine
+import time
+
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import Select, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from . import cache, cache_async, metrics
+
+logger = logging.getLogger(__name__)
 
 # Read database URL from environment; fall back to SQLite.  SQLite is
 # convenient for local development but Postgres is recommended in
 # production.
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./plans.db")
 
-# When using SQLite, we must enable check_same_thread to allow multiple
-# threads to access the connection.  With other databases this is ignored.
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+# Connection pool, per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # Extra connections under burst load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Replace connections older than this
+# Pre-ping tests every connection on checkout (one extra round trip).  With
+# it disabled, stale connections are replaced by DB_POOL_RECYCLE, and a
+# statement that fails on a dead connection at the start of a transaction
+# is retried once on a fresh one.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# SQLite profile, applied to every new connection to a SQLite file.  WAL
+# lets readers run alongside a writer; with it, synchronous=NORMAL is still
+# crash-safe (a power loss can only drop the latest commits).
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "true").lower() == "true"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # Bytes of the file to memory-map
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -65536))  # Page cache; negative means KiB (64 MiB)
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # Milliseconds a writer waits for the lock
+
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# Seconds after a write during which reads stay on the primary.  Set it
+# above the replica's worst observed lag.
+DB_REPLICA_LAG_GRACE = float(os.getenv("DB_REPLICA_LAG_GRACE", 60))
+# How often a worker checks Redis for writes made by other workers
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 1))
+
+db_metrics = metrics.group("db")
+
+
+class _PoolMetricsMixin:
+    """Records checkout wait time, overflow and timeouts for a queue pool."""
+
+    metrics_label = "primary"
+
+    def _do_get(self):
+        label = self.metrics_label
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            db_metrics.inc(label, "checkout_timeouts")
+            raise
+        finally:
+            db_metrics.observe(label, "checkout_wait_seconds", time.perf_counter() - start)
+        if self.overflow() > overflow_before and self.overflow() > 0:
+            db_metrics.inc(label, "overflow_connections")
+        return connection
+
+
+class InstrumentedQueuePool(_PoolMetricsMixin, QueuePool):
+    """QueuePool that records checkout wait time, overflow and timeouts."""
+
+
+class InstrumentedAsyncQueuePool(_PoolMetricsMixin, AsyncAdaptedQueuePool):
+    """The asyncio engine's pool, with the same metrics."""
+
+
+def _instrument(engine, label: str) -> None:
+    """Report pool gauges for an engine under ``label``."""
+    pool = engine.pool
+    if isinstance(pool, _PoolMetricsMixin):
+        pool.metrics_label = label
+
+    if isinstance(pool, QueuePool):
+        db_metrics.set(label, "pool_size", pool.size())
+        db_metrics.set(label, "max_overflow", pool._max_overflow)
+
+    # checked_out is a gauge: +1 on checkout, -1 on checkin
+    event.listen(engine, "checkout", lambda *args: db_metrics.inc(label, "checked_out"))
+    event.listen(engine, "checkin", lambda *args: db_metrics.inc(label, "checked_out", -1))
+    event.listen(engine, "connect", lambda *args: db_metrics.inc(label, "connections_opened"))
+    event.listen(engine, "invalidate", lambda *args: db_metrics.inc(label, "connections_invalidated"))
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.split("://")[-1] in ("", "/"))
+
+
+def _engine_options(url: str, poolclass) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # When using SQLite, we must enable check_same_thread to allow multiple
+    # threads to access the connection.  With other databases this is ignored.
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        options.update(
+            poolclass=poolclass,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+def sqlite_pragmas() -> list[str]:
+    """The PRAGMA statements of the SQLite profile."""
+    return [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+    ]
+
+
+def _apply_sqlite_profile(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def _configure(engine, url: str, label: str) -> None:
+    """Instrument a new (sync) engine and apply the SQLite profile if enabled."""
+    _instrument(engine, label)
+    if SQLITE_TUNING and url.startswith("sqlite") and not _is_memory_sqlite(url):
+        event.listen(engine, "connect", _apply_sqlite_profile)
+
+
+def make_engine(url: str, label: str = "primary"):
+    """Create an engine with the configured pool, metrics and SQLite profile."""
+    new_engine = create_engine(url, **_engine_options(url, InstrumentedQueuePool))
+    _configure(new_engine, url, label)
+    return new_engine
+
+
+# asyncio driver for each backend the sync URLs use
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "postgres": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """
+    The asyncio form of a sync database URL, e.g. ``postgresql+psycopg2://``
+    becomes ``postgresql+asyncpg://`` and ``sqlite:///`` ``sqlite+aiosqlite:///``.
+
+    libpq's ``sslmode`` query parameter becomes asyncpg's ``ssl``, which
+    takes the same values; asyncpg rejects ``sslmode`` as an argument.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend!r}; set ASYNC_DATABASE_URL")
+    backend = "postgresql" if backend == "postgres" else backend
+    if backend == "postgresql" and "sslmode" in parsed.query:
+        query = dict(parsed.query)
+        sslmode = query.pop("sslmode")
+        query.setdefault("ssl", sslmode)
+        parsed = parsed.set(query=query)
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def make_async_engine(url: str, label: str = "primary_async") -> AsyncEngine:
+    """Create an asyncio engine with the configured pool, metrics and SQLite profile."""
+    new_engine = create_async_engine(url, **_engine_options(url, InstrumentedAsyncQueuePool))
+    _configure(new_engine.sync_engine, url, label)
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL)
+
+
+class RetryingSession(Session):
+    """
+    Session that retries the first statement of a transaction once if its
+    connection turned out to be dead.  Nothing has run in the transaction at
+    that point, so replaying the statement is safe.  Used when pre-ping is
+    disabled.
+    """
+
+    def execute(self, *args, **kwargs):
+        fresh = not self.in_transaction()
+        try:
+            return super().execute(*args, **kwargs)
+        except DBAPIError as e:
+            if not (fresh and e.connection_invalidated):
+                raise
+            logger.warning(f"[Database] Connection lost, retrying on a new connection: {e.orig}")
+            db_metrics.inc(getattr(self.get_bind().pool, "metrics_label", "primary"), "disconnect_retries")
+            self.rollback()
+            return super().execute(*args, **kwargs)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a read replica, when given one.
+
+    Flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE and anything else
+    go to the primary, and so does every statement after the session's
+    first write, so a session always reads its own writes.
+    """
+
+    def __init__(self, *args, replica=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+        self.primary_only = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.replica is None or self.primary_only:
+            return primary
+        if self._flushing or not (isinstance(clause, Select) and clause._for_update_arg is None):
+            self.primary_only = True
+            return primary
+        return self.replica
+
+
+class RetryingRoutingSession(RetryingSession, RoutingSession):
+    """RoutingSession with RetryingSession's dead-connection retry."""
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_pre_ping=True,
-)
 
 # Create a session factory.  Sessions are not thread‑safe; each request
 # should use its own session instance.
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=engine,
+    class_=Session if DB_POOL_PRE_PING else RetryingSession,
+)
+
+
+# ---------------------------------------------------------------------------
+# Replica lag guard
+# ---------------------------------------------------------------------------
+# A commit that wrote anything pushes "primary until" forward, in this
+# process and in Redis for the other workers.
+PRIMARY_UNTIL_KEY = "db:primary_until"
+_primary_until = 0.0
+_primary_until_checked = 0.0
+
+
+def note_primary_write() -> None:
+    """Keep reads on the primary for DB_REPLICA_LAG_GRACE seconds."""
+    global _primary_until
+    if not DATABASE_READ_URL:
+        return
+    _primary_until = time.time() + DB_REPLICA_LAG_GRACE
+    client = cache.get_redis()
+    if client:
+        try:
+            client.set(PRIMARY_UNTIL_KEY, _primary_until, px=int(DB_REPLICA_LAG_GRACE * 1000))
+        except Exception as e:
+            cache._redis_error(e, "replica lag guard")
+
+
+async def replica_lagging() -> bool:
+    """True while a recent write may not have reached the replica yet."""
+    global _primary_until, _primary_until_checked
+    now = time.time()
+    if now >= _primary_until and now - _primary_until_checked >= DB_REPLICA_LAG_CHECK_INTERVAL:
+        _primary_until_checked = now
+        client = await cache_async.get_async_redis()
+        if client:
+            try:
+                value = await client.get(PRIMARY_UNTIL_KEY)
+            except Exception as e:
+                await cache_async._redis_error(e, "replica lag guard")
+            else:
+                if value:
+                    _primary_until = max(_primary_until, float(value))
+    return now < _primary_until
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_dml(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_flush(session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _note_commit(session) -> None:
+    if session.info.pop("wrote", False):
+        note_primary_write()
 
 
 def get_db() -> Session:
@@ -41,4 +335,58 @@ def get_db() -> Session:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# The async engines are created on first use, so processes that never serve
+# an async endpoint (scripts, the scheduler) do not need the asyncio drivers.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL")
+async_engine: Optional[AsyncEngine] = None
+async_read_engine: Optional[AsyncEngine] = None
+
+# Rows stay usable after commit; an AsyncSession cannot lazy-load them later
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession if DB_POOL_PRE_PING else RetryingRoutingSession,
+)
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the asyncio engine, creating it (and the replica's) on first use."""
+    global async_engine, async_read_engine
+    if async_engine is None:
+        if DATABASE_READ_URL:
+            async_read_engine = make_async_engine(
+                ASYNC_DATABASE_READ_URL or async_database_url(DATABASE_READ_URL), label="replica_async"
+            )
+        async_engine = make_async_engine(ASYNC_DATABASE_URL or async_database_url(DATABASE_URL))
+        AsyncSessionLocal.configure(bind=async_engine)
+    return async_engine
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Yield a new ``AsyncSession`` for FastAPI dependencies of async endpoints.
+
+    Its reads go to the replica, if configured and not lagging behind a
+    recent write.
+    """
+    get_async_engine()
+    replica = None
+    if async_read_engine is not None:
+        if await replica_lagging():
+            db_metrics.inc("replica_async", "primary_fallbacks")
+        else:
+            replica = async_read_engine.sync_engine
+    async with AsyncSessionLocal(replica=replica) as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """Close the asyncio engines' connections (called on application shutdown)."""
+    for pending in (async_engine, async_read_engine):
+        if pending is not None:
+            await pending.dispose()
@@ -0,0 +1,253 @@
+"""
+HTTP response caching: conditional requests and pre-serialized bodies.
+
+Listing endpoints derive a dataset version from the database (see
+``crud.get_plans_version`` and ``crud.get_tdus_version``).  The version
+plus the normalized query string gives a strong ETag, so polling clients
+that send ``If-None-Match`` get an empty 304 instead of a full body.
+
+The same version keys a cache of fully encoded JSON bodies.  A hit is
+returned as a raw ``Response``, skipping ``response_model`` validation and
+JSON encoding entirely.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from .cache import get_cache, single_flight
+from .cache_async import get_cache_async, single_flight_async
+
+# Lifetime of cached response bodies.  Keys embed the dataset version, so
+# new data never waits for this to expire.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+
+# Clients may keep the body but must revalidate before reusing it
+CACHE_CONTROL = "no-cache"
+
+
+def normalized_query(request: Request) -> str:
+    """Return the request's query parameters, percent-encoded, in a stable order."""
+    return urlencode(sorted(request.query_params.multi_items()))
+
+
+def make_etag(version: str, *parts) -> str:
+    """Build a strong ETag from a dataset version and representation parts."""
+    raw = "|".join([version, *(str(part) for part in parts)])
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _parse_last_modified(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    last_modified = datetime.fromisoformat(value)
+    if last_modified.tzinfo is None:
+        # Database timestamps are naive UTC (datetime.utcnow)
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0)
+
+
+def validator_headers(etag: str, last_modified: Optional[str] = None) -> dict[str, str]:
+    """Headers that let clients revalidate the response later."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    parsed = _parse_last_modified(last_modified)
+    if parsed is not None:
+        headers["Last-Modified"] = format_datetime(parsed, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str] = None) -> bool:
+    """
+    Evaluate ``If-None-Match`` / ``If-Modified-Since`` for a GET request.
+
+    ``If-None-Match`` takes precedence; ``If-Modified-Since`` is only used
+    when the client sent no entity tags (RFC 9110, section 13.2.2).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    parsed = _parse_last_modified(last_modified)
+    if if_modified_since and parsed is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parsed <= since
+    return False
+
+
+def not_modified_response(etag: str, last_modified: Optional[str] = None) -> Response:
+    """An empty 304 response carrying the current validators."""
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def check_conditional(request: Request, response: Response, version: dict) -> Optional[Response]:
+    """
+    Apply conditional request handling for a versioned GET endpoint.
+
+    Returns a 304 response if the client's copy is current.  Otherwise sets
+    the validator headers on ``response`` and returns None, and the endpoint
+    builds the body as usual.
+
+    ``If-None-Match: *`` matches any current representation, so endpoints
+    for a single item must answer 404 for a missing item before calling this.
+
+    Usage:
+        not_modified = check_conditional(request, response, crud.get_plans_version(db))
+        if not_modified is not None:
+            return not_modified
+    """
+    etag = make_etag(version["version"], request.url.path, normalized_query(request))
+    if is_not_modified(request, etag, version["last_modified"]):
+        return not_modified_response(etag, version["last_modified"])
+    response.headers.update(validator_headers(etag, version["last_modified"]))
+    return None
+
+
+_list_adapters: dict[type, TypeAdapter] = {}
+
+
+def dump_json_list(schema: type, rows: list) -> bytes:
+    """Serialize ORM rows or schema objects exactly as ``response_model=list[schema]`` would."""
+    adapter = _list_adapters.get(schema)
+    if adapter is None:
+        adapter = _list_adapters[schema] = TypeAdapter(list[schema])
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def _body_key(prefix: str, version: dict, params: dict) -> str:
+    # Percent-encode so a value containing "&" or "=" can't pose as extra parameters
+    canonical = urlencode(sorted((k, v) for k, v in params.items() if v is not None))
+    return f"http:{prefix}:" + make_etag(version["version"], canonical).strip('"')
+
+
+def cached_body(
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], bytes],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> bytes:
+    """
+    Return an encoded response body, cached per dataset version and parameters.
+
+    ``params`` are the endpoint's parsed query parameters (None values are
+    ignored); ``build`` produces the body bytes on a miss (see
+    ``dump_json_list``).
+    """
+    key = _body_key(prefix, version, params)
+    body: Any = get_cache(key)
+    if not isinstance(body, bytes):
+        body = single_flight(key, build, ttl)
+    return body
+
+
+def cached_page(
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], tuple[bytes, Optional[str]]],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> tuple[bytes, Optional[str]]:
+    """
+    Like ``cached_body`` for paginated listings: ``build`` returns the body
+    and the next page's cursor (None on the last page), cached together.
+    """
+    def build_framed() -> bytes:
+        return _frame_page(*build())
+
+    return _unframe_page(cached_body(prefix, version, params, build_framed, ttl))
+
+
+def _frame_page(body: bytes, next_cursor: Optional[str]) -> bytes:
+    # Cursors are URL-safe base64, so the first newline ends the cursor
+    return (next_cursor or "").encode("ascii") + b"\n" + body
+
+
+def _unframe_page(framed: bytes) -> tuple[bytes, Optional[str]]:
+    next_cursor, body = framed.split(b"\n", 1)
+    return body, next_cursor.decode("ascii") or None
+
+
+async def cached_body_async(
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], Awaitable[bytes]],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> bytes:
+    """``cached_body`` for async endpoints; ``build`` is a coroutine function."""
+    key = _body_key(prefix, version, params)
+    body: Any = await get_cache_async(key)
+    if not isinstance(body, bytes):
+        body = await single_flight_async(key, build, ttl)
+    return body
+
+
+async def cached_page_async(
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], Awaitable[tuple[bytes, Optional[str]]]],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> tuple[bytes, Optional[str]]:
+    """``cached_page`` for async endpoints; entries are shared with it."""
+    async def build_framed() -> bytes:
+        return _frame_page(*await build())
+
+    return _unframe_page(await cached_body_async(prefix, version, params, build_framed, ttl))
+
+
+def json_response(response: Response, body: bytes) -> Response:
+    """
+    Wrap encoded JSON bytes in a raw Response.
+
+    Headers already set on ``response`` (e.g. by ``check_conditional``) are
+    carried over.
+    """
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_json_response(
+    response: Response,
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], bytes],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> Response:
+    """
+    Return a JSON response whose encoded body is cached per dataset version.
+
+    Usage:
+        return cached_json_response(response, "tdus", version, {"skip": skip, "limit": limit},
+                                    lambda: dump_json_list(schemas.TDU, crud.get_tdus(db, skip=skip, limit=limit)))
+    """
+    return json_response(response, cached_body(prefix, version, params, build, ttl))
+
+
+async def cached_json_response_async(
+    response: Response,
+    prefix: str,
+    version: dict,
+    params: dict,
+    build: Callable[[], Awaitable[bytes]],
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> Response:
+    """``cached_json_response`` for async endpoints; ``build`` is a coroutine function."""
+    return json_response(response, await cached_body_async(prefix, version, params, build, ttl))
@@ -20,10 +20,12 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from .database import engine
+from .database import dispose_async_engine, engine
 from . import models
+from .migrations import ensure_plan_columns
 from .api import plans as plans_router, admin as admin_router, tdus as tdus_router
 from .scheduler import start_scheduler, stop_scheduler
+from .cache_async import close_async_redis
 from .logging_config import setup_logging
 
 # Initialize logging
@@ -32,6 +34,8 @@ logger = logging.getLogger(__name__)
 
 # Create database tables on startup
 models.Base.metadata.create_all(bind=engine)
+# Columns added to existing tables since; needed even with RUN_MIGRATIONS=false
+ensure_plan_columns(engine)
 
 # Initialize rate limiter
 limiter = Limiter(key_func=get_remote_address, default_limits=["100/hour"])
@@ -64,6 +68,8 @@ async def lifespan(app: FastAPI):
     logger.info("Application shutting down...")
     logger.info("Stopping background scheduler...")
     stop_scheduler()
+    await close_async_redis()
+    await dispose_async_engine()
 
 app = FastAPI(
     title="Texas Commercial Energy Market Analyzer",
@@ -88,7 +94,8 @@ app.add_middleware(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST"],  # Only allow needed methods
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match", "If-Modified-Since"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor"],
 )
 
 # Prevent host header attacks - allow Railway domains
@@ -0,0 +1,109 @@
+"""
+In-process metrics: labelled counters, gauges and latency histograms.
+
+Subsystems register a named group (e.g. "cache") and record counters and
+timings per label (e.g. the cache key prefix).  ``snapshot()`` returns
+everything as plain dicts for the /admin/metrics endpoint.  Values are per
+worker process.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from collections import Counter
+
+# Upper bounds in seconds, from sub-millisecond L1 hits to slow queries
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": buckets,
+        }
+
+
+class MetricGroup:
+    """Counters and histograms for one subsystem, keyed by label."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._counters: dict[str, Counter] = {}
+        self._histograms: dict[str, dict[str, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label: str, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters.setdefault(label, Counter())[counter] += amount
+
+    def observe(self, label: str, histogram: str, value: float) -> None:
+        with self._lock:
+            histograms = self._histograms.setdefault(label, {})
+            if histogram not in histograms:
+                histograms[histogram] = Histogram()
+            histograms[histogram].observe(value)
+
+    def set(self, label: str, gauge: str, value: float) -> None:
+        """Record the current value of a gauge (e.g. connections checked out)."""
+        with self._lock:
+            self._counters.setdefault(label, Counter())[gauge] = value
+
+    def get(self, label: str, counter: str) -> float:
+        with self._lock:
+            return self._counters.get(label, Counter())[counter]
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            labels = set(self._counters) | set(self._histograms)
+            result = {}
+            for label in sorted(labels):
+                entry: dict = dict(self._counters.get(label, {}))
+                for name, histogram in self._histograms.get(label, {}).items():
+                    entry[name] = histogram.snapshot()
+                result[label] = entry
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_groups: dict[str, MetricGroup] = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str) -> MetricGroup:
+    """Return the metric group with this name, creating it on first use."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = MetricGroup(name)
+        return _groups[name]
+
+
+def snapshot() -> dict[str, dict]:
+    """All metric groups as plain dicts."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {metric_group.name: metric_group.snapshot() for metric_group in groups}
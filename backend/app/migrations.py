@@ -5,12 +5,226 @@ This module handles schema changes that need to be applied to existing databases
 when deploying new versions. It runs automatically on application startup.
 """
 import logging
-from sqlalchemy import inspect, text
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index, delete, inspect, select, text, update
 from sqlalchemy.orm import Session
 
+from . import models
+
 logger = logging.getLogger(__name__)
 
 
+def _index_ddl(index: Index, concurrently: bool, name: Optional[str] = None) -> str:
+    columns = ", ".join(column.name for column in index.columns)
+    return (
+        f"CREATE {'UNIQUE ' if index.unique else ''}INDEX {'CONCURRENTLY ' if concurrently else ''}"
+        f"IF NOT EXISTS {name or index.name} ON {index.table.name} ({columns})"
+    )
+
+
+def _duplicate_plan_keys(db: Session) -> int:
+    """Number of (provider_id, plan_name) pairs that occur more than once."""
+    return db.execute(text("""
+        SELECT COUNT(*) FROM (
+            SELECT provider_id, plan_name FROM plans
+            GROUP BY provider_id, plan_name HAVING COUNT(*) > 1
+        ) AS duplicates
+    """)).scalar()
+
+
+def _rebuild_index(conn, index: Index, postgres: bool) -> None:
+    """Replace an existing index of the same name with ``index``'s definition."""
+    if not postgres:
+        # SQLite cannot rename indexes; it builds them quickly enough to drop first
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        conn.execute(text(_index_ddl(index, concurrently=False)))
+        return
+    temporary = f"{index.name}_rebuild"
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {temporary}"))
+    conn.execute(text(_index_ddl(index, concurrently=True, name=temporary)))
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+    conn.execute(text(f"ALTER INDEX {temporary} RENAME TO {index.name}"))
+
+
+def create_plan_indexes(db: Session):
+    """
+    Create the indexes declared on ``models.Plan`` that are missing, and
+    rebuild those whose columns differ from the declaration (e.g. the
+    listing indexes that gained an ``id`` tiebreaker).
+
+    On Postgres they are built with CREATE INDEX CONCURRENTLY, so reads and
+    scrapes keep running during the build.  CONCURRENTLY cannot run inside a
+    transaction, so each statement gets its own autocommit connection.  A
+    failed concurrent build leaves an INVALID index behind; it is dropped and
+    rebuilt on the next run.  On Postgres a changed index is rebuilt under a
+    temporary name and swapped in, so queries are never left without it.
+    """
+    bind = db.get_bind()
+    postgres = bind.dialect.name == "postgresql"
+    existing = {index["name"]: index["column_names"] for index in inspect(bind).get_indexes("plans")}
+
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if postgres:
+            invalid = conn.execute(text("""
+                SELECT c.relname FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                WHERE t.relname = 'plans' AND NOT i.indisvalid
+            """)).scalars().all()
+            for name in invalid:
+                logger.info(f"[Migrations] Dropping invalid index {name}...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                existing.pop(name, None)
+
+        for index in models.Plan.__table__.indexes:
+            columns = [column.name for column in index.columns]
+            if existing.get(index.name) == columns:
+                logger.info(f"[Migrations] OK - {index.name} exists")
+                continue
+            if index.name in existing:
+                logger.info(
+                    f"[Migrations] Rebuilding {index.name}: columns {existing[index.name]} -> {columns}..."
+                )
+                _rebuild_index(conn, index, postgres)
+                logger.info(f"[Migrations] OK - Rebuilt {index.name}")
+                continue
+            if index.unique:
+                duplicates = _duplicate_plan_keys(db)
+                if duplicates:
+                    logger.warning(
+                        f"[Migrations] Skipping {index.name}: {duplicates} duplicate "
+                        f"(provider_id, plan_name) keys must be removed first"
+                    )
+                    continue
+            logger.info(f"[Migrations] Creating index {index.name}...")
+            conn.execute(text(_index_ddl(index, concurrently=postgres)))
+            logger.info(f"[Migrations] OK - Created {index.name}")
+
+
+def ensure_plan_columns(bind) -> None:
+    """
+    Add plan columns that the ``Plan`` model maps but an existing table lacks.
+
+    Runs on every startup, next to ``create_all`` and regardless of
+    RUN_MIGRATIONS: every Plan SELECT names these columns, so the app cannot
+    serve plans without them.  Adding a nullable column is cheap on both
+    SQLite and Postgres.  The hashes themselves are filled in by
+    ``backfill_plan_hashes`` (Migration 4) or by the next ingest.
+    """
+    inspector = inspect(bind)
+    if 'plans' not in inspector.get_table_names():
+        return
+    columns = [col['name'] for col in inspector.get_columns('plans')]
+    if 'content_hash' not in columns:
+        logger.info("[Migrations] Adding content_hash column to plans table...")
+        with bind.begin() as conn:
+            conn.execute(text("ALTER TABLE plans ADD COLUMN content_hash VARCHAR(40)"))
+        logger.info("[Migrations] OK - Added content_hash column")
+
+
+def backfill_plan_hashes(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Fill in ``plans.content_hash`` where it is missing.
+
+    Without a hash, the next ingest would rewrite every plan once.
+    ``last_updated`` is written back unchanged, so the backfill does not look
+    like new data.  Returns the number of plans hashed.
+    """
+    from .crud import PLAN_UPSERT_FIELDS, plan_content_hash
+
+    columns = [getattr(models.Plan, field) for field in PLAN_UPSERT_FIELDS]
+    rows = db.execute(
+        select(models.Plan.id, models.Plan.last_updated, *columns).where(models.Plan.content_hash.is_(None))
+    ).mappings().all()
+    for start in range(0, len(rows), chunk_size):
+        db.execute(update(models.Plan), [
+            {"id": row["id"], "last_updated": row["last_updated"], "content_hash": plan_content_hash(row)}
+            for row in rows[start:start + chunk_size]
+        ])
+    db.commit()
+    return len(rows)
+
+
+def merge_alias_providers(db: Session) -> int:
+    """
+    Merge providers whose names are aliases of one canonical provider (e.g.
+    "TXU" and "TXU Energy") into a single row, and return how many rows were
+    merged away.
+
+    The row named exactly as the canonical name is kept, else the oldest.
+    Plans move to it; where both rows have a plan of the same name, the more
+    recently updated one is kept and the other's rate snapshots are moved
+    onto it, so no price history is lost.
+    """
+    from .cache import bump_generation
+    from .scraping.provider_urls import canonical_provider_name
+
+    groups: dict[str, list] = {}
+    for provider_id, name in db.execute(select(models.Provider.id, models.Provider.name).order_by(models.Provider.id)):
+        groups.setdefault(canonical_provider_name(name), []).append((provider_id, name))
+
+    merged = 0
+    for canonical, rows in groups.items():
+        if len(rows) < 2:
+            continue
+        target = next((provider_id for provider_id, name in rows if name == canonical), rows[0][0])
+        for provider_id, name in rows:
+            if provider_id == target:
+                continue
+            logger.info(f"[Migrations] Merging provider {name!r} into {canonical!r}...")
+            _move_provider_plans(db, provider_id, target)
+            db.execute(delete(models.Provider).where(models.Provider.id == provider_id))
+            merged += 1
+    db.commit()
+    if merged:
+        bump_generation("providers")
+        bump_generation("plans")
+    return merged
+
+
+def _move_provider_plans(db: Session, source_id: int, target_id: int) -> None:
+    Plan, Snapshot = models.Plan, models.PlanRateSnapshot
+    existing = _plans_by_name(db, target_id)
+    for name, (plan_id, last_updated) in _plans_by_name(db, source_id).items():
+        if name not in existing:
+            continue
+        other_id, other_updated = existing[name]
+        if (last_updated or datetime.min) > (other_updated or datetime.min):
+            keep, drop = plan_id, other_id
+        else:
+            keep, drop = other_id, plan_id
+        db.execute(update(Snapshot).where(Snapshot.plan_id == drop).values(plan_id=keep))
+        db.execute(delete(Plan).where(Plan.id == drop))
+    db.execute(update(Plan).where(Plan.provider_id == source_id).values(provider_id=target_id))
+
+
+def _plans_by_name(db: Session, provider_id: int) -> dict:
+    rows = db.execute(
+        select(models.Plan.plan_name, models.Plan.id, models.Plan.last_updated)
+        .where(models.Plan.provider_id == provider_id)
+    )
+    return {name: (plan_id, last_updated) for name, plan_id, last_updated in rows}
+
+
+def backfill_market_days(db: Session) -> bool:
+    """
+    Build ``market_rate_days`` from plan_rate_snapshots if the rollup is
+    still empty; ingest keeps it current from then on.  Returns True if it
+    was built.
+    """
+    from .crud import rebuild_market_days
+
+    if db.execute(select(models.MarketRateDay.day).limit(1)).first() is not None:
+        return False
+    if db.execute(select(models.PlanRateSnapshot.id).limit(1)).first() is None:
+        return False
+    rebuild_market_days(db)
+    db.commit()
+    return True
+
+
 def run_migrations(db: Session):
     """
     Run all pending database migrations.
@@ -59,6 +273,27 @@ def run_migrations(db: Session):
         else:
             logger.info("[Migrations] OK - tdus table exists")
 
+        # Migration 3: Natural key and query indexes on plans
+        if 'plans' in inspector.get_table_names():
+            create_plan_indexes(db)
+
+        # Migration 4: Content hash on plans, for skipping no-op ingest writes
+        if 'plans' in inspector.get_table_names():
+            ensure_plan_columns(db.get_bind())
+            hashed = backfill_plan_hashes(db)
+            if hashed:
+                logger.info(f"[Migrations] OK - Hashed {hashed} plans")
+
+        # Migration 5: One provider row per canonical name
+        if 'providers' in inspector.get_table_names():
+            merged = merge_alias_providers(db)
+            if merged:
+                logger.info(f"[Migrations] OK - Merged {merged} alias providers")
+
+        # Migration 6: Market history rollup, built from the snapshots taken before it existed
+        if 'plan_rate_snapshots' in inspector.get_table_names() and backfill_market_days(db):
+            logger.info("[Migrations] OK - Built market_rate_days from plan_rate_snapshots")
+
         logger.info("[Migrations] All migrations completed")
 
     except Exception as e:
@@ -5,13 +5,15 @@ This module defines the database schema for providers, plans, and TDUs.
 
 - Providers: Retail electric providers (REPs) such as Reliant, Gexa, TXU and Direct Energy
 - Plans: Individual electricity plans offered by providers, including pricing tiers
+- Plan rate snapshots: Append-only price history of each plan
+- Market rate days: Per-day rollup of the snapshots, for market-wide history
 - TDUs: Transmission and Distribution Utilities that deliver electricity to customers
 """
 from __future__ import annotations
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import BigInteger, Column, Date, Integer, String, Float, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship, declarative_base
-from datetime import datetime
+from datetime import date, datetime
 
 Base = declarative_base()
 
@@ -31,6 +33,15 @@ class Provider(Base):
 
 class Plan(Base):
     __tablename__ = "plans"
+    __table_args__ = (
+        # Natural key used by crud.create_or_update_plan; also serves the provider filter
+        Index("uq_plans_provider_plan_name", "provider_id", "plan_name", unique=True),
+        # crud.get_plans: equality filters followed by ORDER BY rate_1000_cents, id
+        # (the id column also serves keyset pagination)
+        Index("ix_plans_service_zip_rate", "service_type", "zip_code", "rate_1000_cents", "id"),
+        Index("ix_plans_service_contract_rate", "service_type", "contract_months", "rate_1000_cents", "id"),
+        Index("ix_plans_rate", "rate_1000_cents", "id"),
+    )
 
     id: int = Column(Integer, primary_key=True, index=True)
     provider_id: int = Column(Integer, ForeignKey("providers.id"), nullable=False)
@@ -49,7 +60,10 @@ class Plan(Base):
     base_monthly_fee: float = Column(Float, nullable=True)
     renewable_percent: int = Column(Integer, nullable=True)
     special_features: str = Column(String, nullable=True)
-    last_updated: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # SHA-1 of the normalized plan fields (crud.plan_content_hash); ingest
+    # compares it to skip writes for plans that did not change
+    content_hash: str = Column(String(40), nullable=True)
+    last_updated: datetime = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     provider = relationship("Provider", back_populates="plans")
 
@@ -57,6 +71,63 @@ class Plan(Base):
         return f"Plan(id={self.id}, provider_id={self.provider_id}, plan_name={self.plan_name})"
 
 
+class PlanRateSnapshot(Base):
+    """
+    A plan's prices as observed at one point in time.
+
+    Append-only: ingest adds a row when a plan is first seen and whenever
+    one of its price fields changes (see ``crud.PLAN_PRICE_FIELDS``), so a
+    plan's rows ordered by ``observed_at`` are its price history.
+    """
+    __tablename__ = "plan_rate_snapshots"
+    __table_args__ = (
+        # /plans/{plan_id}/history: one plan's rows in time order
+        Index("ix_plan_rate_snapshots_plan_observed", "plan_id", "observed_at"),
+        # Date ranges, for rebuilding market_rate_days.  Rows are appended in
+        # observed_at order, so on Postgres a BRIN index covers tens of
+        # millions of rows in a few pages; other databases get a B-tree.
+        Index("ix_plan_rate_snapshots_observed", "observed_at", postgresql_using="brin"),
+    )
+
+    id: int = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    plan_id: int = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), nullable=False)
+    observed_at: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+    rate_500_cents: float = Column(Float, nullable=True)
+    rate_1000_cents: float = Column(Float, nullable=True)
+    rate_2000_cents: float = Column(Float, nullable=True)
+    monthly_bill_1000: float = Column(Float, nullable=True)
+    monthly_bill_2000: float = Column(Float, nullable=True)
+    early_termination_fee: float = Column(Float, nullable=True)
+    base_monthly_fee: float = Column(Float, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"PlanRateSnapshot(plan_id={self.plan_id}, observed_at={self.observed_at}, rate_1000_cents={self.rate_1000_cents})"
+
+
+class MarketRateDay(Base):
+    """
+    The plan_rate_snapshots of one day, aggregated.
+
+    Ingest folds each snapshot it writes into its day's row (see
+    ``crud.rebuild_market_days`` for recomputing days from the snapshots),
+    so market-wide history reads one row per day instead of scanning every
+    snapshot in the range.  The rates summarize the prices plans changed to
+    that day, not every plan on the market.
+    """
+    __tablename__ = "market_rate_days"
+
+    day: date = Column(Date, primary_key=True)
+    snapshots: int = Column(Integer, nullable=False, default=0)
+    # Snapshots with a rate_1000_cents, and the sum of those rates (for the average)
+    rated_snapshots: int = Column(Integer, nullable=False, default=0)
+    rate_1000_cents_sum: float = Column(Float, nullable=False, default=0.0)
+    min_rate_1000_cents: float = Column(Float, nullable=True)
+    max_rate_1000_cents: float = Column(Float, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"MarketRateDay(day={self.day}, snapshots={self.snapshots})"
+
+
 class TDU(Base):
     """
     Transmission and Distribution Utility (TDU) model.
@@ -83,7 +154,7 @@ class TDU(Base):
     delivery_charge_per_kwh: float = Column(Float, nullable=True)  # Cents per kWh
 
     # Metadata
-    last_updated: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_updated: datetime = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     rate_effective_date: str = Column(String, nullable=True)  # e.g., "2025-03-01"
 
     def __repr__(self) -> str:
@@ -0,0 +1,41 @@
+"""
+Opaque cursor tokens for keyset pagination.
+
+A cursor holds the sort key of the last row on a page, e.g.
+``(rate_1000_cents, id)`` for plans.  The next page starts right after that
+row, so deep pages cost the same as the first one and rows written by an
+ingest between requests do not shift the pages.  Tokens are URL-safe
+base64 of a JSON array; clients should treat them as opaque.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode a row's sort key as an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(token: str, size: int) -> tuple:
+    """
+    Decode a cursor made by ``encode_cursor`` with ``size`` values.
+
+    Raises ValueError for malformed or tampered tokens.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    if any(value is not None and not isinstance(value, (int, float)) for value in values):
+        raise ValueError("Invalid cursor")
+    return tuple(values)
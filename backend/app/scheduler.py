@@ -20,6 +20,8 @@ from .database import SessionLocal
 from .scraping import scraper, energybot_scraper_v2  # REAL data scrapers
 from .scraping.provider_urls import get_plan_url
 from . import crud, schemas
+from .cache import batch_invalidation, bump_generation
+from .warming import warm_plan_caches
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +31,7 @@ logger = logging.getLogger(__name__)
 scheduler = BackgroundScheduler()
 
 
+@batch_invalidation()
 def scrape_real_data_job():
     """
     Background job to scrape REAL electricity plans from live sources.
@@ -38,39 +41,38 @@ def scrape_real_data_job():
     Sources:
     - Residential: Legacy scraper (PowerChoiceTexas, provider sites)
     - Commercial: EnergyBot v2 (JSON-LD structured data)
+
+    Returns the ingest counts: changed (inserted + updated), unchanged,
+    inserted and updated; None if the scrape failed.
     """
     logger.info(f"[Scheduler] Starting REAL DATA scrape at {datetime.now()}")
     logger.info("[Scheduler] NO SAMPLE DATA - ONLY LIVE SOURCES")
 
     db: Session = SessionLocal()
-    total_added = 0
-    total_updated = 0
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0}
 
     try:
+        providers = crud.ProviderResolver(db)
+
         # 1. Scrape REAL residential plans
         logger.info("[Scheduler] Scraping REAL residential plans from PowerChoiceTexas...")
         residential_plans = scraper.scrape_all()
         logger.info(f"[Scheduler] Retrieved {len(residential_plans)} REAL residential plans")
 
+        provider_ids = providers.resolve(plan_data.get("provider_name") for plan_data in residential_plans)
+        plan_creates = []
         for plan_data in residential_plans:
             try:
-                # Get or create provider
                 provider_name = plan_data.get("provider_name")
                 if not provider_name:
                     continue
 
-                provider = crud.get_provider_by_name(db, provider_name)
-                if not provider:
-                    provider = crud.create_provider(
-                        db, schemas.ProviderCreate(name=provider_name)
-                    )
-
                 # Get plan URL
                 plan_url = get_plan_url(provider_name, plan_data.get("plan_name"))
 
                 # Create plan object
                 plan_create = schemas.PlanCreate(
-                    provider_id=provider.id,
+                    provider_id=provider_ids[provider_name],
                     plan_name=plan_data["plan_name"],
                     plan_url=plan_url,
                     plan_type=plan_data.get("plan_type", "Fixed"),
@@ -87,54 +89,36 @@ def scrape_real_data_job():
                     renewable_percent=plan_data.get("renewable_percent", 0.0),
                     special_features=plan_data.get("special_features", "")
                 )
-
-                # Check if plan exists
-                from .models import Plan
-                existing = db.query(Plan).filter(
-                    Plan.provider_id == provider.id,
-                    Plan.plan_name == plan_create.plan_name
-                ).first()
-
-                if existing:
-                    # Update existing plan
-                    for key, value in plan_create.dict(exclude={'provider_id'}).items():
-                        setattr(existing, key, value)
-                    total_updated += 1
-                else:
-                    # Create new plan
-                    crud.create_or_update_plan(db, provider.id, plan_create)
-                    total_added += 1
+                plan_creates.append(plan_create)
 
             except Exception as e:
                 logger.error(f"[Scheduler] Error processing residential plan: {e}")
                 continue
 
-        logger.info(f"[Scheduler] Residential: {total_added} added, {total_updated} updated")
+        counts = crud.bulk_upsert_plans(db, plan_creates)
+        for key, value in counts.items():
+            totals[key] += value
+        logger.info(f"[Scheduler] Residential: {counts['inserted']} added, {counts['updated']} updated, {counts['unchanged']} unchanged")
 
         # 2. Scrape REAL commercial plans
         logger.info("[Scheduler] Scraping REAL commercial plans from EnergyBot...")
         commercial_plans = energybot_scraper_v2.scrape_energybot_all_texas_v2()
         logger.info(f"[Scheduler] Retrieved {len(commercial_plans)} REAL commercial plans")
 
+        provider_ids = providers.resolve(plan_data.get("provider_name") for plan_data in commercial_plans)
+        plan_creates = []
         for plan_data in commercial_plans:
             try:
-                # Get or create provider
                 provider_name = plan_data.get("provider_name")
                 if not provider_name:
                     continue
 
-                provider = crud.get_provider_by_name(db, provider_name)
-                if not provider:
-                    provider = crud.create_provider(
-                        db, schemas.ProviderCreate(name=provider_name)
-                    )
-
                 # Get plan URL
                 plan_url = get_plan_url(provider_name, plan_data.get("plan_name"))
 
                 # Create plan object
                 plan_create = schemas.PlanCreate(
-                    provider_id=provider.id,
+                    provider_id=provider_ids[provider_name],
                     plan_name=plan_data["plan_name"],
                     plan_url=plan_url,
                     plan_type=plan_data.get("plan_type", "Fixed"),
@@ -151,33 +135,27 @@ def scrape_real_data_job():
                     renewable_percent=plan_data.get("renewable_percent", 0.0),
                     special_features=plan_data.get("special_features", "")
                 )
-
-                # Check if plan exists
-                from .models import Plan
-                existing = db.query(Plan).filter(
-                    Plan.provider_id == provider.id,
-                    Plan.plan_name == plan_create.plan_name
-                ).first()
-
-                if existing:
-                    # Update existing plan
-                    for key, value in plan_create.dict(exclude={'provider_id'}).items():
-                        setattr(existing, key, value)
-                    total_updated += 1
-                else:
-                    # Create new plan
-                    crud.create_or_update_plan(db, provider.id, plan_create)
-                    total_added += 1
+                plan_creates.append(plan_create)
 
             except Exception as e:
                 logger.error(f"[Scheduler] Error processing commercial plan: {e}")
                 continue
 
-        logger.info(f"[Scheduler] Commercial: {total_added} added, {total_updated} updated")
+        counts = crud.bulk_upsert_plans(db, plan_creates)
+        for key, value in counts.items():
+            totals[key] += value
+        logger.info(f"[Scheduler] Commercial: {counts['inserted']} added, {counts['updated']} updated, {counts['unchanged']} unchanged")
 
-        db.commit()
-        logger.info(f"[Scheduler] SUCCESS! Total: {total_added} added, {total_updated} updated")
+        changed = totals["inserted"] + totals["updated"]
+        logger.info(
+            f"[Scheduler] SUCCESS! Total: {changed} changed ({totals['inserted']} added, "
+            f"{totals['updated']} updated), {totals['unchanged']} unchanged"
+        )
+
+        # 3. Warm the hottest plan listings before the new data goes live
+        warm_plan_caches(db)
         logger.info(f"[Scheduler] ALL DATA IS REAL - NO SAMPLES")
+        return {"changed": changed, **totals}
 
     except Exception as e:
         db.rollback()
@@ -201,9 +179,9 @@ def delete_sample_data_and_load_real():
 
     try:
         # Delete ALL existing plans (sample data)
-        from .models import Plan
-        deleted_count = db.query(Plan).delete()
+        deleted_count = crud.delete_plans(db)
         db.commit()
+        bump_generation("plans")
         logger.info(f"[Startup] Deleted {deleted_count} sample plans")
 
         # Run the scraper to load real data
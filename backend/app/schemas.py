@@ -7,7 +7,7 @@ requests.
 """
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from pydantic import BaseModel
@@ -44,6 +44,31 @@ class Plan(PlanBase):
         from_attributes = True
 
 
+class PlanRateSnapshot(BaseModel):
+    """One entry of a plan's price history (``/plans/{plan_id}/history``)."""
+    plan_id: int
+    observed_at: datetime
+    rate_500_cents: Optional[float] = None
+    rate_1000_cents: Optional[float] = None
+    rate_2000_cents: Optional[float] = None
+    monthly_bill_1000: Optional[float] = None
+    monthly_bill_2000: Optional[float] = None
+    early_termination_fee: Optional[float] = None
+    base_monthly_fee: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MarketHistoryDay(BaseModel):
+    """Price changes observed across all plans on one day (``/plans/history``)."""
+    day: date
+    snapshots: int
+    avg_rate_1000_cents: Optional[float] = None
+    min_rate_1000_cents: Optional[float] = None
+    max_rate_1000_cents: Optional[float] = None
+
+
 class ProviderBase(BaseModel):
     name: str
     website: Optional[str] = None
@@ -61,6 +86,15 @@ class Provider(ProviderBase):
         from_attributes = True
 
 
+class ProviderSummary(ProviderBase):
+    """Provider without its plans, for ``/plans/providers?include_plans=false``."""
+    id: int
+    plan_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+
 # TDU Schemas
 class TDUBase(BaseModel):
     name: str
@@ -110,6 +110,34 @@ PROVIDER_PLAN_PAGES = {
 }
 
 
+def _name_key(provider_name: str) -> str:
+    return " ".join(provider_name.split()).casefold()
+
+
+# Names that share a homepage are aliases of one provider ("TXU" and
+# "TXU Energy"); the first one listed in PROVIDER_WEBSITES is canonical.
+_CANONICAL_NAMES = {}
+_canonical_by_website = {}
+for _name, _website in PROVIDER_WEBSITES.items():
+    _CANONICAL_NAMES[_name_key(_name)] = _canonical_by_website.setdefault(_website, _name)
+del _name, _website, _canonical_by_website
+
+
+def canonical_provider_name(provider_name: str) -> str:
+    """
+    Map a provider name or alias to its canonical name.
+
+    Matching ignores case and extra whitespace.  Unknown names are returned
+    with whitespace normalized.
+
+    Examples:
+        canonical_provider_name("TXU") -> "TXU Energy"
+        canonical_provider_name("reliant") -> "Reliant Energy"
+    """
+    key = _name_key(provider_name)
+    return _CANONICAL_NAMES.get(key, " ".join(provider_name.split()))
+
+
 def get_provider_website(provider_name: str) -> str:
     """
     Get the main website URL for a provider.
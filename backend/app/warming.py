@@ -0,0 +1,111 @@
+"""
+Cache warming for the most requested plan listings.
+
+``/plans/`` records each default-page query by its filter combination
+(service_type, zip_code, contract_months, plan_type) in a sliding window.
+After an ingest, ``warm_plan_caches`` recomputes the most frequent
+combinations for the generation the ingest is about to publish, so users
+arriving after the 3 AM refresh hit a warm cache.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .cache import prepare_next_generation
+
+logger = logging.getLogger(__name__)
+
+# Sliding window of recorded queries and how many combinations to warm
+CACHE_WARM_WINDOW = int(os.getenv("CACHE_WARM_WINDOW", 86400))  # 24 hours
+CACHE_WARM_BUCKET = int(os.getenv("CACHE_WARM_BUCKET", 3600))  # 1 hour buckets
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", 20))
+
+PLAN_QUERY_FIELDS = ("service_type", "zip_code", "contract_months", "plan_type")
+
+
+class QueryTracker:
+    """
+    Counts normalized queries in time buckets covering a sliding window.
+
+    Recording is a counter increment under a lock; buckets older than the
+    window are dropped as new ones start.
+    """
+
+    def __init__(self, fields: tuple[str, ...], window: int = CACHE_WARM_WINDOW, bucket: int = CACHE_WARM_BUCKET):
+        self.fields = fields
+        self.window = window
+        self.bucket = bucket
+        self._buckets: deque[tuple[int, Counter]] = deque()
+        self._lock = threading.Lock()
+
+    def _normalize(self, params: dict) -> tuple:
+        return tuple(params.get(field) for field in self.fields)
+
+    def record(self, **params) -> None:
+        bucket_start = int(time.time()) // self.bucket * self.bucket
+        query = self._normalize(params)
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != bucket_start:
+                self._buckets.append((bucket_start, Counter()))
+                self._expire(bucket_start)
+            self._buckets[-1][1][query] += 1
+
+    def top(self, n: int = CACHE_WARM_TOP_N) -> list[dict]:
+        """Most frequent queries in the window, as parameter dicts."""
+        now = int(time.time())
+        totals: Counter = Counter()
+        with self._lock:
+            self._expire(now)
+            for _, counter in self._buckets:
+                totals.update(counter)
+        return [dict(zip(self.fields, query)) for query, _ in totals.most_common(n)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def _expire(self, now: int) -> None:
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+
+plan_query_tracker = QueryTracker(PLAN_QUERY_FIELDS)
+
+
+def warm_plan_caches(db: Session, top_n: int = CACHE_WARM_TOP_N, queries: Optional[list[dict]] = None) -> int:
+    """
+    Recompute the hottest /plans/ listings into the cache.
+
+    Call inside ``batch_invalidation()`` after the ingest commits: entries
+    are built for the pending generation and go live with its bump.  The
+    unfiltered listing is always included.  Returns the number of queries
+    warmed.
+    """
+    from . import crud
+    from .api.plans import render_plans
+
+    if queries is None:
+        queries = plan_query_tracker.top(top_n)
+    unfiltered = dict.fromkeys(PLAN_QUERY_FIELDS)
+    if unfiltered not in queries:
+        queries = [unfiltered] + queries
+
+    warmed = 0
+    with prepare_next_generation():
+        version = crud.get_plans_version(db)
+        for params in queries:
+            try:
+                render_plans(db, version, **params)
+                warmed += 1
+            except Exception as e:
+                logger.error(f"[Warming] Failed to warm plans query {params}: {e}")
+        crud.get_providers(db)
+    logger.info(f"[Warming] Warmed {warmed} plan queries")
+    return warmed
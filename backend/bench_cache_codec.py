@@ -0,0 +1,72 @@
+"""
+Benchmark the cache codec with 10,000 plans.
+
+Measures how fast app.cache turns ORM plan rows into stored bytes and
+rebuilds them as schemas.Plan objects on a cache hit.
+
+Run with: python bench_cache_codec.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import cache, models
+
+PLAN_COUNT = 10_000
+ROUNDS = 5
+
+
+def make_plans(count):
+    return [
+        models.Plan(
+            id=i,
+            provider_id=i % 40,
+            plan_name=f"Example Saver {i}",
+            plan_url="https://www.example.com/plans",
+            plan_type="Fixed",
+            service_type="Residential",
+            zip_code=f"75{i % 1000:03d}",
+            contract_months=12,
+            rate_500_cents=15.2,
+            rate_1000_cents=13.5,
+            rate_2000_cents=12.9,
+            monthly_bill_1000=135.0,
+            monthly_bill_2000=258.0,
+            early_termination_fee=150.0,
+            base_monthly_fee=9.95,
+            renewable_percent=10,
+            special_features="12-month price protection",
+            last_updated=datetime(2025, 1, 1, 3, 0),
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(func, rounds=ROUNDS):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    plans = make_plans(PLAN_COUNT)
+    data = cache.encode_value(plans)
+
+    encode_seconds = best_of(lambda: cache.encode_value(plans))
+    decode_seconds = best_of(lambda: cache.decode_value(data))
+
+    backend = "orjson" if cache.ORJSON_AVAILABLE else "json"
+    print(f"Codec backend: {backend}")
+    print(f"Plans: {PLAN_COUNT:,}  Encoded size: {len(data) / 1024:.0f} KiB ({len(data) / PLAN_COUNT:.0f} bytes/plan)")
+    print(f"Encode: {encode_seconds * 1000:.1f} ms  ({PLAN_COUNT / encode_seconds:,.0f} plans/s)")
+    print(f"Decode: {decode_seconds * 1000:.1f} ms  ({PLAN_COUNT / decode_seconds:,.0f} plans/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark the SQLite profile in app.database (WAL, synchronous=NORMAL,
+mmap_size, cache_size, busy_timeout) against SQLite's defaults.
+
+Runs the same workload on a fresh database file with the profile off and on:
+
+- Ingest: PLAN_COUNT plans written with one commit per plan
+  (crud.create_or_update_plan), then re-priced in one crud.bulk_upsert_plans.
+- Reads under write load: READERS threads run uncached plan listings while
+  a writer thread commits plan updates one at a time.  Reports read latency
+  percentiles and "database is locked" errors.
+
+Run with: python bench_sqlite_profile.py
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, crud, database, models, schemas
+
+PLAN_COUNT = 2_000
+PROVIDER_COUNT = 20
+READERS = 4
+READ_SECONDS = 3.0
+
+
+def make_plan(i, rate):
+    return schemas.PlanCreate(
+        provider_id=1 + i % PROVIDER_COUNT,
+        plan_name=f"Example Saver {i}",
+        plan_type="Fixed",
+        service_type="Residential",
+        zip_code=f"75{i % 50:03d}",
+        contract_months=12,
+        rate_1000_cents=rate,
+    )
+
+
+def ingest(Session):
+    with Session() as db:
+        db.add_all(models.Provider(id=i, name=f"Provider {i}") for i in range(1, PROVIDER_COUNT + 1))
+        db.commit()
+
+        start = time.perf_counter()
+        for i in range(PLAN_COUNT):
+            crud.create_or_update_plan(db, 1 + i % PROVIDER_COUNT, make_plan(i, 13.5))
+        per_row = time.perf_counter() - start
+
+        start = time.perf_counter()
+        crud.bulk_upsert_plans(db, [make_plan(i, 12.9) for i in range(PLAN_COUNT)])
+        bulk = time.perf_counter() - start
+    return per_row, bulk
+
+
+def reads_under_write_load(Session):
+    stop = threading.Event()
+    latencies, errors, writes = [], [0], [0]
+    lock = threading.Lock()
+
+    def writer():
+        with Session() as db:
+            while not stop.is_set():
+                i = random.randrange(PLAN_COUNT)
+                try:
+                    crud.create_or_update_plan(db, 1 + i % PROVIDER_COUNT, make_plan(i, random.uniform(10, 16)))
+                    writes[0] += 1
+                except OperationalError:
+                    db.rollback()
+
+    def reader():
+        with Session() as db:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    crud.get_plans.__wrapped__(db, zip_code=f"75{random.randrange(50):03d}", limit=100)
+                    db.rollback()  # End the read transaction, like a request would
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(READ_SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "writes": writes[0],
+        "errors": errors[0],
+        "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def run(tuned, directory):
+    database.SQLITE_TUNING = tuned
+    engine = database.make_engine(f"sqlite:///{os.path.join(directory, 'tuned.db' if tuned else 'default.db')}")
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    try:
+        per_row, bulk = ingest(Session)
+        return per_row, bulk, reads_under_write_load(Session)
+    finally:
+        engine.dispose()
+
+
+def main():
+    cache.REDIS_ENABLED = False
+    print(f"Plans: {PLAN_COUNT:,}  Readers: {READERS}  Read phase: {READ_SECONDS:.0f}s")
+    print("Profile: " + "; ".join(database.sqlite_pragmas()))
+    print()
+    print(f"{'':<10}{'per-row':>12}{'bulk':>12}{'reads/s':>10}{'writes/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'locked':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for tuned in (False, True):
+            per_row, bulk, reads = run(tuned, directory)
+            print(
+                f"{'profile' if tuned else 'default':<10}"
+                f"{PLAN_COUNT / per_row:>8,.0f} p/s"
+                f"{PLAN_COUNT / bulk:>8,.0f} p/s"
+                f"{reads['reads'] / READ_SECONDS:>10,.0f}"
+                f"{reads['writes'] / READ_SECONDS:>10,.0f}"
+                f"{reads['p50'] * 1000:>9.2f}"
+                f"{reads['p95'] * 1000:>9.2f}"
+                f"{reads['max'] * 1000:>9.1f}"
+                f"{reads['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
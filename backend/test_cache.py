@@ -0,0 +1,324 @@
+"""
+Tests for the caching layer in app/cache.py.
+
+Run with: pytest test_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import cache
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    """Force the in-memory fallback and start every test with an empty cache."""
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.clear_cache()
+    cache.cache_metrics.reset()
+    yield
+    cache.clear_cache()
+
+
+def test_sessions_do_not_split_cache_entries():
+    calls = []
+
+    @cache.cache_result(ttl=60, key_prefix="plans")
+    def get_plans(db: Session, provider=None, zip_code=None, skip: int = 0, limit: int = 100):
+        calls.append(db)
+        return [{"provider": provider, "zip_code": zip_code}]
+
+    # Two requests, each with its own session
+    first = get_plans(Session(), provider="TXU Energy", zip_code="75001")
+    second = get_plans(Session(), "TXU Energy", zip_code="75001", skip=0)
+
+    assert first == second
+    assert len(calls) == 1
+
+
+def test_defaults_and_none_are_normalized():
+    def get_plans(db, provider=None, skip: int = 0, limit: int = 100):
+        return []
+
+    base = cache.build_cache_key("plans", get_plans, (object(),))
+    assert base == "plans"
+    assert cache.build_cache_key("plans", get_plans, (object(),), {"provider": None, "limit": 100}) == base
+    assert cache.build_cache_key("plans", get_plans, (object(), "Gexa"), {"limit": 50}) == "plans:provider=Gexa:limit=50"
+
+
+def test_key_params_and_long_keys():
+    def lookup(db, name, verbose=False):
+        return name
+
+    assert cache.build_cache_key("tdus", lookup, (object(), "Oncor", True), key_params=("name",)) == "tdus:name=Oncor"
+
+    long_key = cache.build_cache_key("tdus", lookup, (object(), "x" * 500))
+    assert long_key.startswith("tdus:h:")
+    assert len(long_key) <= cache.CACHE_KEY_MAX_LENGTH
+
+
+def test_separators_in_values_do_not_collide():
+    def get_plans(db, provider=None, zip_code=None, skip: int = 0):
+        return []
+
+    smuggled = cache.build_cache_key("plans", get_plans, (object(),), {"provider": "TXU:zip_code=75001"})
+    real = cache.build_cache_key("plans", get_plans, (object(),), {"provider": "TXU", "zip_code": "75001"})
+    assert smuggled != real
+    assert cache.build_cache_key("plans", get_plans, (object(), ["a,b"])) != cache.build_cache_key("plans", get_plans, (object(), ["a", "b"]))
+
+
+def _make_plan(plan_id, provider_id=1):
+    from datetime import datetime
+    from app import models
+
+    return models.Plan(
+        id=plan_id,
+        provider_id=provider_id,
+        plan_name=f"Saver {plan_id}",
+        plan_type="Fixed",
+        service_type="Residential",
+        zip_code="75001",
+        contract_months=12,
+        rate_1000_cents=13.5,
+        last_updated=datetime(2025, 1, 1, 3, 0),
+    )
+
+
+def test_orm_rows_round_trip_as_schema_objects():
+    from app import models, schemas
+
+    plans = [_make_plan(1), _make_plan(2)]
+    cache.set_cache("plans", plans)
+    cached = cache.get_cache("plans")
+
+    assert [type(plan) for plan in cached] == [schemas.Plan, schemas.Plan]
+    assert cached[1].plan_name == "Saver 2"
+    assert cached[0].last_updated == plans[0].last_updated
+
+    provider = models.Provider(id=1, name="Gexa Energy", website=None, plans=plans)
+    cache.set_cache("provider", provider)
+    cached_provider = cache.get_cache("provider")
+    assert isinstance(cached_provider, schemas.Provider)
+    assert [plan.id for plan in cached_provider.plans] == [1, 2]
+
+
+def test_plain_values_and_bytes_round_trip():
+    cache.set_cache("stats", {"plans": 3, "zip_codes": ["75001"]})
+    cache.set_cache("body", b'[{"id":1}]')
+
+    assert cache.get_cache("stats") == {"plans": 3, "zip_codes": ["75001"]}
+    assert cache.get_cache("body") == b'[{"id":1}]'
+
+
+def test_lru_respects_entry_and_byte_budgets():
+    lru = cache.LRUCache(max_entries=2, max_bytes=10)
+    lru.set("a", b"1234", ttl=60)
+    lru.set("b", b"1234", ttl=60)
+    lru.get("a")  # "a" is now most recently used
+    lru.set("c", b"1234", ttl=60)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1234" and lru.get("c") == b"1234"
+    assert lru.size_bytes == 8
+
+    assert lru.set("big", b"x" * 11, ttl=60) is False
+    lru.set("d", b"123456", ttl=60)
+    assert lru.get("a") is None
+    assert len(lru) == 2 and lru.size_bytes == 10
+
+
+def test_lru_evicts_expired_entries_first(monkeypatch):
+    lru = cache.LRUCache(max_entries=2, max_bytes=100)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+
+    lru.set("short", b"1", ttl=5)
+    lru.set("long", b"2", ttl=60)
+    now[0] += 10
+    lru.set("new", b"3", ttl=60)
+
+    assert lru.get("long") == b"2"
+    assert lru.get("short") is None
+
+
+def test_generation_bump_invalidates_namespace():
+    calls = []
+
+    @cache.cache_result(ttl=60, key_prefix="tdus", namespaces=("tdus",))
+    def get_tdus(db: Session, limit: int = 100):
+        calls.append(limit)
+        return [{"name": "Oncor", "version": len(calls)}]
+
+    assert get_tdus(Session())[0]["version"] == 1
+    assert get_tdus(Session())[0]["version"] == 1
+
+    cache.bump_generation("tdus")
+    assert get_tdus(Session())[0]["version"] == 2
+
+    cache.bump_generation("plans")  # unrelated namespace
+    assert get_tdus(Session())[0]["version"] == 2
+
+
+def test_batch_invalidation_bumps_once_on_exit():
+    before = cache.get_generation("plans")
+    with cache.batch_invalidation():
+        for _ in range(5):
+            cache.bump_generation("plans")
+        assert cache.get_generation("plans") == before
+
+    assert cache.get_generation("plans") == before + 1
+
+
+def test_concurrent_misses_run_the_function_once():
+    import threading
+    import time
+
+    calls = []
+    started = threading.Event()
+
+    @cache.cache_result(ttl=60, key_prefix="plans")
+    def get_plans(db: Session, zip_code=None):
+        calls.append(zip_code)
+        started.set()
+        time.sleep(0.2)
+        return [{"zip_code": zip_code}]
+
+    results = []
+
+    def request():
+        results.append(get_plans(Session(), zip_code="77002"))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["77002"]
+    assert results == [[{"zip_code": "77002"}]] * 8
+
+
+def test_stale_value_is_served_while_refreshing(monkeypatch):
+    import time
+
+    sessions = []
+
+    @cache.cache_result(ttl=1, key_prefix="swr_plans", stale_ttl=60)
+    def get_plans(db: Session, zip_code=None):
+        sessions.append(db)
+        return [{"zip_code": zip_code, "version": len(sessions)}]
+
+    request_session = Session()
+    assert get_plans(request_session, zip_code="75001")[0]["version"] == 1
+
+    real_time = time.time
+    monkeypatch.setattr(cache.time, "time", lambda: real_time() + 5)
+
+    # Past the soft TTL: the old value comes back right away...
+    assert get_plans(Session(), zip_code="75001")[0]["version"] == 1
+
+    # ...and a background refresh replaces it using its own session
+    deadline = real_time() + 2
+    while len(sessions) < 2 and real_time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert len(sessions) == 2 and sessions[1] is not request_session
+    assert get_plans(Session(), zip_code="75001")[0]["version"] == 2
+    assert cache.get_cache_stats()["swr_plans"]["stale_serves"] == 1
+    assert cache.get_cache_stats()["swr_plans"]["refreshes"] == 1
+
+
+def test_large_values_are_compressed_with_a_marker(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_COMPRESSION", "zlib")
+    small = cache.encode_value({"plans": 1})
+    large = cache.encode_value([{"plan_name": f"Saver {i}", "zip_code": "75001"} for i in range(200)])
+
+    assert cache.compress_value("plans@1:zip_code=75001", small) == small
+    compressed = cache.compress_value("plans@1:zip_code=75001", large)
+    assert compressed[:1] == cache.FORMAT_ZLIB and len(compressed) < len(large)
+
+    # Compressed and uncompressed values decode side by side
+    assert cache.decompress_value("plans@1", compressed) == large
+    assert cache.decompress_value("plans@1", small) == small
+
+    stats = cache.get_cache_stats()["plans"]
+    assert stats["compressed_values"] == 1
+    assert stats["compression_ratio"] > 1
+
+
+def test_hits_misses_and_latency_are_recorded():
+    @cache.cache_result(ttl=60, key_prefix="tdus")
+    def get_tdus(db: Session):
+        return [{"name": "Oncor"}]
+
+    get_tdus(Session())
+    get_tdus(Session())
+
+    stats = cache.get_cache_stats()["tdus"]
+    assert stats["misses"] == 1 and stats["hits"] == 1 and stats["l1_hits"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["get_seconds"]["count"] == 2
+    assert stats["set_seconds"]["count"] == 1
+    assert stats["bytes_written"] == stats["bytes_read"] > 0
+
+
+def test_get_many_and_set_many():
+    assert cache.set_many({"tdus:name=Oncor": {"id": 1}, "tdus:name=CenterPoint": {"id": 2}}, ttl=60)
+
+    found = cache.get_many(["tdus:name=Oncor", "tdus:name=AEP", "tdus:name=CenterPoint"])
+    assert found == {"tdus:name=Oncor": {"id": 1}, "tdus:name=CenterPoint": {"id": 2}}
+    assert cache.get_cache_stats()["tdus"]["misses"] == 1
+
+
+class _BrokenRedis:
+    """Stands in for a Redis server that has gone away."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise cache.redis.ConnectionError("Connection refused")
+        return fail
+
+
+@pytest.mark.skipif(not cache.REDIS_AVAILABLE, reason="redis package not installed")
+def test_connection_loss_falls_back_to_local_tier(monkeypatch):
+    monkeypatch.setattr(cache, "REDIS_ENABLED", True)
+    monkeypatch.setattr(cache, "redis_client", _BrokenRedis())
+    monkeypatch.setattr(cache, "_redis_retry_at", 0.0)
+
+    assert cache.set_cache("stats", {"plans": 3}) is False
+    assert cache.redis_client is None
+    assert cache._redis_retry_at > cache.time.time()
+
+    # While backing off, no reconnect is attempted and the local tier serves
+    assert cache.get_redis() is None
+    assert cache.get_cache("stats") == {"plans": 3}
+
+
+def test_not_found_results_are_cached_until_a_write():
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app import crud, models, schemas
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert crud.get_tdu_by_name(db, "Nowhere Power") is None
+    assert crud.get_tdu_by_name(db, "Nowhere Power") is None
+    assert len(statements) == 1
+    assert cache.get_cache_stats()["tdu_by_name"]["negative_hits"] == 1
+
+    # Creating the TDU bumps the namespace, so the negative entry is gone
+    crud.create_or_update_tdu(db, schemas.TDUCreate(name="Nowhere Power", full_name="Nowhere Power Co"))
+    assert crud.get_tdu_by_name(db, "Nowhere Power").full_name == "Nowhere Power Co"
+    db.close()
@@ -0,0 +1,101 @@
+"""
+Tests for the asyncio cache layer in app/cache_async.py.
+
+Run with: pytest test_cache_async.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import cache, cache_async
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    """Force the in-memory fallback and start every test with an empty cache."""
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    monkeypatch.setattr(cache_async, "_client", None)
+    cache.clear_cache()
+    cache.cache_metrics.reset()
+    yield
+    cache.clear_cache()
+
+
+def test_async_and_sync_layers_share_entries():
+    async def main():
+        await cache_async.set_cache_async("stats", {"plans": 3})
+        assert cache.get_cache("stats") == {"plans": 3}
+
+        cache.set_cache("body", b'[{"id":1}]')
+        assert await cache_async.get_cache_async("body") == b'[{"id":1}]'
+
+        assert await cache_async.delete_cache_async("stats")
+        assert await cache_async.get_cache_async("stats") is None
+
+    asyncio.run(main())
+
+
+def test_async_decorator_matches_sync_keys_and_generations():
+    calls = []
+
+    @cache_async.cache_result_async(ttl=60, key_prefix="tdus", namespaces=("tdus",))
+    async def get_tdus(db: Session, limit: int = 100):
+        calls.append(limit)
+        await asyncio.sleep(0.05)
+        return [{"name": "Oncor", "version": len(calls)}]
+
+    @cache.cache_result(ttl=60, key_prefix="tdus", namespaces=("tdus",))
+    def get_tdus_sync(db: Session, limit: int = 100):
+        raise AssertionError("should be served from the async entry")
+
+    async def main():
+        # Concurrent misses run the coroutine once
+        results = await asyncio.gather(*(get_tdus(Session(), limit=10) for _ in range(5)))
+        assert [r[0]["version"] for r in results] == [1] * 5
+        assert get_tdus_sync(Session(), limit=10)[0]["version"] == 1
+
+        cache.bump_generation("tdus")
+        assert (await get_tdus(Session(), limit=10))[0]["version"] == 2
+
+    asyncio.run(main())
+    assert calls == [10, 10]
+
+
+def test_stale_entries_are_refreshed_on_the_loop(monkeypatch):
+    import time
+
+    sessions = []
+
+    @cache_async.cache_result_async(ttl=1, key_prefix="swr_tdus", stale_ttl=60)
+    async def get_tdus(db: Session, limit: int = 100):
+        sessions.append(db)
+        return [{"name": "Oncor", "version": len(sessions)}]
+
+    class FakeSession:
+        async def close(self):
+            pass
+
+    monkeypatch.setattr("app.database.get_async_engine", lambda: None)
+    monkeypatch.setattr("app.database.AsyncSessionLocal", FakeSession)
+
+    async def main():
+        request_session = Session()
+        assert (await get_tdus(request_session))[0]["version"] == 1
+
+        real_time = time.time
+        monkeypatch.setattr(cache.time, "time", lambda: real_time() + 5)
+        # Past the soft TTL: the old value now, a refresh with a new session after
+        assert (await get_tdus(Session()))[0]["version"] == 1
+        await asyncio.gather(*cache_async._refresh_tasks)
+        assert isinstance(sessions[1], FakeSession)
+        assert (await get_tdus(Session()))[0]["version"] == 2
+
+    asyncio.run(main())
+    stats = cache.get_cache_stats()["swr_tdus"]
+    assert stats["stale_serves"] == 1 and stats["refreshes"] == 1
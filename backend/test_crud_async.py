@@ -0,0 +1,103 @@
+"""
+Tests for the async read helpers in app/crud_async.py.
+
+Run with: pytest test_crud_async.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, cache_async, crud, crud_async, models
+
+
+@pytest.fixture
+def sessions(monkeypatch, tmp_path):
+    """Sync and async session factories on one SQLite file."""
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    monkeypatch.setattr(cache_async, "_client", None)
+    cache.clear_cache()
+    cache.cache_metrics.reset()
+
+    url = f"sqlite:///{tmp_path / 'plans.db'}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(models.Provider(id=i, name=f"Provider {i}") for i in (1, 2))
+        db.add_all(
+            models.Plan(id=i, provider_id=1 + i % 2, plan_name=f"Plan {i}", zip_code="75001", rate_1000_cents=10 + i % 3)
+            for i in range(1, 8)
+        )
+        db.add(models.TDU(id=1, name="Oncor", full_name="Oncor Electric Delivery"))
+        db.commit()
+    yield Session, f"sqlite+aiosqlite:///{tmp_path / 'plans.db'}"
+    cache.clear_cache()
+    engine.dispose()
+
+
+def _run(async_url, body):
+    async def main():
+        engine = create_async_engine(async_url)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                return await body(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_async_reads_match_sync_reads(sessions):
+    Session, async_url = sessions
+
+    async def read(db):
+        return (
+            await crud_async.get_plans.__wrapped__(db, zip_code="75001", limit=4),
+            await crud_async.get_providers.__wrapped__(db),
+            await crud_async.get_plans_version.__wrapped__(db),
+            await crud_async.get_tdu_by_name.__wrapped__(db, "Oncor"),
+        )
+
+    plans, providers, version, tdu = _run(async_url, read)
+    with Session() as db:
+        assert [plan.id for plan in plans] == [plan.id for plan in crud.get_plans.__wrapped__(db, zip_code="75001", limit=4)]
+        assert version == crud.get_plans_version.__wrapped__(db)
+    # Plans were eager-loaded, so they are usable after the session closed
+    assert [len(provider.plans) for provider in providers] == [3, 4]
+    assert tdu.full_name == "Oncor Electric Delivery"
+
+
+def test_async_and_sync_reads_share_cache_entries(sessions):
+    Session, async_url = sessions
+
+    async def read(db):
+        plans = await crud_async.get_plans(db, zip_code="75001")
+        missing = await crud_async.get_tdu(db, 99)
+        return plans, missing
+
+    plans, missing = _run(async_url, read)
+    assert missing is None
+
+    with Session() as db:
+        statements = []
+        event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        assert [plan.id for plan in crud.get_plans(db, zip_code="75001")] == [plan.id for plan in plans]
+        assert crud.get_tdu(db, 99) is None
+        assert statements == []
+    assert cache.get_cache_stats()["tdu"]["negative_hits"] == 1
+
+
+def test_every_cached_read_has_an_async_twin():
+    import inspect
+
+    async_reads = {name for name, func in vars(crud_async).items() if inspect.iscoroutinefunction(func) and name.startswith("get_")}
+    assert async_reads == set(crud.CACHE_SETTINGS)
+    assert all(hasattr(crud, name) for name in crud.CACHE_SETTINGS)
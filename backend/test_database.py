@@ -0,0 +1,277 @@
+"""
+Tests for the connection pool settings and metrics in app/database.py.
+
+Run with: pytest test_database.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from app import database
+
+
+@pytest.fixture
+def small_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.05)
+    database.db_metrics.reset()
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'pool.db'}", label="test")
+    yield engine
+    engine.dispose()
+
+
+def test_pool_reports_checkouts_overflow_and_timeouts(small_pool):
+    first = small_pool.connect()
+    second = small_pool.connect()  # beyond pool_size: overflow
+    assert database.db_metrics.get("test", "checked_out") == 2
+    assert database.db_metrics.get("test", "overflow_connections") == 1
+
+    with pytest.raises(PoolTimeoutError):
+        small_pool.connect()
+    assert database.db_metrics.get("test", "checkout_timeouts") == 1
+
+    first.close()
+    second.close()
+    assert database.db_metrics.get("test", "checked_out") == 0
+    wait = database.db_metrics.snapshot()["test"]["checkout_wait_seconds"]
+    assert wait["count"] == 3 and wait["sum"] >= 0.05
+
+
+def test_retrying_session_replays_first_statement_on_dead_connection(small_pool, monkeypatch):
+    calls = []
+    real_execute = database.Session.execute
+
+    def flaky_execute(self, *args, **kwargs):
+        calls.append(args[0])
+        if len(calls) in (1, 3):
+            raise DBAPIError("SELECT 1", {}, Exception("server closed the connection"), connection_invalidated=True)
+        return real_execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(database.Session, "execute", flaky_execute)
+    with database.RetryingSession(bind=small_pool) as session:
+        assert session.execute(text("SELECT 1")).scalar() == 1
+        assert len(calls) == 2
+        assert database.db_metrics.get("test", "disconnect_retries") == 1
+
+        # Inside a transaction that already did work, the error is raised
+        with pytest.raises(DBAPIError):
+            session.execute(text("SELECT 1"))
+
+
+def test_async_sessions_retry_on_dead_connection_without_pre_ping(small_pool, monkeypatch, tmp_path):
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    calls = []
+    real_execute = database.Session.execute
+
+    def flaky_execute(self, *args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 1:
+            raise DBAPIError("SELECT 1", {}, Exception("server closed the connection"), connection_invalidated=True)
+        return real_execute(self, *args, **kwargs)
+
+    async def main():
+        engine = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", label="test_async")
+        Session = async_sessionmaker(engine, sync_session_class=database.RetryingRoutingSession)
+        try:
+            async with Session(replica=None) as session:
+                return (await session.execute(text("SELECT 1"))).scalar()
+        finally:
+            await engine.dispose()
+
+    monkeypatch.setattr(database.Session, "execute", flaky_execute)
+    assert asyncio.run(main()) == 1
+    assert len(calls) == 2
+    assert database.db_metrics.get("test_async", "disconnect_retries") == 1
+
+    # With pre-ping off, the async session factory uses the retrying class
+    import subprocess
+
+    check = "from app import database; assert database.AsyncSessionLocal.kw['sync_session_class'] is database.RetryingRoutingSession"
+    env = dict(os.environ, DB_POOL_PRE_PING="false", DATABASE_URL=f"sqlite:///{tmp_path / 'app.db'}")
+    subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True)
+
+
+def test_async_url_uses_asyncio_drivers():
+    assert database.async_database_url("sqlite:///./plans.db") == "sqlite+aiosqlite:///./plans.db"
+    assert (
+        database.async_database_url("postgresql+psycopg2://user:secret@db:5432/texas_energy")
+        == "postgresql+asyncpg://user:secret@db:5432/texas_energy"
+    )
+    assert database.async_database_url("postgres://db/texas_energy") == "postgresql+asyncpg://db/texas_energy"
+    with pytest.raises(ValueError):
+        database.async_database_url("mysql://db/texas_energy")
+
+
+def test_async_url_translates_sslmode_for_asyncpg():
+    import inspect
+
+    from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg
+
+    asyncpg = pytest.importorskip("asyncpg")
+    url = database.async_database_url("postgresql://user@db/texas_energy?sslmode=require")
+    assert url == "postgresql+asyncpg://user@db/texas_energy?ssl=require"
+
+    # Every query parameter must be a keyword asyncpg.connect() accepts
+    _, connect_kwargs = PGDialect_asyncpg().create_connect_args(database.make_url(url))
+    assert connect_kwargs["ssl"] == "require"
+    assert set(connect_kwargs) <= set(inspect.signature(asyncpg.connect).parameters)
+
+
+def test_async_pool_reports_metrics(small_pool, tmp_path):
+    import asyncio
+
+    async def main():
+        engine = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", label="test_async")
+        async with engine.connect() as connection:
+            assert (await connection.execute(text("SELECT 1"))).scalar() == 1
+            assert database.db_metrics.get("test_async", "checked_out") == 1
+        await engine.dispose()
+
+    asyncio.run(main())
+    assert database.db_metrics.get("test_async", "checked_out") == 0
+    assert database.db_metrics.get("test_async", "pool_size") == 1
+    assert database.db_metrics.snapshot()["test_async"]["checkout_wait_seconds"]["count"] == 1
+
+
+@pytest.fixture
+def primary_and_replica(tmp_path):
+    """Two SQLite files standing in for a primary and its replica."""
+    from sqlalchemy import create_engine
+
+    engines = []
+    for name in ("primary", "replica"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}.db")
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE source (id INTEGER PRIMARY KEY, name TEXT)"))
+            connection.execute(text("INSERT INTO source (id, name) VALUES (1, :name)"), {"name": name})
+        engines.append(engine)
+    yield engines
+    for engine in engines:
+        engine.dispose()
+
+
+def test_routing_session_reads_from_replica_until_it_writes(primary_and_replica):
+    from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select
+
+    primary, replica = primary_and_replica
+    source = Table("source", MetaData(), Column("id", Integer, primary_key=True), Column("name", String))
+
+    with database.RoutingSession(bind=primary, replica=replica) as db:
+        assert db.execute(select(source.c.name)).scalar() == "replica"
+        assert db.execute(select(source.c.name).with_for_update()).scalar() == "primary"
+    with database.RoutingSession(bind=primary, replica=replica) as db:
+        db.execute(insert(source).values(id=2, name="new"))
+        # Read-your-writes: after the INSERT, reads stay on the primary
+        assert db.execute(select(source.c.name).where(source.c.id == 2)).scalar() == "new"
+    with database.RoutingSession(bind=primary) as db:
+        assert db.execute(select(source.c.name)).scalar() == "primary"
+
+
+def test_reads_stay_on_primary_right_after_a_write(monkeypatch, primary_and_replica):
+    import asyncio
+
+    from app import cache
+
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    monkeypatch.setattr(database, "DATABASE_READ_URL", "sqlite:///replica.db")
+    monkeypatch.setattr(database, "DB_REPLICA_LAG_GRACE", 60)
+    monkeypatch.setattr(database, "_primary_until", 0.0)
+    now = [1000.0]
+    monkeypatch.setattr(database.time, "time", lambda: now[0])
+
+    assert asyncio.run(database.replica_lagging()) is False
+
+    # A commit that wrote through SessionLocal starts the grace period...
+    primary, _ = primary_and_replica
+    with database.SessionLocal(bind=primary) as db:
+        db.execute(text("SELECT 1"))
+        db.commit()
+    assert asyncio.run(database.replica_lagging()) is False
+    with database.SessionLocal(bind=primary) as db:
+        from sqlalchemy import Column, Integer, MetaData, String, Table, update
+
+        source = Table("source", MetaData(), Column("id", Integer, primary_key=True), Column("name", String))
+        db.execute(update(source).values(name="updated"))
+        db.commit()
+    assert asyncio.run(database.replica_lagging()) is True
+
+    # ...which ends DB_REPLICA_LAG_GRACE seconds later
+    now[0] += 61
+    assert asyncio.run(database.replica_lagging()) is False
+
+
+def test_async_sessions_use_the_replica_unless_it_lags(monkeypatch, tmp_path, primary_and_replica):
+    import asyncio
+
+    from sqlalchemy import column, select, table
+
+    from app import cache
+
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    monkeypatch.setattr(database, "DATABASE_READ_URL", "sqlite:///replica.db")
+    monkeypatch.setattr(database, "_primary_until", 0.0)
+    monkeypatch.setattr(database, "_primary_until_checked", database.time.time())
+
+    async def read_name():
+        dependency = database.get_async_db()
+        db = await dependency.__anext__()
+        try:
+            return (await db.execute(select(column("name")).select_from(table("source")))).scalar()
+        finally:
+            await dependency.aclose()
+
+    async def main():
+        primary = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+        replica = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+        monkeypatch.setattr(database, "async_engine", primary)
+        monkeypatch.setattr(database, "async_read_engine", replica)
+        database.AsyncSessionLocal.configure(bind=primary)
+        try:
+            assert await read_name() == "replica"
+            database.note_primary_write()
+            assert await read_name() == "primary"
+        finally:
+            await primary.dispose()
+            await replica.dispose()
+
+    asyncio.run(main())
+
+
+def test_sqlite_profile_is_applied_on_connect(tmp_path):
+    import asyncio
+
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'tuned.db'}", label="test")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == database.SQLITE_CACHE_SIZE
+    engine.dispose()
+
+    async def async_busy_timeout():
+        async_engine = database.make_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'tuned.db'}", label="test_async")
+        async with async_engine.connect() as connection:
+            value = (await connection.execute(text("PRAGMA busy_timeout"))).scalar()
+        await async_engine.dispose()
+        return value
+
+    assert asyncio.run(async_busy_timeout()) == database.SQLITE_BUSY_TIMEOUT
+
+
+def test_sqlite_profile_can_be_disabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "SQLITE_TUNING", False)
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'plain.db'}", label="test")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    engine.dispose()
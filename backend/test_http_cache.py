@@ -0,0 +1,100 @@
+"""
+Tests for conditional request handling in app/http_cache.py.
+
+Run with: pytest test_http_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import Request, Response
+
+from app import http_cache
+
+VERSION = {"version": "96:96:2025-01-01T03:00:00", "last_modified": "2025-01-01T03:00:00.123456"}
+
+
+def make_request(query="", **headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/plans/",
+        "query_string": query.encode(),
+        "headers": [(k.replace("_", "-").lower().encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+def test_first_request_gets_validators():
+    response = Response()
+    assert http_cache.check_conditional(make_request("zip_code=75001"), response, VERSION) is None
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["last-modified"] == "Wed, 01 Jan 2025 03:00:00 GMT"
+
+
+def test_matching_etag_returns_304_regardless_of_param_order():
+    response = Response()
+    http_cache.check_conditional(make_request("zip_code=75001&limit=10"), response, VERSION)
+    etag = response.headers["etag"]
+
+    revalidation = http_cache.check_conditional(
+        make_request("limit=10&zip_code=75001", if_none_match=f'W/"other", {etag}'), Response(), VERSION
+    )
+    assert revalidation.status_code == 304
+    assert revalidation.headers["etag"] == etag
+
+
+def test_new_version_or_other_query_changes_etag():
+    response = Response()
+    http_cache.check_conditional(make_request("zip_code=75001"), response, VERSION)
+    etag = response.headers["etag"]
+
+    newer = dict(VERSION, version="97:97:2025-01-02T03:00:00")
+    assert http_cache.check_conditional(make_request("zip_code=75001", if_none_match=etag), Response(), newer) is None
+    assert http_cache.check_conditional(make_request("zip_code=77002", if_none_match=etag), Response(), VERSION) is None
+
+
+def test_if_modified_since():
+    current = make_request(if_modified_since="Wed, 01 Jan 2025 03:00:00 GMT")
+    older = make_request(if_modified_since="Tue, 31 Dec 2024 03:00:00 GMT")
+
+    assert http_cache.check_conditional(current, Response(), VERSION).status_code == 304
+    assert http_cache.check_conditional(older, Response(), VERSION) is None
+
+
+def test_response_bodies_are_cached_per_version():
+    import json
+    from datetime import datetime
+
+    from app import cache, models, schemas
+
+    cache.clear_cache()
+    builds = []
+    plan = models.Plan(id=1, provider_id=1, plan_name="Saver 12", rate_1000_cents=13.5,
+                       last_updated=datetime(2025, 1, 1, 3, 0))
+
+    def build():
+        builds.append(1)
+        return http_cache.dump_json_list(schemas.Plan, [plan])
+
+    first = http_cache.cached_json_response(Response(), "plans", VERSION, {"limit": 1, "zip_code": None}, build)
+    second = http_cache.cached_json_response(Response(), "plans", VERSION, {"limit": 1}, build)
+    newer = dict(VERSION, version="97:97:2025-01-02T03:00:00")
+    http_cache.cached_json_response(Response(), "plans", newer, {"limit": 1}, build)
+
+    assert first.body == second.body
+    assert len(builds) == 2
+    expected = schemas.Plan.model_validate(plan).model_dump(mode="json")
+    assert json.loads(second.body) == [expected]
+
+
+def test_values_containing_separators_get_their_own_key_and_etag():
+    smuggled = {"provider": "TXU Energy&service_type=Residential"}
+    real = {"provider": "TXU Energy", "service_type": "Residential"}
+    assert http_cache._body_key("plans", VERSION, smuggled) != http_cache._body_key("plans", VERSION, real)
+
+    response = Response()
+    http_cache.check_conditional(make_request("provider=TXU+Energy&service_type=Residential"), response, VERSION)
+    etag = response.headers["etag"]
+    poisoned = make_request("provider=TXU+Energy%26service_type%3DResidential", if_none_match=etag)
+    assert http_cache.check_conditional(poisoned, Response(), VERSION) is None
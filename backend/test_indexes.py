@@ -0,0 +1,157 @@
+"""
+Tests for the plans indexes and their migration.
+
+The EXPLAIN checks run on SQLite; the same indexes serve Postgres.
+
+Run with: pytest test_indexes.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import crud, models
+from app.migrations import create_plan_indexes
+
+
+def _session(create_schema=True):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    if create_schema:
+        models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add_plans(db, count=200):
+    providers = [models.Provider(name=name) for name in ("Gexa Energy", "TXU Energy", "Reliant Energy", "Frontier Utilities")]
+    db.add_all(providers)
+    db.flush()
+    for i in range(count):
+        db.add(models.Plan(
+            provider_id=providers[i % len(providers)].id,
+            plan_name=f"Saver {i}",
+            plan_type="Fixed" if i % 3 else "Variable",
+            service_type="Commercial" if i % 4 == 0 else "Residential",
+            zip_code=f"75{i % 50:03d}",
+            contract_months=(12, 24, 36)[i % 3],
+            rate_1000_cents=10 + i % 17,
+        ))
+    db.commit()
+    db.execute(text("ANALYZE"))
+
+
+def _plan_for(db, **filters):
+    """EXPLAIN QUERY PLAN for the statement crud.get_plans issues."""
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, many: statements.append((statement, parameters))
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        crud.get_plans.__wrapped__(db, **filters)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    statement, parameters = statements[0]
+    rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return " | ".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"service_type": "Residential", "zip_code": "75001"}, "ix_plans_service_zip_rate"),
+    ({"service_type": "Commercial", "contract_months": 12}, "ix_plans_service_contract_rate"),
+    ({"service_type": "Residential", "zip_code": "75001", "plan_type": "Fixed"}, "ix_plans_service_zip_rate"),
+    ({}, "ix_plans_rate"),
+])
+def test_plan_filters_use_indexes(filters, index):
+    db = _session()
+    _add_plans(db)
+    plan = _plan_for(db, **filters)
+    assert f"INDEX {index}" in plan
+    assert "SCAN plans" not in plan.replace(f"SCAN plans USING INDEX {index}", "")
+
+
+@pytest.mark.parametrize("filters, search", [
+    ({}, "ix_plans_rate (rate_1000_cents>?)"),
+    ({"service_type": "Residential", "zip_code": "75001"},
+     "ix_plans_service_zip_rate (service_type=? AND zip_code=? AND rate_1000_cents>?)"),
+    ({"after": (None, 100)}, "ix_plans_rate (rate_1000_cents=? AND id>?)"),
+])
+def test_cursor_pages_seek_to_the_cursor(filters, search):
+    db = _session()
+    _add_plans(db)
+    assert f"SEARCH plans USING INDEX {search}" in _plan_for(db, **{"after": (15.0, 100), **filters})
+
+
+def test_upsert_lookup_uses_natural_key():
+    db = _session()
+    _add_plans(db)
+    plan = " | ".join(row[-1] for row in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM plans WHERE provider_id = 1 AND plan_name = 'Saver 8'"
+    )))
+    assert "USING COVERING INDEX uq_plans_provider_plan_name" in plan
+
+
+def test_natural_key_is_unique():
+    db = _session()
+    _add_plans(db, count=1)
+    db.add(models.Plan(provider_id=1, plan_name="Saver 0"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+
+
+def test_migration_adds_missing_indexes():
+    db = _session(create_schema=False)
+    # Schema as deployed before the indexes existed
+    models.Base.metadata.create_all(bind=db.get_bind(), tables=[models.Provider.__table__])
+    models.Plan.__table__.create(bind=db.get_bind())
+    for index in models.Plan.__table__.indexes:
+        db.execute(text(f"DROP INDEX {index.name}"))
+    # ix_plans_rate as first deployed, without the id tiebreaker
+    db.execute(text("CREATE INDEX ix_plans_rate ON plans (rate_1000_cents)"))
+    db.commit()
+
+    create_plan_indexes(db)
+    create_plan_indexes(db)  # idempotent
+
+    indexes = {index["name"]: index["column_names"] for index in inspect(db.get_bind()).get_indexes("plans")}
+    for index in models.Plan.__table__.indexes:
+        assert indexes[index.name] == [column.name for column in index.columns]
+    assert indexes["ix_plans_rate"] == ["rate_1000_cents", "id"]
+
+
+def test_history_queries_use_the_snapshot_indexes():
+    from datetime import date, datetime, timedelta
+
+    db = _session()
+    _add_plans(db, count=20)
+    start = datetime(2025, 1, 1, 3)
+    db.execute(models.PlanRateSnapshot.__table__.insert(), [
+        {"plan_id": 1 + i % 20, "observed_at": start + timedelta(hours=i), "rate_1000_cents": 10 + i % 7}
+        for i in range(2000)
+    ])
+    db.commit()
+    db.execute(text("ANALYZE"))
+
+    def explain(query):
+        compiled = query.compile(db.get_bind())
+        rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)).all()
+        return " | ".join(row[-1] for row in rows)
+
+    per_plan = explain(crud._plan_history_query(3, start, None, 1000))
+    assert "ix_plan_rate_snapshots_plan_observed" in per_plan and "TEMP B-TREE" not in per_plan
+    assert "SEARCH market_rate_days" in explain(crud._market_history_query(date(2025, 1, 5), date(2025, 1, 6)))
+
+    # Rebuilding a few days of the rollup reads only those days' snapshots
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, many: statements.append((statement, parameters))
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    crud.rebuild_market_days(db, date(2025, 1, 5), date(2025, 1, 6))
+    event.remove(db.get_bind(), "before_cursor_execute", listener)
+    statement, parameters = next((st, params) for st, params in statements if st.startswith("INSERT INTO market_rate_days"))
+    rebuild = " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    assert "ix_plan_rate_snapshots_observed" in rebuild
+    assert [day["snapshots"] for day in crud.get_market_history.__wrapped__(db, date(2025, 1, 5), date(2025, 1, 6))] == [24, 24]
+    db.close()
@@ -0,0 +1,266 @@
+"""
+Tests for plan ingestion helpers in app/crud.py.
+
+Run with: pytest test_ingest.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cache, crud, models, schemas
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.clear_cache()
+    crud._natural_key_checked.clear()
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Provider(id=1, name="Gexa Energy"))
+    session.commit()
+    yield session
+    session.close()
+    cache.clear_cache()
+
+
+def _plan(name, rate=12.5, **fields):
+    return schemas.PlanCreate(provider_id=1, plan_name=name, zip_code="75001", contract_months=12,
+                              rate_1000_cents=rate, **fields)
+
+
+def _count_statements(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_bulk_upsert_counts_and_round_trips(db):
+    assert crud.bulk_upsert_plans(db, [_plan(f"Saver {i}") for i in range(5)]) == {
+        "inserted": 5, "updated": 0, "unchanged": 0,
+    }
+
+    statements = _count_statements(db)
+    counts = crud.bulk_upsert_plans(db, [
+        _plan("Saver 0"),
+        _plan("Saver 1", rate=11.9),
+        _plan("Saver 5"),
+        _plan("Saver 5", rate=10.0),  # last one wins
+    ], chunk_size=2)
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 1}
+    # Per chunk: one SELECT and one INSERT ... ON CONFLICT
+    writes = [s for s in statements if s.startswith("INSERT INTO plans ")]
+    assert len(writes) == 2 and all("ON CONFLICT" in s for s in writes)
+
+    rates = dict(db.execute(select(models.Plan.plan_name, models.Plan.rate_1000_cents)).all())
+    assert rates["Saver 1"] == 11.9 and rates["Saver 5"] == 10.0
+    assert len(rates) == 6
+
+
+def test_unchanged_batches_do_not_write_or_invalidate(db):
+    crud.bulk_upsert_plans(db, [_plan("Saver 0"), _plan("Saver 1")])
+    generation = cache.get_generation("plans")
+
+    statements = _count_statements(db)
+    assert crud.bulk_upsert_plans(db, [_plan("Saver 0"), _plan("Saver 1")])["unchanged"] == 2
+    assert not [s for s in statements if s.startswith(("INSERT", "UPDATE"))]
+    assert cache.get_generation("plans") == generation
+
+
+def test_bulk_upsert_without_natural_key_index(db):
+    db.execute(text("DROP INDEX uq_plans_provider_plan_name"))
+    db.commit()
+
+    crud.bulk_upsert_plans(db, [_plan("Saver 0")])
+    counts = crud.bulk_upsert_plans(db, [_plan("Saver 0", rate=9.9), _plan("Saver 1")])
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 0}
+    assert db.execute(select(models.Plan.rate_1000_cents).where(models.Plan.plan_name == "Saver 0")).scalar() == 9.9
+
+
+def test_provider_resolver_canonicalizes_and_creates_in_bulk(db):
+    db.add(models.Provider(name="Reliant"))
+    db.commit()
+
+    statements = _count_statements(db)
+    resolver = crud.ProviderResolver(db)
+    ids = resolver.resolve(["TXU", "TXU Energy", "txu energy", "Reliant Energy", "Gexa", "Brand New Power"])
+
+    gexa, reliant = 1, 2
+    assert ids["Gexa"] == gexa
+    assert ids["Reliant Energy"] == reliant  # existing alias row is reused
+    assert ids["TXU"] == ids["TXU Energy"] == ids["txu energy"]
+    names = set(db.execute(select(models.Provider.name)).scalars())
+    assert names == {"Gexa Energy", "Reliant", "TXU Energy", "Brand New Power"}
+    assert db.execute(select(models.Provider.website).where(models.Provider.name == "TXU Energy")).scalar() == "https://www.txu.com"
+
+    # One preload, one INSERT for the new providers, one reload
+    assert len([s for s in statements if s.startswith("INSERT")]) == 1
+    statements.clear()
+    assert resolver.resolve(["TXU", "Gexa Energy"]) == {"TXU": ids["TXU"], "Gexa Energy": gexa}
+    assert statements == []
+
+
+def test_alias_providers_keep_their_plans_until_merged(db):
+    from datetime import datetime
+
+    from app.migrations import merge_alias_providers
+
+    # "TXU" plans predate the canonical "TXU Energy" row
+    db.add_all([models.Provider(id=2, name="TXU"), models.Provider(id=3, name="TXU Energy")])
+    db.add_all([
+        models.Plan(id=10, provider_id=2, plan_name="Saver 12", rate_1000_cents=13.0, last_updated=datetime(2025, 3, 2)),
+        models.Plan(id=11, provider_id=2, plan_name="Flex", rate_1000_cents=15.0, last_updated=datetime(2025, 3, 2)),
+        models.Plan(id=12, provider_id=3, plan_name="Saver 12", rate_1000_cents=12.0, last_updated=datetime(2025, 3, 1)),
+    ])
+    db.add(models.PlanRateSnapshot(plan_id=12, observed_at=datetime(2025, 3, 1), rate_1000_cents=12.0))
+    db.commit()
+
+    assert crud.ProviderResolver(db).resolve(["TXU", "TXU Energy"]) == {"TXU": 2, "TXU Energy": 3}
+
+    assert merge_alias_providers(db) == 1
+    assert merge_alias_providers(db) == 0
+    plans = db.execute(select(models.Plan.plan_name, models.Plan.provider_id, models.Plan.rate_1000_cents)).all()
+    assert sorted(plans) == [("Flex", 3, 15.0), ("Saver 12", 3, 13.0)]  # the newer duplicate wins
+    assert db.execute(select(models.PlanRateSnapshot.plan_id)).scalars().all() == [10]
+    assert crud.ProviderResolver(db).resolve(["TXU"]) == {"TXU": 3}
+
+
+def test_market_rollup_follows_ingest_and_backfill(db):
+    from app.migrations import backfill_market_days
+
+    crud.bulk_upsert_plans(db, [_plan("Saver 0", rate=12.0), _plan("Saver 1", rate=14.0)])
+    crud.bulk_upsert_plans(db, [_plan("Saver 0", rate=11.0), _plan("Saver 1", rate=14.0)])
+    # The rollup is keyed by the UTC day of observed_at
+    day = db.execute(select(models.MarketRateDay)).scalar_one()
+    assert (day.snapshots, day.rated_snapshots, day.rate_1000_cents_sum) == (3, 3, 37.0)
+    assert (day.min_rate_1000_cents, day.max_rate_1000_cents) == (11.0, 14.0)
+
+    # A rebuild from the snapshots gives the same rollup
+    ingested = crud.get_market_history.__wrapped__(db, day.day, day.day)
+    db.execute(models.MarketRateDay.__table__.delete())
+    db.commit()
+    assert backfill_market_days(db) is True
+    assert backfill_market_days(db) is False
+    assert crud.get_market_history.__wrapped__(db, day.day, day.day) == ingested
+    assert ingested[0]["avg_rate_1000_cents"] == round(37.0 / 3, 4)
+
+
+def _history(db):
+    return db.execute(
+        select(models.Plan.plan_name, models.PlanRateSnapshot.rate_1000_cents)
+        .join(models.Plan, models.Plan.id == models.PlanRateSnapshot.plan_id)
+        .order_by(models.PlanRateSnapshot.id)
+    ).all()
+
+
+def test_snapshots_are_written_only_when_prices_change(db):
+    crud.bulk_upsert_plans(db, [_plan("Saver 0"), _plan("Saver 1")])
+    assert _history(db) == [("Saver 0", 12.5), ("Saver 1", 12.5)]
+
+    crud.bulk_upsert_plans(db, [
+        _plan("Saver 0", rate=11.0),  # price change
+        _plan("Saver 1", plan_url="https://example.com/saver-1"),  # not a price field
+        _plan("Saver 2", early_termination_fee=150.0),  # new plan
+    ])
+    assert _history(db)[2:] == [("Saver 0", 11.0), ("Saver 2", 12.5)]
+
+    # Unchanged batches add nothing
+    crud.bulk_upsert_plans(db, [_plan("Saver 0", rate=11.0)])
+    assert len(_history(db)) == 4
+
+
+def test_single_plan_writes_record_snapshots_too(db):
+    crud.create_or_update_plan(db, 1, _plan("Saver 0"))
+    crud.create_or_update_plan(db, 1, _plan("Saver 0", renewable_percent=100))
+    crud.create_or_update_plan(db, 1, _plan("Saver 0", rate=9.5, renewable_percent=100))
+    assert _history(db) == [("Saver 0", 12.5), ("Saver 0", 9.5)]
+
+
+def test_single_plan_insert_writes_every_hashed_field(db):
+    plan = _plan("Saver 0", plan_url="https://example.com/saver-0")
+    assert crud.create_or_update_plan(db, 1, plan).plan_url == "https://example.com/saver-0"
+    assert crud.bulk_upsert_plans(db, [plan])["unchanged"] == 1
+    assert db.execute(select(models.Plan.plan_url)).scalar() == "https://example.com/saver-0"
+
+
+def test_content_hash_ignores_float_noise_and_whitespace():
+    row = _plan("Saver 0", rate=12.5, special_features="Free nights").model_dump()
+    assert crud.plan_content_hash(row) == crud.plan_content_hash(
+        {**row, "rate_1000_cents": 12.500000001, "special_features": " Free nights "}
+    )
+    assert crud.plan_content_hash({**row, "special_features": ""}) == crud.plan_content_hash(
+        {**row, "special_features": None}
+    )
+    assert crud.plan_content_hash(row) != crud.plan_content_hash({**row, "rate_1000_cents": 12.4})
+
+
+def test_matching_hashes_skip_the_write(db):
+    crud.bulk_upsert_plans(db, [_plan("Saver 0"), _plan("Saver 1")])
+    stored = dict(db.execute(select(models.Plan.plan_name, models.Plan.content_hash)).all())
+    assert stored["Saver 0"] == crud.plan_content_hash(_plan("Saver 0").model_dump())
+
+    statements = _count_statements(db)
+    counts = crud.bulk_upsert_plans(db, [_plan("Saver 0", special_features=" "), _plan("Saver 1", rate=12.0)])
+    assert counts == {"inserted": 0, "updated": 1, "unchanged": 1}
+    # The SELECT reads hashes and prices, not every plan column
+    assert "special_features" not in statements[0]
+
+    statements.clear()
+    plan = crud.create_or_update_plan(db, 1, _plan("Saver 1", rate=12.0))
+    assert plan.rate_1000_cents == 12.0
+    assert not [s for s in statements if s.startswith(("INSERT", "UPDATE"))]
+
+
+def test_migration_backfills_missing_hashes(db):
+    from datetime import datetime
+
+    from app.migrations import backfill_plan_hashes
+
+    last_updated = datetime(2025, 1, 1, 3)
+    db.add(models.Plan(provider_id=1, plan_name="Saver 0", zip_code="75001", contract_months=12,
+                       rate_1000_cents=12.5, service_type="Residential", last_updated=last_updated))
+    db.commit()
+
+    assert backfill_plan_hashes(db) == 1
+    assert backfill_plan_hashes(db) == 0
+    plan = db.execute(select(models.Plan)).scalar_one()
+    assert plan.content_hash == crud.plan_content_hash(_plan("Saver 0").model_dump())
+    assert plan.last_updated == last_updated
+    # The next ingest of the same data is a no-op
+    assert crud.bulk_upsert_plans(db, [_plan("Saver 0")])["unchanged"] == 1
+
+
+def test_startup_adds_content_hash_to_existing_plans_table():
+    from app.migrations import ensure_plan_columns
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE plans DROP COLUMN content_hash"))
+        conn.execute(text("INSERT INTO plans (provider_id, plan_name, last_updated) VALUES (1, 'Saver 0', CURRENT_TIMESTAMP)"))
+
+    ensure_plan_columns(engine)
+    ensure_plan_columns(engine)
+    with sessionmaker(bind=engine)() as session:
+        assert session.execute(select(models.Plan)).scalar_one().content_hash is None
+
+
+def test_scheduler_job_returns_changed_and_unchanged_counts(db, monkeypatch):
+    from app import scheduler
+
+    scraped = [{"provider_name": "Gexa Energy", "plan_name": "Saver 0", "rate_1000_cents": 12.5}]
+    monkeypatch.setattr(scheduler, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(scheduler.scraper, "scrape_all", lambda: [dict(plan) for plan in scraped])
+    monkeypatch.setattr(scheduler.energybot_scraper_v2, "scrape_energybot_all_texas_v2", lambda: [])
+    monkeypatch.setattr(scheduler, "warm_plan_caches", lambda db: None)
+
+    assert scheduler.scrape_real_data_job() == {"changed": 1, "inserted": 1, "updated": 0, "unchanged": 0}
+    assert scheduler.scrape_real_data_job() == {"changed": 0, "inserted": 0, "updated": 0, "unchanged": 1}
@@ -0,0 +1,224 @@
+"""
+Tests for the /plans/ and /plans/providers listings: keyset pagination and
+provider loading.
+
+Run with: pytest test_plans_api.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, models, pagination
+from app.api import admin, plans
+from app.database import async_database_url, get_async_db, get_db
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    # A file, so the sync and async engines see the same data
+    return f"sqlite:///{tmp_path / 'plans.db'}"
+
+
+@pytest.fixture
+def Session(monkeypatch, database_url):
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.clear_cache()
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    db.add_all(models.Provider(id=i, name=f"Provider {i}") for i in range(1, 6))
+    for i in range(1, 24):
+        # Repeated rates and some missing ones exercise the id tiebreak and NULLS LAST
+        rate = None if i % 7 == 0 else 10 + i % 4
+        db.add(models.Plan(id=i, provider_id=1 + i % 5, plan_name=f"Plan {i}", rate_1000_cents=rate))
+    db.commit()
+    db.close()
+    yield Session
+    cache.clear_cache()
+    engine.dispose()
+
+
+@pytest.fixture
+def client(Session, database_url):
+    app = FastAPI()
+    app.include_router(plans.router)
+    app.include_router(admin.router)
+    async_engine = create_async_engine(async_database_url(database_url))
+    AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    def override_get_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def override_get_async_db():
+        async with AsyncSession() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _walk(client, path, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(path, params=params)
+        assert response.status_code == 200
+        pages.append([row["id"] for row in response.json()])
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return pages
+
+
+def test_plan_cursor_pages_match_offset_order(client):
+    everything = [row["id"] for row in client.get("/plans/", params={"limit": 100}).json()]
+    pages = _walk(client, "/plans/", limit=5)
+
+    assert [plan_id for page in pages for plan_id in page] == everything
+    assert len(everything) == 23 and all(len(page) == 5 for page in pages[:-1])
+    # Plans without a rate come last
+    assert everything[-3:] == [7, 14, 21]
+
+
+def test_cursor_pages_are_stable_while_plans_are_added(client, Session):
+    first = client.get("/plans/", params={"limit": 5})
+    cursor = first.headers[pagination.NEXT_CURSOR_HEADER]
+    second = client.get("/plans/", params={"limit": 5, "cursor": cursor}).json()
+
+    # A new cheapest plan shifts offset pages but not cursor pages
+    with Session() as db:
+        db.add(models.Plan(id=100, provider_id=1, plan_name="Cheapest", rate_1000_cents=1.0))
+        db.commit()
+    cache.bump_generation("plans")
+
+    assert client.get("/plans/", params={"limit": 5, "cursor": cursor}).json() == second
+    assert client.get("/plans/", params={"limit": 5, "skip": 5}).json() != second
+
+
+def test_provider_cursor_pages(client):
+    assert _walk(client, "/plans/providers", limit=2) == [[1, 2], [3, 4], [5]]
+
+
+def test_empty_provider_pages(client):
+    for include_plans in ("true", "false"):
+        response = client.get("/plans/providers", params={"limit": 0, "include_plans": include_plans})
+        assert response.status_code == 200
+        assert response.json() == []
+        assert pagination.NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/plans/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/plans/", params={"cursor": pagination.encode_cursor(1)}).status_code == 400
+
+
+def test_wildcard_if_none_match_needs_an_existing_plan(client):
+    for path in ("/plans/1", "/plans/1/history"):
+        assert client.get(path, headers={"If-None-Match": "*"}).status_code == 304
+    for path in ("/plans/999", "/plans/999/history"):
+        assert client.get(path, headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_providers_load_plans_without_n_plus_one(client, Session):
+    from app import crud
+
+    with Session() as db:
+        statements = []
+        event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        providers = crud.get_providers.__wrapped__(db)
+        assert sum(len(provider.plans) for provider in providers) == 23
+        assert len(statements) == 2  # providers + one SELECT ... IN for their plans
+
+        statements.clear()
+        summaries = crud.get_provider_summaries.__wrapped__(db)
+        assert len(statements) == 1
+        assert [summary["plan_count"] for summary in summaries] == [4, 5, 5, 5, 4]
+
+
+def test_providers_without_plans(client, Session):
+    from app import crud, schemas
+
+    full = client.get("/plans/providers").json()
+    with Session() as db:
+        assert full == [
+            schemas.Provider.model_validate(provider).model_dump(mode="json")
+            for provider in crud.get_providers.__wrapped__(db)
+        ]
+    light = client.get("/plans/providers", params={"include_plans": "false", "limit": 2})
+
+    assert light.json() == [
+        {"name": provider["name"], "website": None, "id": provider["id"], "plan_count": len(provider["plans"])}
+        for provider in full[:2]
+    ]
+    assert light.headers[pagination.NEXT_CURSOR_HEADER]
+
+
+def test_plan_and_market_history(client, Session):
+    from datetime import datetime
+
+    from app import crud
+
+    def snapshot(plan_id, observed_at, rate):
+        return {"plan_id": plan_id, "observed_at": observed_at, "rate_1000_cents": rate}
+
+    with Session() as db:
+        # Two ingest runs; the second adds to the 2025-03-02 rollup row
+        crud._add_snapshots(db, [snapshot(1, datetime(2025, 3, 1, 3), 12.0), snapshot(1, datetime(2025, 3, 2, 3), 11.0)])
+        crud._add_snapshots(db, [snapshot(2, datetime(2025, 3, 2, 4), 14.0), snapshot(2, datetime(2025, 4, 1, 3), 13.0)])
+        db.commit()
+
+    history = client.get("/plans/1/history").json()
+    assert [(row["observed_at"], row["rate_1000_cents"]) for row in history] == [
+        ("2025-03-01T03:00:00", 12.0), ("2025-03-02T03:00:00", 11.0),
+    ]
+    since = client.get("/plans/1/history", params={"start": "2025-03-02T00:00:00"}).json()
+    assert [row["rate_1000_cents"] for row in since] == [11.0]
+    assert client.get("/plans/999/history").status_code == 404
+
+    market = client.get("/plans/history", params={"start": "2025-03-01", "end": "2025-03-31"}).json()
+    assert market == [
+        {"day": "2025-03-01", "snapshots": 1, "avg_rate_1000_cents": 12.0,
+         "min_rate_1000_cents": 12.0, "max_rate_1000_cents": 12.0},
+        {"day": "2025-03-02", "snapshots": 2, "avg_rate_1000_cents": 12.5,
+         "min_rate_1000_cents": 11.0, "max_rate_1000_cents": 14.0},
+    ]
+    assert client.get("/plans/history", params={"start": "2025-03-02", "end": "2025-03-01"}).status_code == 400
+    assert client.get("/plans/history", params={"start": "2020-01-01", "end": "2025-01-01"}).status_code == 400
+
+
+def test_deleting_plans_deletes_their_history(client, Session):
+    from datetime import datetime
+
+    from app import crud
+
+    with Session() as db:
+        crud._add_snapshots(db, [
+            {"plan_id": plan_id, "observed_at": datetime(2025, 3, 1, 3), "rate_1000_cents": 12.0}
+            for plan_id in (1, 2)
+        ])
+        db.commit()
+
+    assert client.post("/admin/delete-all-plans").json()["deleted_count"] == 23
+    with Session() as db:
+        assert db.query(models.PlanRateSnapshot).count() == 0
+        # SQLite hands the deleted ids out again
+        db.add(models.Plan(id=1, provider_id=1, plan_name="New Plan", rate_1000_cents=9.0))
+        db.commit()
+    assert client.get("/plans/1/history").json() == []
+    assert client.get("/plans/history", params={"start": "2025-03-01", "end": "2025-03-31"}).json() == []
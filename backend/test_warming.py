@@ -0,0 +1,80 @@
+"""
+Tests for post-ingest cache warming in app/warming.py.
+
+Run with: pytest test_warming.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cache, crud, models, schemas, warming
+from app.api.plans import render_plans
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.clear_cache()
+    warming.plan_query_tracker.clear()
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    cache.clear_cache()
+
+
+def add_plan(db, zip_code, rate):
+    provider = crud.get_provider_by_name(db, "Gexa Energy") or crud.create_provider(
+        db, schemas.ProviderCreate(name="Gexa Energy")
+    )
+    crud.create_or_update_plan(db, provider.id, schemas.PlanCreate(
+        provider_id=provider.id, plan_name=f"Saver {zip_code}", zip_code=zip_code, rate_1000_cents=rate,
+    ))
+
+
+def test_tracker_ranks_queries_in_window(monkeypatch):
+    now = [10_000.0]
+    monkeypatch.setattr(warming.time, "time", lambda: now[0])
+    tracker = warming.QueryTracker(warming.PLAN_QUERY_FIELDS, window=7200, bucket=3600)
+
+    tracker.record(zip_code="75001")
+    now[0] += 3600
+    for _ in range(3):
+        tracker.record(zip_code="77002", service_type="Residential")
+    tracker.record(zip_code="75001")
+    assert [q["zip_code"] for q in tracker.top(2)] == ["77002", "75001"]
+
+    now[0] += 7200  # first two buckets leave the window
+    tracker.record(zip_code="78701")
+    assert [q["zip_code"] for q in tracker.top(5)] == ["78701"]
+
+
+def test_warmed_entries_go_live_with_the_generation_bump(db, monkeypatch):
+    add_plan(db, "75001", 13.5)
+    warming.plan_query_tracker.record(zip_code="75001")
+    render_plans(db, crud.get_plans_version(db), zip_code="75001")
+
+    with cache.batch_invalidation():
+        add_plan(db, "75001", 11.9)
+        warming.warm_plan_caches(db)
+
+        # Still the old generation: readers see the previous rate
+        current = json.loads(render_plans(db, crud.get_plans_version(db), zip_code="75001"))
+        assert current[0]["rate_1000_cents"] == 13.5
+
+    def fail(*args, **kwargs):
+        raise AssertionError("plans query ran after warming")
+
+    monkeypatch.setattr(crud, "get_plans", fail)
+    body = render_plans(db, crud.get_plans_version(db), zip_code="75001")
+    assert json.loads(body)[0]["rate_1000_cents"] == 11.9
+    render_plans(db, crud.get_plans_version(db))  # unfiltered listing is always warmed